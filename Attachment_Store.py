@@ -0,0 +1,230 @@
+"""Content-addressed storage for files attached to notes.
+
+Each file is stored once, named by the SHA-256 of its bytes:
+
+    Data/attachments/objects/3f/3fa9c1...
+
+so the same image attached to ten notes, or twice to one, takes the space
+of one copy. The database records what each blob is (Attachments) and
+which note holds which blob at which position (NoteAttachments); a blob
+is removed once no note refers to it, together with any thumbnails of it
+under Data/attachments/thumbnails/<size>/.
+
+Blobs are read through mmap, so a large file is paged in by the OS as it
+is read and shared between readers instead of being copied into a Python
+bytes object.
+"""
+import hashlib
+import io
+import logging
+import mimetypes
+import mmap
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+ATTACHMENTS_DIR = "Data/attachments"
+# Files are copied and hashed in chunks of this many bytes
+CHUNK_SIZE = 1024 * 1024
+
+log = logging.getLogger(__name__)
+
+
+class Attachment_Store:
+    """Blob files under `root`, plus the Attachments/NoteAttachments tables that reference them."""
+
+    def __init__(self, root=ATTACHMENTS_DIR):
+        self.root = root
+        self.objects = os.path.join(root, "objects")
+        # Thumbnail_Cache keeps one directory per thumbnail size in here
+        self.thumbnails = os.path.join(root, "thumbnails")
+
+    def create_tables(self, cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS Attachments (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mime TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS NoteAttachments (
+                note_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                name TEXT NOT NULL,
+                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (note_id, position),
+                FOREIGN KEY (note_id) REFERENCES Notes(id),
+                FOREIGN KEY (sha256) REFERENCES Attachments(sha256)
+            ) WITHOUT ROWID
+        ''')
+        # Finding whether anything still refers to a blob
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_note_attachments_sha256 ON NoteAttachments (sha256)')
+
+    def path(self, sha256):
+        return os.path.join(self.objects, sha256[:2], sha256)
+
+    def exists(self, sha256):
+        return os.path.exists(self.path(sha256))
+
+    def put_file(self, source):
+        """Store the file at `source`; returns (sha256, size). Content already stored is not written again."""
+        with open(source, 'rb') as f:
+            return self._put(f)
+
+    def put_bytes(self, data):
+        """Store `data`; returns (sha256, size)."""
+        return self._put(io.BytesIO(data))
+
+    def _put(self, f):
+        # Hash and copy in one pass; the copy is dropped if the blob exists already
+        os.makedirs(self.objects, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.objects, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            digest = hasher.hexdigest()
+            target = self.path(digest)
+            if os.path.exists(target):
+                os.unlink(temp_path)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(temp_path, target)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+        return digest, size
+
+    @contextmanager
+    def open(self, sha256):
+        """Map a blob read-only. The mmap supports slicing, read() and seek(), so it can go straight to PIL."""
+        with open(self.path(sha256), 'rb') as f:
+            # Zero-length files can't be mapped
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b""
+                return
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield mapped
+            finally:
+                mapped.close()
+
+    def verify(self, sha256):
+        """Re-hash a blob; False if it is missing or no longer matches its name."""
+        try:
+            with self.open(sha256) as data:
+                return hashlib.sha256(data).hexdigest() == sha256
+        except OSError:
+            return False
+
+    def copy_to(self, sha256, destination):
+        """Write a blob back out as a normal file, e.g. for "Save As"."""
+        shutil.copyfile(self.path(sha256), destination)
+
+    def attach(self, cursor, note_id, sha256, size, name):
+        """Record a stored blob as the note's next attachment; returns its position."""
+        cursor.execute('INSERT OR IGNORE INTO Attachments (sha256, size, mime) VALUES (?, ?, ?)',
+                       (sha256, size, mimetypes.guess_type(name)[0]))
+        position = cursor.execute('SELECT COALESCE(MAX(position), -1) + 1 FROM NoteAttachments WHERE note_id = ?',
+                                  (note_id,)).fetchone()[0]
+        cursor.execute('INSERT INTO NoteAttachments (note_id, position, sha256, name) VALUES (?, ?, ?, ?)',
+                       (note_id, position, sha256, name))
+        return position
+
+    def note_attachments(self, cursor, note_id):
+        cursor.execute('''
+            SELECT n.position, n.sha256, n.name, a.size, a.mime, n.added_at
+            FROM NoteAttachments n JOIN Attachments a ON a.sha256 = n.sha256
+            WHERE n.note_id = ?
+            ORDER BY n.position
+        ''', (note_id,))
+        return [{'position': row[0], 'sha256': row[1], 'name': row[2], 'size': row[3],
+                 'mime': row[4], 'added_at': row[5]} for row in cursor.fetchall()]
+
+    def detach(self, cursor, note_id, position=None):
+        """Drop one attachment of a note, or all of them; returns the hashes that were dropped."""
+        if position is None:
+            rows = cursor.execute('SELECT sha256 FROM NoteAttachments WHERE note_id = ?', (note_id,)).fetchall()
+            cursor.execute('DELETE FROM NoteAttachments WHERE note_id = ?', (note_id,))
+        else:
+            rows = cursor.execute('SELECT sha256 FROM NoteAttachments WHERE note_id = ? AND position = ?',
+                                  (note_id, position)).fetchall()
+            cursor.execute('DELETE FROM NoteAttachments WHERE note_id = ? AND position = ?', (note_id, position))
+        return [row[0] for row in rows]
+
+    def release(self, cursor, hashes=None):
+        """Forget blobs nothing refers to any more, out of `hashes` or out of all of them.
+
+        Returns their hashes; call remove() with them once the transaction
+        has committed, so a rollback never leaves a row without its file.
+        """
+        if hashes is None:
+            hashes = [row[0] for row in cursor.execute('SELECT sha256 FROM Attachments')]
+        unreferenced = []
+        for sha256 in set(hashes):
+            if cursor.execute('SELECT 1 FROM NoteAttachments WHERE sha256 = ? LIMIT 1', (sha256,)).fetchone() is None:
+                cursor.execute('DELETE FROM Attachments WHERE sha256 = ?', (sha256,))
+                unreferenced.append(sha256)
+        return unreferenced
+
+    def remove(self, hashes):
+        """Delete the files of released blobs and their cached thumbnails."""
+        sizes = self._thumbnail_sizes()
+        for sha256 in hashes:
+            try:
+                os.unlink(self.path(sha256))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # e.g. Windows, while a reader still has it mapped; the
+                # content is still correct for its name if it is attached again
+                log.warning("Could not remove attachment %s: %s", sha256, e)
+                continue
+            for size in sizes:
+                self._unlink(os.path.join(size, sha256[:2], sha256 + ".png"))
+
+    def sweep_thumbnails(self):
+        """Delete cached thumbnails whose blob is gone, e.g. one made while the blob was being removed.
+
+        Returns how many were deleted.
+        """
+        removed = 0
+        for size in self._thumbnail_sizes():
+            for shard in os.scandir(size):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    sha256, extension = os.path.splitext(entry.name)
+                    if extension == ".png" and not self.exists(sha256) and self._unlink(entry.path):
+                        removed += 1
+        return removed
+
+    def _thumbnail_sizes(self):
+        try:
+            return [entry.path for entry in os.scandir(self.thumbnails) if entry.is_dir()]
+        except FileNotFoundError:
+            return []
+
+    def _unlink(self, path):
+        try:
+            os.unlink(path)
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            log.warning("Could not remove thumbnail %s: %s", path, e)
+            return False
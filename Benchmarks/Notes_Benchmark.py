@@ -0,0 +1,401 @@
+"""Notes_Handler storage benchmarks on synthetic corpora, plus a Tk harness for the note UI.
+
+Run from the repository root:
+
+    python -m Benchmarks.Notes_Benchmark --sizes 1000 10000 100000 --output notes_bench.json
+    python -m Benchmarks.Notes_Benchmark --sizes 1000000 --corpus-dir /tmp/corpora
+    python -m Benchmarks.Notes_Benchmark --baseline notes_bench.json     exits 1 on a regression
+
+Corpora are generated with Note_Transfer.import_notes: log-normal body
+lengths (median about 550 characters, a long tail up to 200 KB),
+bold/italic/underline spans on most notes, and timestamps spread over
+three years. --corpus-dir keeps them between runs, which matters from
+1M notes up.
+
+Each size is measured in a child process, so peak RSS belongs to that
+size alone. "Cold" opens first drop the database from the OS page cache
+with posix_fadvise where available; "warm" opens follow straight after.
+The child works on a scratch copy of the corpus that is deleted
+afterwards. The timed writes add notes, revisions, change log rows and
+tombstones; made to a kept corpus, they would make every run start from
+a bigger database than the last.
+
+The UI harness times NoteifyUI.load_notes (first page shown),
+on_note_select (first chunk of the note in the editor) and save_note
+(queued, written and acknowledged). It is skipped when there is no display.
+
+With --baseline, every *_ms, *_seconds and *_bytes figure is compared
+with the same size in an earlier report. Figures more than --tolerance
+worse are listed as regressions.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_OPS = 200
+DEFAULT_TOLERANCE = 0.25
+EPOCH = datetime(2023, 1, 1)
+
+WORDS = ("the", "note", "meeting", "project", "idea", "list", "draft", "remember", "call", "plan",
+         "review", "budget", "design", "follow", "up", "with", "team", "about", "next", "week",
+         "and", "to", "of", "for", "a", "in", "on", "is", "it", "this", "that", "todo", "done")
+STYLES = ("bold", "italic", "underline")
+COMPARED_SUFFIXES = ("_ms", "_seconds", "_bytes")
+
+
+def synthetic_notes(count, seed=0):
+    """Yield Note_Transfer records with realistic body sizes, formatting and timestamps."""
+    rng = random.Random(seed)
+    for i in range(count):
+        length = int(min(max(rng.lognormvariate(6.3, 1.2), 20), 200000))
+        words = rng.choices(WORDS, k=max(length // 5, 1))
+        # Paragraph breaks every few dozen words
+        for position in range(rng.randrange(20, 60), len(words), rng.randrange(20, 60)):
+            words[position] += "\n"
+        content = " ".join(words)
+        title = " ".join(rng.choices(WORDS, k=rng.randrange(2, 8))).capitalize()
+
+        created = EPOCH + timedelta(seconds=rng.randrange(3 * 365 * 86400))
+        updated = created + timedelta(seconds=int(rng.expovariate(1 / 86400)))
+        record = {
+            "title": f"{title} {i}",
+            "content": content,
+            "created_at": created.strftime("%Y-%m-%d %H:%M:%S"),
+            "updated_at": updated.strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+        if rng.random() < 0.6:
+            spans = {}
+            for _ in range(min(len(content) // 400 + 1, 200)):
+                start = rng.randrange(len(content))
+                spans.setdefault(rng.choice(STYLES), []).append([start, min(start + rng.randrange(3, 40), len(content))])
+            record["formatting"] = spans
+        yield record
+
+
+def ensure_corpus(directory, count, seed):
+    """Create (or reuse) a database of `count` synthetic notes; returns (path, generation stats)."""
+    from Notes_Handler import Notes_Handler
+    from Note_Transfer import import_notes
+
+    path = os.path.join(directory, f"notes_{count}_s{seed}.db")
+    if os.path.exists(path):
+        return path, {"generate_seconds": None, "reused_corpus": True}
+
+    notes_handler = Notes_Handler(path)
+    start = time.perf_counter()
+    import_notes(notes_handler, synthetic_notes(count, seed))
+    elapsed = time.perf_counter() - start
+    notes_handler.close()
+    return path, {"generate_seconds": elapsed, "notes_per_second": count / elapsed, "reused_corpus": False}
+
+
+def percentiles(samples, prefix):
+    """p50/p99/max of `samples` (seconds) as {prefix}_p50_ms etc."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] * 1000
+
+    return {f"{prefix}_p50_ms": pick(0.5), f"{prefix}_p99_ms": pick(0.99), f"{prefix}_max_ms": ordered[-1] * 1000}
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def evict_from_page_cache(path):
+    """Ask the OS to drop a database's cached pages; returns False where that isn't supported."""
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    for file_path in (path, path + "-wal"):
+        if os.path.exists(file_path):
+            fd = os.open(file_path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+    return True
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def bench_open(path, note_ids, rng):
+    """Time opening the database and showing something: the first page and one note."""
+    from Notes_Handler import Notes_Handler
+
+    result = {"cold_cache_evicted": evict_from_page_cache(path)}
+    for phase in ("cold", "warm"):
+        start = time.perf_counter()
+        notes_handler = Notes_Handler(path)
+        opened = time.perf_counter()
+        notes_handler.fetch_notes_page()
+        notes_handler.get_note_by_id(rng.choice(note_ids))
+        result[f"open_{phase}_seconds"] = opened - start
+        result[f"open_{phase}_first_note_seconds"] = time.perf_counter() - start
+        notes_handler.close()
+    return result
+
+
+def bench_operations(notes_handler, note_ids, ops, rng):
+    result = {}
+
+    elapsed, notes = timed(notes_handler.fetch_notes)
+    result["fetch_notes_seconds"] = elapsed
+    elapsed, _ = timed(notes_handler.fetch_notes_page)
+    result["fetch_notes_page_ms"] = elapsed * 1000
+
+    # Distinct ids so every read misses the cache, then the same ids again as hits
+    sample = rng.sample(note_ids, min(ops, len(note_ids)))
+    notes_handler.cache.clear()
+    result.update(percentiles([timed(notes_handler.get_note_by_id, note_id)[0] for note_id in sample],
+                              "get_note_by_id_uncached"))
+    cached = sample[:min(len(sample), 32)]
+    result.update(percentiles([timed(notes_handler.get_note_by_id, note_id)[0] for note_id in cached * 4],
+                              "get_note_by_id_cached"))
+
+    new_notes = list(synthetic_notes(ops, seed=rng.randrange(1 << 30)))
+    saves, saved_ids = [], []
+    for record in new_notes:
+        tags = [{"tag_name": name, "start": start, "end": end}
+                for name, spans in record.get("formatting", {}).items() for start, end in spans]
+        elapsed, note_id = timed(notes_handler.save_note, record["title"], record["content"], _tk_tags(record["content"], tags))
+        saves.append(elapsed)
+        saved_ids.append(note_id)
+    result.update(percentiles(saves, "save_note"))
+
+    updates = []
+    for note_id in sample:
+        note, tags = notes_handler.get_note_by_id(note_id)
+        edited = note["content"] + " edited"
+        updates.append(timed(notes_handler.update_note, note_id, note["title"], edited, tags)[0])
+    result.update(percentiles(updates, "update_note"))
+
+    result.update(percentiles([timed(notes_handler.delete_note, note_id)[0] for note_id in saved_ids],
+                              "delete_note"))
+    return result
+
+
+def _tk_tags(content, tags):
+    # save_note takes Tk-style tags, as the editor produces them
+    import Span_Codec
+    starts = Span_Codec.line_starts(content)
+    for tag in tags:
+        tag["start_index"] = Span_Codec.offset_to_index(starts, tag["start"])
+        tag["end_index"] = Span_Codec.offset_to_index(starts, tag["end"])
+    return tags
+
+
+def bench_ui(path, note_ids, ops, rng):
+    """Time the note list, note selection and saving through a real NoteifyUI; None without a display."""
+    import tkinter as tk
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"Skipping UI benchmark, no display available: {e}", file=sys.stderr)
+        return None
+
+    from Notes_Handler import Notes_Handler
+    from UI import NoteifyUI
+
+    class No_Reminders:
+        scheduler = None
+
+        def create_reminder(self, reminder):
+            pass
+
+    notes_handler = Notes_Handler(path)
+    app = NoteifyUI(root, No_Reminders(), notes_handler)
+    root.update()
+
+    def pump_until(condition, timeout=30.0):
+        deadline = time.perf_counter() + timeout
+        while not condition() and time.perf_counter() < deadline:
+            root.update()
+            time.sleep(0.0005)
+
+    loads = []
+    for _ in range(5):
+        start = time.perf_counter()
+        app.load_notes()
+        pump_until(lambda: len(app.tree.get_children()) > 1 or app.notes_exhausted)
+        loads.append(time.perf_counter() - start)
+    result = percentiles(loads, "ui_load_notes")
+
+    listed = [item for item in app.tree.get_children() if item != "new"]
+    selects = []
+    for item in rng.sample(listed, min(len(listed), max(ops // 10, 1))):
+        app.text_area.delete("1.0", "end")
+        start = time.perf_counter()
+        app.tree.selection_set(item)
+        pump_until(lambda: app.text_area.compare("end-1c", "!=", "1.0"))
+        selects.append(time.perf_counter() - start)
+    result.update(percentiles(selects, "ui_on_note_select"))
+
+    # Edit the selected note, save it and wait for the write to be acknowledged
+    saves = []
+    for _ in range(max(ops // 10, 1)):
+        app.text_area.insert("end", "x")
+        start = time.perf_counter()
+        app.save_note()
+        app.db.flush()
+        root.update()
+        saves.append(time.perf_counter() - start)
+    result.update(percentiles(saves, "ui_save_note"))
+
+    app.close(timeout=10)
+    return result
+
+
+def measure(path, ops, ui, seed):
+    """Everything measured for one corpus; runs in its own process."""
+    import sqlite3
+
+    rng = random.Random(seed)
+    with sqlite3.connect(path) as conn:
+        note_ids = [row[0] for row in conn.execute('SELECT id FROM Notes')]
+
+    result = {"notes": len(note_ids)}
+    result.update(bench_open(path, note_ids, rng))
+
+    from Notes_Handler import Notes_Handler
+    notes_handler = Notes_Handler(path)
+    result.update(bench_operations(notes_handler, note_ids, ops, rng))
+    notes_handler.close()
+
+    if ui:
+        ui_result = bench_ui(path, note_ids, ops, rng)
+        if ui_result is not None:
+            result.update(ui_result)
+
+    result["file_bytes"] = sum(os.path.getsize(file_path) for file_path in (path, path + "-wal")
+                               if os.path.exists(file_path))
+    result["bytes_per_note"] = result["file_bytes"] / max(len(note_ids), 1)
+    result["peak_rss_bytes"] = peak_rss_bytes()
+    return result
+
+
+def run(sizes, ops, ui, seed, corpus_dir):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = corpus_dir or tmp
+        os.makedirs(directory, exist_ok=True)
+        for count in sizes:
+            path, generation = ensure_corpus(directory, count, seed)
+            # The timed writes go to a scratch copy; the corpus itself is never written after generation
+            work_path = os.path.join(tmp, f"work_{count}.db")
+            shutil.copyfile(path, work_path)
+            try:
+                child = subprocess.run(
+                    [sys.executable, "-m", "Benchmarks.Notes_Benchmark", "--measure", work_path,
+                     "--ops", str(ops), "--seed", str(seed)] + ([] if ui else ["--no-ui"]),
+                    stdout=subprocess.PIPE, check=True)
+            finally:
+                for file_path in (work_path, work_path + "-wal", work_path + "-shm"):
+                    if os.path.exists(file_path):
+                        os.unlink(file_path)
+            entry = json.loads(child.stdout)
+            entry.update(generation)
+            results.append(entry)
+            print(f"{count:>8} notes: open cold {entry['open_cold_first_note_seconds'] * 1000:.1f}ms, "
+                  f"save p50 {entry['save_note_p50_ms']:.2f}ms, "
+                  f"get p50 {entry['get_note_by_id_uncached_p50_ms']:.2f}ms, "
+                  f"{entry['file_bytes'] / 1e6:.1f} MB, rss {(entry['peak_rss_bytes'] or 0) / 1e6:.0f} MB",
+                  file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Compare each size against the baseline report; returns (comparisons, regressions)."""
+    previous = {entry["notes"]: entry for entry in baseline.get("results", [])}
+    comparisons, regressions = [], []
+    for entry in results:
+        old = previous.get(entry["notes"])
+        if old is None:
+            continue
+        for key, value in entry.items():
+            base = old.get(key)
+            if not key.endswith(COMPARED_SUFFIXES) or not isinstance(value, (int, float)) \
+                    or not isinstance(base, (int, float)) or not base:
+                continue
+            change = (value - base) / base
+            row = {"notes": entry["notes"], "metric": key, "baseline": base, "current": value,
+                   "change_pct": change * 100, "regression": change > tolerance}
+            comparisons.append(row)
+            if row["regression"]:
+                regressions.append(row)
+    return comparisons, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Notes_Handler storage and the note UI.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--ops", type=int, default=DEFAULT_OPS, help="operations timed per measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus-dir", help="keep generated databases here and reuse them")
+    parser.add_argument("--no-ui", action="store_true", help="skip the Tk harness")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="fraction by which a figure may get worse before it counts as a regression")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    parser.add_argument("--measure", metavar="DB", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        json.dump(measure(args.measure, args.ops, not args.no_ui, args.seed), sys.stdout)
+        return 0
+
+    report = {
+        "benchmark": "notes",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": run(args.sizes, args.ops, not args.no_ui, args.seed, args.corpus_dir),
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        comparisons, regressions = compare(report["results"], baseline, args.tolerance)
+        report["baseline"] = {"path": args.baseline, "timestamp": baseline.get("timestamp"),
+                              "tolerance": args.tolerance, "comparisons": comparisons,
+                              "regressions": len(regressions)}
+        for row in regressions:
+            print(f"REGRESSION {row['notes']:>8} notes {row['metric']}: {row['baseline']:.4g} -> "
+                  f"{row['current']:.4g} ({row['change_pct']:+.0f}%)", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""Scheduler and Reminder_Handler benchmarks driven by a virtual clock.
+
+Run from the repository root:
+
+    python -m Benchmarks.Scheduler_Benchmark --sizes 1000 10000 100000 --output scheduler_bench.json
+
+Nothing here sleeps: the clock jumps straight to each deadline and only the
+real time spent inside the scheduler is added on top, so firing lag reflects
+scheduling overhead rather than wall-clock waiting.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from Reminder_Handler import Reminder_Handler
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+EPOCH = datetime(2024, 8, 10, 0, 0)
+
+
+class Fake_Clock:
+    """Virtual clock: jumps on advance_to() and otherwise tracks real elapsed time."""
+
+    def __init__(self, start=EPOCH):
+        self.virtual = start
+        self.anchor = time.perf_counter()
+
+    def __call__(self):
+        return self.virtual + timedelta(seconds=time.perf_counter() - self.anchor)
+
+    def advance_to(self, when):
+        self.virtual = when
+        self.anchor = time.perf_counter()
+
+
+def write_reminders_file(path, count, seed=0):
+    """Write a Reminders.json-style file with a mix of recurring and one-time reminders."""
+    rng = random.Random(seed)
+    reminders = []
+    for i in range(count):
+        recurring = rng.random() < 0.3
+        date = EPOCH.date() + timedelta(days=rng.randrange(0, 30))
+        reminders.append({
+            "title": f"Reminder {i}",
+            "message": f"Benchmark reminder number {i}",
+            "date": None if recurring else date.isoformat(),
+            "time": f"{rng.randrange(24):02}:{rng.randrange(60):02}",
+            "recurring": recurring
+        })
+    with open(path, 'w') as f:
+        json.dump(reminders, f)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def new_handler(path, clock):
+    handler = Reminder_Handler(path + ".db", clock=clock, legacy_path=path)
+    fired = []
+
+    def record(due):
+        now = clock()
+        for deadline, job in due:
+            fired.append((now - deadline).total_seconds())
+
+    handler.scheduler._fire = record
+    return handler, fired
+
+
+def bench_load(path, count):
+    """Time load_reminders, then repeat under tracemalloc to measure memory per reminder."""
+    clock = Fake_Clock()
+    handler, fired = new_handler(path, clock)
+
+    # The JSON import is a one-time migration; startup afterwards only reads rows
+    start = time.perf_counter()
+    handler.store.import_json(path)
+    migrate = time.perf_counter() - start
+
+    start = time.perf_counter()
+    handler.load_reminders()
+    elapsed = time.perf_counter() - start
+
+    # Tracing slows allocation down considerably, so memory gets its own pass
+    traced, _ = new_handler(path, Fake_Clock())
+    tracemalloc.start()
+    traced.load_reminders()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+
+    return {
+        "migrate_seconds": migrate,
+        "load_seconds": elapsed,
+        "reminders_per_second": count / elapsed if elapsed else None,
+        "scheduled_jobs": len(handler.scheduler.jobs),
+        "peak_bytes": peak,
+        "bytes_per_reminder": current / count,
+    }, handler, fired, clock
+
+
+def bench_tick(handler, clock, ticks=2000):
+    """Average cost of a run_pending call when nothing is due."""
+    clock.advance_to(EPOCH)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        handler.scheduler.run_pending()
+    return (time.perf_counter() - start) / ticks
+
+
+def bench_lag(handler, clock, fired, limit=None):
+    """Jump the clock from deadline to deadline, as the worker would, and record firing lag."""
+    jobs = handler.scheduler.jobs
+    horizon = EPOCH + timedelta(days=31)
+    fired.clear()
+    start = time.perf_counter()
+    while jobs and jobs[0][0] < horizon and (limit is None or len(fired) < limit):
+        clock.advance_to(jobs[0][0])
+        handler.scheduler.run_pending()
+    elapsed = time.perf_counter() - start
+    return {
+        "fired": len(fired),
+        "fire_seconds": elapsed,
+        "lag_p50_ms": (percentile(fired, 50) or 0) * 1000,
+        "lag_p99_ms": (percentile(fired, 99) or 0) * 1000,
+        "lag_max_ms": (max(fired) if fired else 0) * 1000,
+        "lag_mean_ms": (statistics.fmean(fired) if fired else 0) * 1000,
+    }
+
+
+def run(sizes, fire_limit):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in sizes:
+            path = os.path.join(tmp, f"Reminders_{count}.json")
+            write_reminders_file(path, count)
+            load, handler, fired, clock = bench_load(path, count)
+            entry = {"reminders": count}
+            entry.update(load)
+            entry["tick_seconds"] = bench_tick(handler, clock)
+            entry.update(bench_lag(handler, clock, fired, fire_limit))
+            results.append(entry)
+            print(f"{count:>8} reminders: load {load['load_seconds']:.3f}s, "
+                  f"tick {entry['tick_seconds'] * 1e6:.2f}us, "
+                  f"lag p99 {entry['lag_p99_ms']:.3f}ms", file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Scheduler and Reminder_Handler.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--fire-limit", type=int, default=None,
+                        help="stop the lag run after this many notifications")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = {
+        "benchmark": "scheduler",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": run(args.sizes, args.fire_limit),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Key-to-render latency of the editor on large formatted notes.
+
+Run from the repository root (needs a display; skipped without one):
+
+    python -m Benchmarks.Typing_Benchmark --sizes 1000000 4000000 --output typing_bench.json
+
+Each run loads a synthetic note with dense bold/italic/underline formatting
+into a Text widget through Text_Formatter, then types characters at several
+positions with styles active, forcing a redisplay after each one.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+
+DEFAULT_SIZES = [1000000, 4000000]
+STYLES = ("bold", "italic", "underline")
+
+
+def synthetic_note(size, seed=0):
+    """Return (content, tag_data) with a formatted span every few hundred characters."""
+    rng = random.Random(seed)
+    words = ["note", "reminder", "format", "latency", "tkinter", "editor", "span"]
+    parts = []
+    length = 0
+    while length < size:
+        line = " ".join(rng.choice(words) for _ in range(12)) + "\n"
+        parts.append(line)
+        length += len(line)
+    content = "".join(parts)[:size]
+
+    tags = []
+    position = 0
+    while position < size - 50:
+        start = position + rng.randrange(0, 200)
+        end = min(size, start + rng.randrange(5, 50))
+        tags.append({"tag_name": rng.choice(STYLES), "start": start, "end": end})
+        position = end
+    return content, tags
+
+
+def run(sizes, keystrokes):
+    import tkinter as tk
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"Skipping typing benchmark, no display available: {e}", file=sys.stderr)
+        return None
+
+    from UI import Text_Formatter
+    root.geometry("800x600")
+
+    results = []
+    for size in sizes:
+        text = tk.Text(root, wrap="word", font=("Helvetica", 12))
+        text.pack(fill="both", expand=True)
+        formatter = Text_Formatter(text)
+        content, tags = synthetic_note(size)
+
+        start = time.perf_counter()
+        text.insert("end", content)
+        formatter.apply_tags(content, tags)
+        root.update()
+        load_seconds = time.perf_counter() - start
+
+        formatter.active = {"bold", "italic"}
+        for position in ("1.0", "end-1c", f"{content.count(chr(10)) // 2}.0"):
+            text.mark_set("insert", position)
+            for _ in range(keystrokes):
+                formatter.type_char("x")
+                root.update()
+
+        stats = formatter.latency_stats()
+        stats.update({"note_chars": size, "spans": len(tags), "load_seconds": load_seconds,
+                      "tag_ranges": len(text.tag_ranges("bold")) // 2})
+        results.append(stats)
+        print(f"{size:>9} chars: p50 {stats['p50_ms']:.2f}ms, p99 {stats['p99_ms']:.2f}ms "
+              f"(target {stats['target_ms']}ms)", file=sys.stderr)
+        text.destroy()
+
+    root.destroy()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark editor typing latency.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--keystrokes", type=int, default=200)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.keystrokes)
+    if results is None:
+        return
+
+    report = {
+        "benchmark": "typing",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from Metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+
+class DB_Worker:
+    """Runs Notes_Handler calls off the Tk thread.
+
+    Writes go through a single writer thread that owns the read-write
+    connection; writes submitted with the same key (e.g. repeated saves of
+    one note) are coalesced so only the latest runs. Reads run on a small
+    pool whose threads each use their own read-only connection. Results are
+    handed back through `post`, which the UI points at root.after.
+    """
+
+    def __init__(self, notes_handler, post=None, readers=2):
+        self.notes_handler = notes_handler
+        self.post = post or (lambda fn: fn())
+        # key -> [fn, args, callbacks, errbacks], oldest first
+        self.pending = OrderedDict()
+        self.cond = threading.Condition()
+        self.busy = False
+        self.running = True
+
+        self.reader_pool = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="DBRead")
+        self.thread = threading.Thread(target=self._run, name="DBWrite", daemon=True)
+        self.thread.start()
+        METRICS.register("db_worker", lambda: {'pending_writes': len(self.pending), 'busy': self.busy})
+
+    def write(self, fn, *args, key=None, callback=None, errback=None):
+        """Queue a write. A pending write with the same key is replaced, keeping its callbacks.
+
+        `callback(result)` is posted when it commits, `errback(exception)` if it raises.
+        """
+        with self.cond:
+            if not self.running:
+                raise RuntimeError("DB worker is closed")
+            if key is None:
+                key = object()
+            entry = self.pending.get(key)
+            if entry is not None:
+                entry[0] = fn
+                entry[1] = args
+            else:
+                entry = self.pending[key] = [fn, args, [], []]
+            if callback is not None:
+                entry[2].append(callback)
+            if errback is not None:
+                entry[3].append(errback)
+            self.cond.notify()
+
+    def read(self, fn, *args, callback=None, errback=None):
+        """Run a read on the reader pool and post its result to `callback`, or its exception to `errback`."""
+        future = self.reader_pool.submit(fn, *args)
+        if callback is not None or errback is not None:
+            future.add_done_callback(partial(self._deliver, callback, errback))
+        return future
+
+    def flush(self, timeout=None):
+        """Wait until every queued write has run. Returns False on timeout."""
+        with self.cond:
+            return self.cond.wait_for(lambda: not self.pending and not self.busy, timeout)
+
+    def close(self, timeout=None):
+        """Finish queued writes, stop the threads and close the database."""
+        drained = self.flush(timeout)
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join(timeout)
+        self.reader_pool.shutdown(wait=False, cancel_futures=True)
+        if not self.thread.is_alive():
+            self.notes_handler.close()
+        return drained
+
+    def _deliver(self, callback, errback, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            log.error("Database read failed: %s", e)
+            if errback is not None:
+                self.post(partial(errback, e))
+            return
+        if callback is not None:
+            self.post(partial(callback, result))
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.pending:
+                    self.cond.wait()
+                if not self.pending:
+                    return
+                _, (fn, args, callbacks, errbacks) = self.pending.popitem(last=False)
+                self.busy = True
+
+            try:
+                result = fn(*args)
+            except Exception as e:
+                log.exception("Database write failed: %s", e)
+                # Never let a half-done write ride along with the next commit
+                if self.notes_handler.conn.in_transaction:
+                    self.notes_handler.conn.rollback()
+                for errback in errbacks:
+                    self.post(partial(errback, e))
+            else:
+                for callback in callbacks:
+                    self.post(partial(callback, result))
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
@@ -0,0 +1,370 @@
+"""Headless reminder daemon and the client used to control it.
+
+    python main.py --daemon                 run reminders without the GUI
+    python Daemon.py list                   talk to a running daemon
+    python Daemon.py add "Stand up" 09:30 --rule "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR"
+    python Daemon.py update 12 --time 10:00
+    python Daemon.py delete 12
+    python Daemon.py metrics
+
+Only Reminder_Handler, Scheduler and their SQLite store are loaded; tkinter,
+PIL and pystray are never imported (plyer is imported by the first
+notification). The control API is newline-delimited JSON over a Unix
+socket: one request per connection, e.g. {"command": "add", "reminder": {...}},
+answered with {"ok": true, ...} or {"ok": false, "error": "..."}. The
+"metrics" command returns the Metrics snapshot when the daemon was started
+with --metrics.
+
+Budgets, checked with VmRSS and the voluntary context switches of every
+thread in /proc/<pid>:
+
+    idle RSS      under 20 MB (about 18 MB on CPython 3.11 / Linux)
+    idle CPU      no periodic work. With nothing scheduled every thread is
+                  blocked (accept, Condition.wait, Queue.get) and the process
+                  does not wake up at all; with reminders pending the
+                  scheduler wakes at its next deadline, or at most once per
+                  Scheduler.MAX_WAIT seconds to notice wall clock changes.
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+
+from Metrics import METRICS
+from Occurrence_Index import Occurrence_Index
+
+SOCKET_PATH = "Data/reminders.sock"
+# Requests are a few hundred bytes; anything this large is not a client of ours
+MAX_REQUEST_BYTES = 1 << 20
+# Seconds a client has to send its request and read the answer
+REQUEST_TIMEOUT = 5.0
+
+log = logging.getLogger(__name__)
+
+
+class Daemon_Error(Exception):
+    """The daemon answered a request with an error."""
+
+
+class Reminder_Daemon:
+    """Runs the scheduler and serves the control API on a Unix socket."""
+
+    def __init__(self, reminder_handler, socket_path=SOCKET_PATH):
+        self.reminder_handler = reminder_handler
+        self.socket_path = socket_path
+        self.server = None
+        # Connections are read on their own threads; requests still run one at a time
+        self.lock = threading.Lock()
+
+    def serve_forever(self):
+        self.server = self._listen()
+        try:
+            while True:
+                # Blocking accept: no timeouts, so an idle daemon never wakes up
+                conn, _ = self.server.accept()
+                # A client that connects and says nothing only holds up its own thread
+                threading.Thread(target=self._serve, args=(conn,), name="Control", daemon=True).start()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+    def _listen(self):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise OSError("The reminder daemon needs Unix domain sockets")
+        if os.path.exists(self.socket_path):
+            # A live daemon answers; a stale socket file from a crash does not
+            try:
+                Daemon_Client(self.socket_path).ping()
+            except OSError:
+                os.unlink(self.socket_path)
+            else:
+                raise OSError(f"A reminder daemon is already listening on {self.socket_path}")
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        # Only the owning user may add or delete reminders
+        os.chmod(self.socket_path, 0o600)
+        server.listen()
+        return server
+
+    def _serve(self, conn):
+        with conn:
+            try:
+                self._handle(conn)
+            except (OSError, ValueError) as e:
+                log.warning("Dropped a control connection: %s", e)
+
+    def _handle(self, conn):
+        """Answer the one request on `conn`. Raises TimeoutError if it isn't sent within REQUEST_TIMEOUT."""
+        deadline = time.monotonic() + REQUEST_TIMEOUT
+        data = bytearray()
+        while b"\n" not in data:
+            # One deadline for the whole request, so trickling bytes doesn't extend it
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Request not received in time")
+            conn.settimeout(remaining)
+            chunk = conn.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+            if len(data) > MAX_REQUEST_BYTES:
+                raise ValueError("Request too large")
+        line = bytes(data).split(b"\n", 1)[0]
+        if not line.strip():
+            return
+        try:
+            request = json.loads(line)
+            with self.lock:
+                response = self.dispatch(request)
+        except Exception as e:
+            response = {'ok': False, 'error': str(e)}
+        conn.settimeout(max(deadline - time.monotonic(), 1.0))
+        conn.sendall(json.dumps(response).encode('utf-8') + b"\n")
+
+    def dispatch(self, request):
+        """Run one control request and return the response dict."""
+        # Already loaded in the daemon; importing at the top would slow the CLI client
+        from Reminder_Handler import validate_reminder
+
+        command = request.get('command')
+        handler = self.reminder_handler
+        if command == 'ping':
+            return {'ok': True, 'pid': os.getpid()}
+        if command == 'metrics':
+            return {'ok': True, 'metrics': METRICS.snapshot()}
+        if command == 'add':
+            reminder = dict(request['reminder'])
+            reminder.setdefault('message', "")
+            reminder.setdefault('date', None)
+            reminder.setdefault('recurring', bool(reminder.get('rule')))
+            # Check before the reminder is stored, not when it fails to schedule
+            if not reminder.get('title') or not reminder.get('time'):
+                return {'ok': False, 'error': "A reminder needs a title and a time"}
+            if not reminder['recurring'] and not reminder['date']:
+                return {'ok': False, 'error': "A one-time reminder needs a date"}
+            try:
+                validate_reminder(reminder)
+            except ValueError as e:
+                return {'ok': False, 'error': str(e)}
+            job = handler.create_reminder(reminder)
+            return {'ok': True, 'id': reminder['id'], 'scheduled': job is not None}
+        if command == 'list':
+            return {'ok': True, 'reminders': handler.list_reminders(request.get('order', 'next'))}
+        if command == 'update':
+            reminder_id = int(request['id'])
+            if reminder_id not in handler.reminders:
+                return {'ok': False, 'error': f"No reminder {reminder_id}"}
+            changes = dict(request['changes'])
+            # The merged reminder is checked before the store is touched
+            if changes.get('rule'):
+                changes['recurring'] = True
+            try:
+                validate_reminder(dict(handler.get_reminder(reminder_id), **changes))
+            except ValueError as e:
+                return {'ok': False, 'error': str(e)}
+            job = handler.update_reminder(reminder_id, **changes)
+            return {'ok': True, 'scheduled': job is not None}
+        if command == 'delete':
+            return {'ok': True, 'deleted': handler.delete_reminder(int(request['id']))}
+        return {'ok': False, 'error': f"Unknown command: {command}"}
+
+
+class Daemon_Client:
+    """Talks to a running Reminder_Daemon; raises OSError when none is listening."""
+
+    def __init__(self, socket_path=SOCKET_PATH, timeout=5.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def request(self, command, **fields):
+        fields['command'] = command
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(self.timeout)
+            conn.connect(self.socket_path)
+            conn.sendall(json.dumps(fields).encode('utf-8') + b"\n")
+            line = conn.makefile('rb').readline(MAX_REQUEST_BYTES)
+        if not line:
+            raise ConnectionError("The reminder daemon closed the connection")
+        response = json.loads(line)
+        if not response.get('ok'):
+            raise Daemon_Error(response.get('error'))
+        return response
+
+    def ping(self):
+        return self.request('ping')['pid']
+
+    def add(self, reminder):
+        return self.request('add', reminder=reminder)['id']
+
+    def list(self, order='next'):
+        return self.request('list', order=order)['reminders']
+
+    def update(self, reminder_id, changes):
+        return self.request('update', id=reminder_id, changes=changes)['scheduled']
+
+    def delete(self, reminder_id):
+        return self.request('delete', id=reminder_id)['deleted']
+
+
+class Remote_Reminder_Handler:
+    """Stands in for Reminder_Handler in the GUI while a daemon owns the reminders."""
+
+    def __init__(self, client):
+        self.client = client
+        self.scheduler = None
+
+    def list_reminders(self, order='next'):
+        return self.client.list(order)
+
+    def create_reminder(self, reminder):
+        reminder['id'] = self.client.add(reminder)
+
+    def update_reminder(self, reminder_id, **changes):
+        return self.client.update(reminder_id, changes)
+
+    def timeline(self):
+        # Built from a fresh listing each time the view opens
+        index = Occurrence_Index()
+        index.reset(datetime.now(), self.client.list('id'))
+        return index
+
+    def delete_reminder(self, reminder_id):
+        return self.client.delete(reminder_id)
+
+    def load_reminders(self):
+        pass
+
+    def check_reminders(self):
+        pass
+
+    def save_reminders(self):
+        pass
+
+    def close(self, timeout=None):
+        # The daemon keeps running; there is nothing of ours to stop
+        return True
+
+
+def connect(socket_path=SOCKET_PATH):
+    """Return a Daemon_Client if a daemon is running, else None."""
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(socket_path):
+        return None
+    client = Daemon_Client(socket_path, timeout=1.0)
+    try:
+        client.ping()
+    except (OSError, ValueError, Daemon_Error):
+        return None
+    client.timeout = 5.0
+    return client
+
+
+def run_daemon(reminders_path="Data/reminders.db", legacy_path="Data/Reminders.json", socket_path=SOCKET_PATH,
+               lifecycle=None):
+    from Lifecycle import Lifecycle
+    from Reminder_Handler import Reminder_Handler
+
+    lifecycle = lifecycle or Lifecycle()
+    reminder_handler = Reminder_Handler(reminders_path, legacy_path=legacy_path)
+    lifecycle.on_shutdown("reminders", reminder_handler.close)
+    daemon = Reminder_Daemon(reminder_handler, socket_path)
+
+    def stop():
+        # Unwinds serve_forever's blocking accept on the main thread
+        raise SystemExit(0)
+
+    lifecycle.install_signal_handlers(stop)
+
+    reminder_handler.load_reminders()
+    reminder_handler.scheduler.start()
+    log.info("Reminder daemon listening on %s", socket_path)
+    try:
+        daemon.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        lifecycle.shutdown()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="Daemon.py", description="Control a running Noteify reminder daemon")
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("run", help="run the daemon in the foreground")
+    listing = commands.add_parser("list", help="list active reminders")
+    listing.add_argument("--order", choices=("next", "title", "id"), default="next")
+    commands.add_parser("metrics", help="print the daemon's metrics snapshot (run it with --metrics)")
+    add = commands.add_parser("add", help="add a reminder")
+    add.add_argument("title")
+    add.add_argument("time", help="HH:MM, 24-hour")
+    add.add_argument("--message", default="")
+    add.add_argument("--date", help="YYYY-MM-DD; the first occurrence for recurring reminders")
+    add.add_argument("--rule", help='recurrence rule, e.g. "FREQ=WEEKLY;BYDAY=MO,WE"')
+    update = commands.add_parser("update", help="change fields of a reminder")
+    update.add_argument("id", type=int)
+    update.add_argument("--title")
+    update.add_argument("--time", help="HH:MM, 24-hour")
+    update.add_argument("--message")
+    update.add_argument("--date", help="YYYY-MM-DD")
+    update.add_argument("--rule", help='recurrence rule; "" makes the reminder one-time')
+    delete = commands.add_parser("delete", help="delete a reminder")
+    delete.add_argument("id", type=int)
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+        return run_daemon(socket_path=args.socket)
+
+    client = Daemon_Client(args.socket)
+    try:
+        if args.command == "metrics":
+            print(json.dumps(client.request('metrics')['metrics'], indent=4))
+        elif args.command == "list":
+            for reminder in client.list(args.order):
+                when = reminder['rule'] or reminder['date'] or "daily"
+                print(f"{reminder['id']:>5}  {reminder['time']}  {when:<30}  {reminder['title']}")
+        elif args.command == "update":
+            changes = {field: getattr(args, field) for field in ("title", "time", "message", "date", "rule")
+                       if getattr(args, field) is not None}
+            if changes.get('rule') == "":
+                changes['rule'] = None
+                changes['recurring'] = False
+            scheduled = client.update(args.id, changes)
+            print("Updated" if scheduled else "Updated (nothing left to schedule)")
+        elif args.command == "add":
+            reminder_id = client.add({
+                "title": args.title,
+                "message": args.message,
+                "date": args.date,
+                "time": args.time,
+                "recurring": bool(args.rule),
+                "rule": args.rule
+            })
+            print(f"Added reminder {reminder_id}")
+        elif args.command == "delete":
+            print("Deleted" if client.delete(args.id) else "No such reminder")
+    except OSError as e:
+        print(f"Could not reach the reminder daemon on {args.socket}: {e}")
+        return 1
+    except Daemon_Error as e:
+        print(f"Daemon error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import logging
+import os
+import signal
+import threading
+import time
+
+from Metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+# Seconds the whole shutdown may take, and how much longer before the process is killed outright
+SHUTDOWN_DEADLINE = 5.0
+FORCE_EXIT_GRACE = 2.0
+
+
+class Lifecycle:
+    """Orders the shutdown of everything started in main().
+
+    Components register a stop step as they start. shutdown() runs the steps
+    newest first, so e.g. the DB worker drains before the database it writes
+    to is closed, and passes each step the seconds left before one overall
+    deadline. A step that overruns or raises is logged and the rest still
+    run; if the interpreter then cannot exit (a non-daemon thread stuck in a
+    call), a timer ends the process so closing the app never hangs.
+    """
+
+    def __init__(self, deadline=SHUTDOWN_DEADLINE, grace=FORCE_EXIT_GRACE):
+        self.deadline = deadline
+        self.grace = grace
+        # (name, fn) pairs; fn(remaining_seconds) returns False if it gave up waiting
+        self.steps = []
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def on_shutdown(self, name, fn):
+        """Register `fn(timeout)` to run at shutdown, before every step registered earlier."""
+        with self.lock:
+            self.steps.append((name, fn))
+
+    def install_signal_handlers(self, callback):
+        """Call `callback` (e.g. root.quit) on SIGTERM or SIGINT so they shut down cleanly too."""
+        def handle(signum, frame):
+            log.info("Received %s, shutting down", signal.Signals(signum).name)
+            callback()
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, handle)
+
+    def shutdown(self):
+        """Run every shutdown step once, newest first. Returns True if all finished in time."""
+        with self.lock:
+            if self.stopping.is_set():
+                return True
+            self.stopping.set()
+            steps, self.steps = self.steps[::-1], []
+
+        watchdog = threading.Timer(self.deadline + self.grace, self._force_exit)
+        watchdog.daemon = True
+        watchdog.start()
+
+        started = time.monotonic()
+        end = started + self.deadline
+        clean = True
+        for name, fn in steps:
+            step_started = time.monotonic()
+            try:
+                finished = fn(max(end - step_started, 0.0))
+            except Exception as e:
+                log.exception("Shutdown step %s failed: %s", name, e)
+                finished = False
+            elapsed = time.monotonic() - step_started
+            METRICS.observe("shutdown." + name, elapsed)
+            if finished is False:
+                clean = False
+                log.warning("Shutdown step %s did not finish (%.0f ms)", name, elapsed * 1000)
+            else:
+                log.debug("Shutdown step %s took %.0f ms", name, elapsed * 1000)
+        log.info("Shutdown finished in %.0f ms", (time.monotonic() - started) * 1000)
+        return clean
+
+    def _force_exit(self):
+        # Runs only if the process is still alive well past the deadline
+        log.error("Shutdown overran its %.1f s deadline, exiting anyway", self.deadline + self.grace)
+        logging.shutdown()
+        os._exit(1)
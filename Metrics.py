@@ -0,0 +1,262 @@
+"""Process-wide performance metrics.
+
+Everything goes through the METRICS singleton. While it is disabled (the
+default) timers are a shared no-op object and observe/gauge/count return
+after one attribute check, so the instrumentation stays in place in normal
+runs. `python main.py --metrics metrics.json` enables it and rewrites that
+file with a snapshot every few seconds.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+log = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in milliseconds, roughly doubling up to a minute
+BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 16, 25, 50, 100, 250, 500,
+              1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; percentiles are reported as bucket upper bounds."""
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms):
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, fraction):
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return BUCKETS_MS[index] if index < len(BUCKETS_MS) else self.max
+        return 0.0
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p90_ms': self.percentile(0.9),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': self.max
+        }
+
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'started')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _Null_Timer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _Null_Timer()
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.gauges = {}
+        self.counters = {}
+        # name -> callable returning a dict, sampled at snapshot time
+        self.sources = {}
+        self.started = time.time()
+        self.exporter = None
+        self.stop_event = threading.Event()
+
+    def enable(self):
+        self.enabled = True
+
+    def timer(self, name):
+        """Context manager recording the duration of its block under `name`."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def timed(self, name):
+        """Decorator form of timer(); checks `enabled` on every call, not at decoration time."""
+        def decorate(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - started)
+            return wrapper
+        return decorate
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(seconds * 1000)
+
+    def gauge(self, name, value):
+        if self.enabled:
+            self.gauges[name] = value
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def register(self, name, source):
+        """Sample `source()` (a dict) into every snapshot, e.g. a queue's stats()."""
+        self.sources[name] = source
+
+    def snapshot(self):
+        with self.lock:
+            histograms = {name: histogram.snapshot() for name, histogram in self.histograms.items()}
+            counters = dict(self.counters)
+        sources = {}
+        for name, source in list(self.sources.items()):
+            try:
+                sources[name] = source()
+            except Exception as e:
+                sources[name] = {'error': str(e)}
+        return {
+            'time': time.time(),
+            'uptime_seconds': time.time() - self.started,
+            'histograms': histograms,
+            'gauges': dict(self.gauges),
+            'counters': counters,
+            'sources': sources
+        }
+
+    def write_snapshot(self, path):
+        # Write-then-rename so readers never see a half-written file
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=4)
+        os.replace(temp_path, path)
+
+    def start_exporter(self, path, interval=10.0):
+        """Rewrite `path` with a snapshot every `interval` seconds until stop_exporter()."""
+        def run():
+            while not self.stop_event.wait(interval):
+                try:
+                    self.write_snapshot(path)
+                except OSError as e:
+                    log.warning("Writing metrics snapshot failed: %s", e)
+
+        self.exporter = threading.Thread(target=run, name="MetricsExport", daemon=True)
+        self.exporter.start()
+
+    def stop_exporter(self, path=None):
+        self.stop_event.set()
+        if self.exporter is not None:
+            self.exporter.join()
+            self.exporter = None
+        if path:
+            self.write_snapshot(path)
+
+    def instrument_tk(self, tkinter):
+        """Time every Tk callback (commands, bindings, after) under tk.<handler name>.
+
+        Tk calls into Python through tkinter.CallWrapper, so wrapping it covers
+        handlers registered before and after this call.
+        """
+        original = tkinter.CallWrapper.__call__
+        metrics = self
+
+        def timed_call(wrapper, *args):
+            started = time.perf_counter()
+            try:
+                return original(wrapper, *args)
+            finally:
+                func = getattr(wrapper.func, 'func', wrapper.func)
+                name = getattr(func, '__qualname__', None) or type(func).__name__
+                metrics.observe("tk." + name, time.perf_counter() - started)
+
+        tkinter.CallWrapper.__call__ = timed_call
+
+
+class Stall_Watchdog:
+    """Warns when the Tk thread stops processing events for longer than `threshold` seconds.
+
+    The Tk side only bumps a timestamp from a repeating after() callback; a
+    background thread compares it with the clock.
+    """
+
+    def __init__(self, root, metrics, threshold=0.25, interval=0.05):
+        self.root = root
+        self.metrics = metrics
+        self.threshold = threshold
+        self.interval = interval
+        self.last_beat = time.perf_counter()
+        self.stalled_since = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self._beat()
+        self.thread = threading.Thread(target=self._watch, name="StallWatchdog", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _beat(self):
+        self.last_beat = time.perf_counter()
+        if not self.stop_event.is_set():
+            self.root.after(int(self.interval * 1000), self._beat)
+
+    def _watch(self):
+        while not self.stop_event.wait(self.interval):
+            behind = time.perf_counter() - self.last_beat - self.interval
+            if behind > self.threshold:
+                if self.stalled_since is None:
+                    self.stalled_since = self.last_beat
+            elif self.stalled_since is not None:
+                # Report once the stall is over, with its full length
+                stall = self.last_beat - self.stalled_since
+                self.stalled_since = None
+                self.metrics.observe("ui.stall", stall)
+                self.metrics.count("ui.stalls")
+                log.warning("UI thread stalled for %.0f ms", stall * 1000)
+
+
+METRICS = Metrics()
@@ -0,0 +1,91 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+class Note_Cache:
+    """LRU cache of loaded notes, bounded by entry count and total content size."""
+
+    def __init__(self, max_entries=64, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # note_id -> (value, size), least recently used first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.total_bytes = 0
+        # Bumped on every invalidation so background loads can't store stale notes
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, note_id):
+        with self.lock:
+            entry = self.entries.get(note_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(note_id)
+            self.hits += 1
+            return entry[0]
+
+    def contains(self, note_id):
+        """Check for an entry without counting a hit or miss or touching its recency."""
+        with self.lock:
+            return note_id in self.entries
+
+    def put(self, note_id, value, generation=None):
+        """Store a loaded (note_data, tag_data) pair.
+
+        Pass the generation read before loading to drop the value if the note
+        was invalidated while it was being read.
+        """
+        note_data = value[0]
+        size = sys.getsizeof(note_data['content'] or "")
+
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return False
+            # A single note larger than the whole budget is never cached
+            if size > self.max_bytes:
+                return False
+
+            old = self.entries.pop(note_id, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self.entries[note_id] = (value, size)
+            self.total_bytes += size
+
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+            return True
+
+    def invalidate(self, note_id):
+        with self.lock:
+            self.generation += 1
+            old = self.entries.pop(note_id, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else None
+            }
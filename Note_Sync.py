@@ -0,0 +1,315 @@
+"""Incremental sync of notes through a shared folder.
+
+    python Note_Sync.py sync ~/Dropbox/Noteify       export local changes, then apply everyone else's
+    python Note_Sync.py export ~/Dropbox/Noteify
+    python Note_Sync.py import ~/Dropbox/Noteify
+    python Note_Sync.py status ~/Dropbox/Noteify
+
+Every database gets a random device id. Local changes come from the
+ChangeLog table that Notes_Handler keeps: one row per note, with the
+sequence number of its latest change. An export writes the rows past the
+last exported sequence number to the folder, as gzipped JSON Lines batch
+files:
+
+    <folder>/<device>/<last seq, 12 digits>.jsonl.gz
+
+Each batch file starts with a header line
+{"device", "first_seq", "last_seq", "count"}. It is followed by one record
+per note: {"seq", "uid", "op": "upsert" | "delete", "updated_at", and for
+upserts "title", "content", "created_at", "formatting"}. A note changed ten
+times between syncs is exported once, in its latest state.
+
+Importing reads only the batch files of other devices that are newer than
+the last one applied from each device. Both export and import cost the
+number of changes, not the size of the database. A batch is applied in one
+transaction, together with the record of how far that device has been
+applied, so an interrupted or repeated import never applies a change
+twice.
+
+Conflicts are last writer wins on updated_at, with ties going to the
+higher device id so every copy settles on the same version; successive
+changes from one device always apply in its own order. Deletions are
+kept as tombstones, so a stale copy of a deleted note cannot bring it
+back. updated_at is wall clock time with one-second resolution, so copies
+whose clocks disagree resolve by their clocks.
+
+Attached files are not synced: only titles, text and formatting travel.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import uuid
+
+import Span_Codec
+from Notes_Handler import Notes_Handler, encode_body, decode_body
+
+BATCH_SIZE = 1000
+BATCH_SUFFIX = ".jsonl.gz"
+
+
+def create_tables(cursor):
+    cursor.execute('CREATE TABLE IF NOT EXISTS SyncState (key TEXT PRIMARY KEY, value) WITHOUT ROWID')
+    # Sequence number of the last change applied from each other device
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS SyncPeers (
+            device TEXT PRIMARY KEY,
+            applied_seq INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+def device_id(conn):
+    """This database's device id, created on first use."""
+    cursor = conn.cursor()
+    create_tables(cursor)
+    row = cursor.execute("SELECT value FROM SyncState WHERE key = 'device'").fetchone()
+    if row:
+        return row[0]
+    device = uuid.uuid4().hex
+    cursor.execute("INSERT INTO SyncState (key, value) VALUES ('device', ?)", (device,))
+    conn.commit()
+    return device
+
+
+def exported_seq(conn):
+    row = conn.execute("SELECT value FROM SyncState WHERE key = 'exported_seq'").fetchone()
+    return row[0] if row else 0
+
+
+def changes_since(conn, seq):
+    """Yield a sync record for every local change with a sequence number above `seq`, oldest first."""
+    cursor = conn.execute('''
+        SELECT c.seq, c.note_uid, c.op, c.updated_at,
+               n.title, b.compressed, b.body, n.created_at, f.spans
+        FROM ChangeLog c
+        LEFT JOIN Notes n ON n.uid = c.note_uid
+        LEFT JOIN NoteBodies b ON b.note_id = n.id
+        LEFT JOIN Formatting f ON f.note_id = n.id
+        WHERE c.seq > ? AND c.device IS NULL
+        ORDER BY c.seq
+    ''', (seq,))
+    for seq, uid, op, updated_at, title, compressed, body, created_at, blob in cursor:
+        record = {'seq': seq, 'uid': uid, 'op': op, 'updated_at': updated_at}
+        if op == 'upsert':
+            record['title'] = title
+            record['content'] = decode_body(compressed, body) or ""
+            record['created_at'] = created_at
+            spans = Span_Codec.decode(blob)
+            if spans:
+                record['formatting'] = {name: [list(span) for span in name_spans]
+                                        for name, name_spans in spans.items()}
+        yield record
+
+
+def export_changes(notes_handler, folder, batch_size=BATCH_SIZE):
+    """Write local changes made since the last export to `folder`; returns how many were written."""
+    conn = notes_handler.conn
+    device = device_id(conn)
+    directory = os.path.join(folder, device)
+    os.makedirs(directory, exist_ok=True)
+
+    count = 0
+    batch = []
+    for record in changes_since(conn, exported_seq(conn)):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            count += _write_batch(conn, directory, device, batch)
+            batch = []
+    if batch:
+        count += _write_batch(conn, directory, device, batch)
+    return count
+
+
+def _write_batch(conn, directory, device, batch):
+    last_seq = batch[-1]['seq']
+    path = os.path.join(directory, f"{last_seq:012d}{BATCH_SUFFIX}")
+    header = {'device': device, 'first_seq': batch[0]['seq'], 'last_seq': last_seq, 'count': len(batch)}
+
+    # Readers may be listing the folder right now: they must see whole files only
+    temp_path = path + ".tmp"
+    with gzip.open(temp_path, 'wt', encoding='utf-8') as out:
+        for record in [header] + batch:
+            out.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+            out.write("\n")
+    os.replace(temp_path, path)
+
+    # A crash before this commit re-exports the same changes under the same name
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO SyncState (key, value) VALUES ('exported_seq', ?)", (last_seq,))
+    return len(batch)
+
+
+def import_changes(notes_handler, folder):
+    """Apply every other device's batches that haven't been applied yet; returns (applied, skipped)."""
+    conn = notes_handler.conn
+    own = device_id(conn)
+    applied = skipped = 0
+    if not os.path.isdir(folder):
+        return applied, skipped
+
+    for device in sorted(os.listdir(folder)):
+        directory = os.path.join(folder, device)
+        if device == own or not os.path.isdir(directory):
+            continue
+        row = conn.execute('SELECT applied_seq FROM SyncPeers WHERE device = ?', (device,)).fetchone()
+        done = row[0] if row else 0
+
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(BATCH_SUFFIX):
+                continue
+            # The name is the batch's last seq, so old batches are skipped unopened
+            last_seq = int(name[:-len(BATCH_SUFFIX)])
+            if last_seq <= done:
+                continue
+            counts = _apply_batch(notes_handler, own, device, os.path.join(directory, name), done)
+            applied += counts[0]
+            skipped += counts[1]
+            done = last_seq
+    return applied, skipped
+
+
+def _apply_batch(notes_handler, own, device, path, done):
+    conn = notes_handler.conn
+    cursor = conn.cursor()
+    applied = skipped = 0
+    changed = []
+    released = []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        if header.get('device') != device:
+            raise ValueError(f"{path} belongs to device {header.get('device')}, not {device}")
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for line in f:
+                record = json.loads(line)
+                if record['seq'] <= done:
+                    continue
+                note_id = _apply_record(notes_handler, cursor, own, device, record, released)
+                if note_id is False:
+                    skipped += 1
+                else:
+                    applied += 1
+                    if note_id is not None:
+                        changed.append(note_id)
+            cursor.execute('INSERT OR REPLACE INTO SyncPeers (device, applied_seq) VALUES (?, ?)',
+                           (device, header['last_seq']))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    for note_id in changed:
+        notes_handler.cache.invalidate(note_id)
+    notes_handler.attachments.remove(released)
+    return applied, skipped
+
+
+def _apply_record(notes_handler, cursor, own, device, record, released):
+    """Apply one remote change if it is newer than ours.
+
+    Returns the local note id it changed, None if it only recorded a
+    deletion of a note we never had, or False if our version won.
+    Attachments a deletion leaves unreferenced are added to `released`.
+    """
+    uid = record['uid']
+    local = cursor.execute('SELECT updated_at, device FROM ChangeLog WHERE note_uid = ?', (uid,)).fetchone()
+    # A later change from the device that wrote our version always wins: it
+    # is newer by that device's own sequence, even within the same second
+    if local is not None and local[1] != device:
+        # Our own changes have device NULL; compare them under our id
+        if (record['updated_at'], device) <= (local[0], local[1] or own):
+            return False
+
+    row = cursor.execute('SELECT id FROM Notes WHERE uid = ?', (uid,)).fetchone()
+    if row is not None:
+        row = (row[0],) + notes_handler.note_text(cursor, row[0])
+
+    note_id = None
+    if record['op'] == 'delete':
+        if row is not None:
+            note_id = row[0]
+            released.extend(notes_handler.remove_note_rows(cursor, note_id, row[1], row[2]))
+    else:
+        title, content = record['title'], record.get('content') or ""
+        if row is None:
+            cursor.execute('''
+                INSERT INTO Notes (title, created_at, updated_at, uid)
+                VALUES (?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?)
+            ''', (title, record.get('created_at'), record['updated_at'], uid))
+            note_id = cursor.lastrowid
+            previous = None
+        else:
+            note_id, old_title, previous = row
+            cursor.execute('''
+                UPDATE Notes SET title = ?, created_at = COALESCE(?, created_at), updated_at = ? WHERE id = ?
+            ''', (title, record.get('created_at'), record['updated_at'], note_id))
+            cursor.execute("INSERT INTO NotesFTS (NotesFTS, rowid, title, content) VALUES ('delete', ?, ?, ?)",
+                           (note_id, old_title, previous))
+        cursor.execute('INSERT OR REPLACE INTO NoteBodies (note_id, compressed, body) VALUES (?, ?, ?)',
+                       (note_id,) + encode_body(content))
+        cursor.execute('INSERT INTO NotesFTS (rowid, title, content) VALUES (?, ?, ?)', (note_id, title, content))
+
+        spans = record.get('formatting') or {}
+        blob = Span_Codec.encode({name: [tuple(span) for span in name_spans] for name, name_spans in spans.items()})
+        if blob:
+            cursor.execute('INSERT OR REPLACE INTO Formatting (note_id, spans) VALUES (?, ?)', (note_id, blob))
+        else:
+            cursor.execute('DELETE FROM Formatting WHERE note_id = ?', (note_id,))
+
+        if content != previous:
+            notes_handler.revisions.record(cursor, note_id, content, previous)
+
+    # Remote changes are logged under their device so they are never exported back
+    cursor.execute('''
+        INSERT OR REPLACE INTO ChangeLog (note_uid, op, updated_at, device) VALUES (?, ?, ?, ?)
+    ''', (uid, record['op'], record['updated_at'], device))
+    return note_id
+
+
+def status(notes_handler, folder):
+    conn = notes_handler.conn
+    device = device_id(conn)
+    since = exported_seq(conn)
+    pending = conn.execute('SELECT COUNT(*) FROM ChangeLog WHERE seq > ? AND device IS NULL', (since,)).fetchone()[0]
+    peers = dict(conn.execute('SELECT device, applied_seq FROM SyncPeers'))
+
+    # Batches in the folder that import would apply, per device
+    incoming = {}
+    if os.path.isdir(folder):
+        for peer in os.listdir(folder):
+            directory = os.path.join(folder, peer)
+            if peer == device or not os.path.isdir(directory):
+                continue
+            waiting = [name for name in os.listdir(directory) if name.endswith(BATCH_SUFFIX)
+                       and int(name[:-len(BATCH_SUFFIX)]) > peers.get(peer, 0)]
+            if waiting:
+                incoming[peer] = len(waiting)
+    return {'device': device, 'exported_seq': since, 'pending_changes': pending,
+            'applied': peers, 'incoming_batches': incoming}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="Note_Sync.py", description="Sync Noteify notes through a shared folder")
+    parser.add_argument("--db", default="Data/notes.db")
+    parser.add_argument("command", choices=("sync", "export", "import", "status"))
+    parser.add_argument("folder")
+    args = parser.parse_args(argv)
+
+    notes_handler = Notes_Handler(args.db)
+    try:
+        if args.command in ("sync", "export"):
+            print(f"Exported {export_changes(notes_handler, args.folder)} changes")
+        if args.command in ("sync", "import"):
+            applied, skipped = import_changes(notes_handler, args.folder)
+            print(f"Applied {applied} changes, skipped {skipped} older than ours")
+        if args.command == "status":
+            print(json.dumps(status(notes_handler, args.folder), indent=4))
+    finally:
+        notes_handler.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
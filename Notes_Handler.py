@@ -1,119 +1,669 @@
 import os
+import re
 import json
+import logging
+from bisect import bisect_left
+import queue
 import sqlite3
 import shutil
+import threading
+import uuid
+import zlib
+from pathlib import Path
+
+import Span_Codec
+from Attachment_Store import Attachment_Store, ATTACHMENTS_DIR
+from Metrics import METRICS
+from Note_Cache import Note_Cache
+from Revision_Store import Revision_Store, compress
+
+# Words in a search box query; anything else (FTS5 operators, quotes) is dropped
+FTS_TOKEN = re.compile(r'\w+', re.UNICODE)
+# Words of context in a search result snippet
+SNIPPET_WORDS = 12
+
+# Bodies at least this many UTF-8 bytes are stored zlib-compressed
+COMPRESS_THRESHOLD = 2048
+
+# Note list orders for fetch_notes_page: sort column and direction, each
+# backed by a covering index on (column, id, title)
+NOTE_ORDERS = {
+    'updated': ('updated_at', 'DESC'),
+    'created': ('created_at', 'DESC'),
+    'title': ('title', 'ASC')
+}
+
+log = logging.getLogger(__name__)
+
+
+def encode_body(content):
+    """Return the (compressed, body) columns for a note's content."""
+    if content is None:
+        return 0, None
+    if len(content) * 4 >= COMPRESS_THRESHOLD:
+        data = content.encode('utf-8')
+        if len(data) >= COMPRESS_THRESHOLD:
+            packed = compress(content)
+            # Incompressible text is left as it is
+            if len(packed) < len(data):
+                return 1, packed
+    return 0, content
+
+
+def decode_body(compressed, body):
+    """Inverse of encode_body."""
+    if compressed:
+        return zlib.decompress(body).decode('utf-8')
+    return body
+
+
+def make_snippet(text, tokens, prefix_last, size=SNIPPET_WORDS):
+    """Up to `size` words of `text` around the densest run of matches, matches in [brackets].
+
+    `tokens` are the query's words; with `prefix_last` the last one also
+    matches words it begins. Returns None if nothing in `text` matches.
+    """
+    words = list(FTS_TOKEN.finditer(text or ""))
+    terms = [token.casefold() for token in tokens]
+    exact = set(terms[:-1] if prefix_last else terms)
+    prefix = terms[-1] if prefix_last else None
+
+    def matches(word):
+        word = word.casefold()
+        return word in exact or (prefix is not None and word.startswith(prefix))
+
+    hits = [i for i, word in enumerate(words) if matches(word.group())]
+    if not hits:
+        return None
+
+    # Start at the hit with the most other hits within the window
+    best = max(range(len(hits)), key=lambda n: bisect_left(hits, hits[n] + size) - n)
+    start = max(0, min(hits[best], len(words) - size))
+    end = min(len(words), start + size)
+
+    pieces = ["..." if start else ""]
+    position = words[start].start()
+    for i in range(start, end):
+        word = words[i]
+        pieces.append(text[position:word.start()])
+        pieces.append(f"[{word.group()}]" if matches(word.group()) else word.group())
+        position = word.end()
+    pieces.append("..." if end < len(words) else "")
+    return "".join(pieces)
+
 
 class Notes_Handler:
-    def __init__(self, file_path):
+    def __init__(self, file_path, attachments_dir=None):
         self.file_path = file_path
-        self.conn = sqlite3.connect(self.file_path)
+        # The read-write connection is created here but, once a DB_Worker is
+        # running, only used from its writer thread
+        self.conn = sqlite3.connect(self.file_path, check_same_thread=False)
         cursor = self.conn.cursor()
-        
-        # Create the Notes table
+
+        # WAL lets readers on other connections run while a save is committing
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+
+        # One read-only connection per reading thread
+        self.local = threading.local()
+        self.readers = []
+        self.readers_lock = threading.Lock()
+
+        # Recently opened notes, plus neighbours prefetched on a background thread
+        self.cache = Note_Cache()
+        METRICS.register("note_cache", self.cache.stats)
+        self.prefetch_queue = queue.Queue()
+        self.prefetch_thread = None
+
+
+        # Create the Notes table: metadata only, so listing and sorting never
+        # touch note bodies. `uid` identifies a note across synced copies of
+        # the database, where ids differ.
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS Notes (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 title TEXT NOT NULL,
-                content TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                uid TEXT
             )
         ''')
 
-        # Create the Tags table to store tags and their ranges
+        # One body per note, zlib-compressed above COMPRESS_THRESHOLD bytes
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Tags (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                note_id INTEGER,
-                tag_name TEXT,
-                start_index TEXT,
-                end_index TEXT,
+            CREATE TABLE IF NOT EXISTS NoteBodies (
+                note_id INTEGER PRIMARY KEY,
+                compressed INTEGER NOT NULL DEFAULT 0,
+                body BLOB,
+                FOREIGN KEY (note_id) REFERENCES Notes(id)
+            )
+        ''')
+
+        # Formatting for each note, stored as one Span_Codec blob per note
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS Formatting (
+                note_id INTEGER PRIMARY KEY,
+                spans BLOB NOT NULL,
                 FOREIGN KEY (note_id) REFERENCES Notes(id)
             )
         ''')
 
+        self.migrate_tags(cursor)
+        split = self.migrate_bodies(cursor)
+        self.migrate_uids(cursor)
+
+        # Content history: zlib snapshots with small deltas in between
+        self.revisions = Revision_Store()
+        self.revisions.create_table(cursor)
+
+        # Covering indexes: the note list pages by recency (or creation, or
+        # title) straight out of the index without visiting the table
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_notes_updated_list ON Notes (updated_at, id, title)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_notes_created_list ON Notes (created_at, id, title)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_notes_title_list ON Notes (title, id)')
+        cursor.execute('DROP INDEX IF EXISTS idx_notes_updated')
+
+        self.create_search_index(cursor)
+        self.create_change_log(cursor)
+
+        # Attached files live next to the database, stored once per content hash
+        if attachments_dir is None:
+            attachments_dir = ATTACHMENTS_DIR if file_path == ':memory:' else \
+                os.path.join(os.path.dirname(os.path.abspath(file_path)), "attachments")
+        self.attachments = Attachment_Store(attachments_dir)
+        self.attachments.create_tables(cursor)
+
         self.conn.commit()
 
+        # Reclaim the pages the old inline bodies took up
+        if split:
+            self.conn.execute('VACUUM')
+
+    def migrate_bodies(self, cursor):
+        """Move content out of an old-layout Notes table into NoteBodies. Returns True if it ran."""
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(Notes)')]
+        if 'content' not in columns:
+            return False
+
+        # The old search index and its triggers read Notes.content; the index
+        # is recreated and filled by create_search_index
+        for trigger in ('Notes_ai', 'Notes_ad', 'Notes_au'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        cursor.execute('DROP TABLE IF EXISTS NotesFTS')
+
+        reader = self.conn.cursor()
+        reader.execute('SELECT id, content FROM Notes')
+        while True:
+            rows = reader.fetchmany(1000)
+            if not rows:
+                break
+            cursor.executemany('INSERT OR REPLACE INTO NoteBodies (note_id, compressed, body) VALUES (?, ?, ?)',
+                               [(note_id,) + encode_body(content) for note_id, content in rows])
+
+        cursor.execute('ALTER TABLE Notes DROP COLUMN content')
+        return True
+
+    def migrate_uids(self, cursor):
+        """Give notes from before sync existed a uid."""
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(Notes)')]
+        if 'uid' not in columns:
+            cursor.execute('ALTER TABLE Notes ADD COLUMN uid TEXT')
+        cursor.execute('UPDATE Notes SET uid = lower(hex(randomblob(16))) WHERE uid IS NULL')
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_notes_uid ON Notes (uid)')
+
+    def create_change_log(self, cursor):
+        """Create the change log that Note_Sync exports from.
+
+        One row per note uid, replaced on every change, so `seq` is the
+        sequence number of the note's latest change and the log never holds
+        more rows than there are notes plus deletions. Deleted notes keep a
+        row as a tombstone. `device` is NULL for changes made here and names
+        the device for changes applied from a sync.
+        """
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ChangeLog'").fetchone()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ChangeLog (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                note_uid TEXT NOT NULL UNIQUE,
+                op TEXT NOT NULL,
+                updated_at TIMESTAMP NOT NULL,
+                device TEXT
+            )
+        ''')
+
+        # Notes written before the log existed are changes nobody has seen yet
+        if not exists:
+            cursor.execute('''
+                INSERT INTO ChangeLog (note_uid, op, updated_at)
+                SELECT uid, 'upsert', updated_at FROM Notes ORDER BY id
+            ''')
+
+    def migrate_tags(self, cursor):
+        """Fold rows from the old one-row-per-range Tags table into Formatting blobs."""
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Tags'").fetchone()
+        if not exists:
+            return
+
+        cursor.execute('''
+            SELECT Tags.note_id, Notes.content, Tags.tag_name, Tags.start_index, Tags.end_index
+            FROM Tags JOIN Notes ON Notes.id = Tags.note_id
+            ORDER BY Tags.note_id
+        ''')
+
+        rows = []
+        note_id, content, tags = None, None, []
+        for row in cursor.fetchall() + [(None, None, None, None, None)]:
+            if row[0] != note_id:
+                blob = Span_Codec.encode(Span_Codec.from_tags(content or "", tags)) if tags else None
+                if blob:
+                    rows.append((note_id, blob))
+                note_id, content, tags = row[0], row[1], []
+            tags.append({"tag_name": row[2], "start_index": row[3], "end_index": row[4]})
+
+        cursor.executemany('INSERT OR REPLACE INTO Formatting (note_id, spans) VALUES (?, ?)', rows)
+        cursor.execute('DROP TABLE Tags')
+
+    def create_search_index(self, cursor):
+        """Create the FTS5 index, and fill it if it is new."""
+        row = cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'NotesFTS'").fetchone()
+
+        # Earlier versions read the index's text from a view over a Python
+        # function, which left the database unreadable to any other program
+        if row is not None and "content=''" not in row[0]:
+            cursor.execute('DROP TABLE NotesFTS')
+            row = None
+        cursor.execute('DROP VIEW IF EXISTS NoteText')
+
+        # Contentless table: the text lives only in NoteBodies, FTS keeps the
+        # index plus 2/3-character prefix indexes for search-as-you-type.
+        # Bodies may be compressed, so SQL triggers can't feed the index;
+        # save_note/update_note maintain it with the plain text they already
+        # have, and search() builds snippets in Python.
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS NotesFTS USING fts5(
+                title, content, content='', prefix='2 3'
+            )
+        ''')
+
+        # Index notes that were written before the search index existed
+        if row is None:
+            self.index_notes(cursor)
+
+    def index_notes(self, cursor, first_id=0):
+        """Add notes with ids from `first_id` up to the search index."""
+        reader = self.conn.cursor()
+        reader.execute('''
+            SELECT Notes.id, Notes.title, NoteBodies.compressed, NoteBodies.body
+            FROM Notes LEFT JOIN NoteBodies ON NoteBodies.note_id = Notes.id
+            WHERE Notes.id >= ?
+        ''', (first_id,))
+        while True:
+            rows = reader.fetchmany(1000)
+            if not rows:
+                break
+            cursor.executemany('INSERT INTO NotesFTS (rowid, title, content) VALUES (?, ?, ?)',
+                               [(note_id, title, decode_body(compressed, body))
+                                for note_id, title, compressed, body in rows])
+
+    def note_text(self, cursor, note_id):
+        """Return a note's (title, content), or None if there is no such note."""
+        row = cursor.execute('''
+            SELECT Notes.title, NoteBodies.compressed, NoteBodies.body
+            FROM Notes LEFT JOIN NoteBodies ON NoteBodies.note_id = Notes.id
+            WHERE Notes.id = ?
+        ''', (note_id,)).fetchone()
+        if row is None:
+            return None
+        return row[0], decode_body(row[1], row[2])
+
+    @METRICS.timed("notes.save_note")
     def save_note(self, title, content, tags):
-        cursor = self.conn.cursor()
+        # Commits on success, rolls back if any statement fails
+        with self.conn:
+            cursor = self.conn.cursor()
 
-        # Insert the note into the database, including the HTML content
-        cursor.execute('INSERT INTO Notes (title, content) VALUES (?, ?)', (title, content))
-        note_id = cursor.lastrowid
+            # Insert the note's metadata, then its body
+            cursor.execute('INSERT INTO Notes (title, uid) VALUES (?, ?)', (title, uuid.uuid4().hex))
+            note_id = cursor.lastrowid
+            self._write_body(cursor, note_id, content)
+            cursor.execute('INSERT INTO NotesFTS (rowid, title, content) VALUES (?, ?, ?)', (note_id, title, content))
 
-        # Insert tags related to the note
-        for tag in tags:
-            tag_name = tag["tag_name"] 
-            start_index = tag["start_index"] 
-            end_index = tag["end_index"]
-            cursor.execute('INSERT INTO Tags (note_id, tag_name, start_index, end_index) VALUES (?, ?, ?, ?)', 
-                           (note_id, tag_name, start_index, end_index))
+            # Store all of the note's formatting as a single row
+            self._write_formatting(cursor, note_id, content, tags)
 
-        self.conn.commit()
+            self.revisions.record(cursor, note_id, content)
+            self._log_change(cursor, note_id)
+        return note_id
 
+    @METRICS.timed("notes.update_note")
     def update_note(self, note_id, title, content, tags):
+        """Replace a note's title, content and formatting. Returns False, writing nothing, if there is no such note."""
         cursor = self.conn.cursor()
 
-        # Update the note in the database
-        cursor.execute('''
-            UPDATE Notes
-            SET title = ?, content = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (title, content, note_id))
-
-        # Delete existing tags for this note
-        cursor.execute('DELETE FROM Tags WHERE note_id = ?', (note_id,))
-
-        # Insert the new tags related to the note
-        for tag in tags:
-            tag_name = tag["tag_name"]
-            start_index = tag["start_index"]
-            end_index = tag["end_index"]
-            cursor.execute('INSERT INTO Tags (note_id, tag_name, start_index, end_index) VALUES (?, ?, ?, ?)',
-                        (note_id, tag_name, start_index, end_index))
+        # The content being replaced is the base for the revision delta, and
+        # the old title and content are needed to take the note out of the index
+        row = self.note_text(cursor, note_id)
+        if row is None:
+            return False
+        previous = row[1]
 
-        self.conn.commit()
+        with self.conn:
+            # Update the note in the database
+            cursor.execute('''
+                UPDATE Notes
+                SET title = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (title, note_id))
+            # Only a change that reached a row may be logged, or sync would send it to other devices
+            updated = cursor.rowcount == 1
+
+            if title != row[0] or content != previous:
+                cursor.execute("INSERT INTO NotesFTS (NotesFTS, rowid, title, content) VALUES ('delete', ?, ?, ?)",
+                               (note_id, row[0], previous))
+                cursor.execute('INSERT INTO NotesFTS (rowid, title, content) VALUES (?, ?, ?)', (note_id, title, content))
+            if content != previous:
+                self._write_body(cursor, note_id, content)
+
+            # Replace the note's formatting blob
+            self._write_formatting(cursor, note_id, content, tags)
+
+            if content != previous:
+                self.revisions.record(cursor, note_id, content, previous)
+            if updated:
+                self._log_change(cursor, note_id)
+        self.cache.invalidate(note_id)
+        return updated
+
+    @METRICS.timed("notes.delete_note")
+    def delete_note(self, note_id):
+        """Delete a note with its body, formatting and history. Returns False if there was no such note."""
+        cursor = self.conn.cursor()
+        row = self.note_text(cursor, note_id)
+        if row is None:
+            return False
+        title, content = row
+        uid = cursor.execute('SELECT uid FROM Notes WHERE id = ?', (note_id,)).fetchone()[0]
+
+        with self.conn:
+            released = self.remove_note_rows(cursor, note_id, title, content)
+            # The tombstone tells synced copies to delete it too
+            cursor.execute('''
+                INSERT OR REPLACE INTO ChangeLog (note_uid, op, updated_at)
+                VALUES (?, 'delete', CURRENT_TIMESTAMP)
+            ''', (uid,))
+        self.cache.invalidate(note_id)
+        self.attachments.remove(released)
+        return True
+
+    def remove_note_rows(self, cursor, note_id, title, content):
+        """Delete every row of a note; `title` and `content` are its current text, which the index needs.
+
+        Returns the hashes of attachments no other note holds, whose files
+        are to be removed once the transaction commits.
+        """
+        cursor.execute("INSERT INTO NotesFTS (NotesFTS, rowid, title, content) VALUES ('delete', ?, ?, ?)",
+                       (note_id, title, content))
+        cursor.execute('DELETE FROM Formatting WHERE note_id = ?', (note_id,))
+        cursor.execute('DELETE FROM NoteBodies WHERE note_id = ?', (note_id,))
+        self.revisions.delete_note(cursor, note_id)
+        cursor.execute('DELETE FROM Notes WHERE id = ?', (note_id,))
+        return self.attachments.release(cursor, self.attachments.detach(cursor, note_id))
+
+    @METRICS.timed("notes.attach_file")
+    def attach_file(self, note_id, path, name=None):
+        """Attach the file at `path` to a note; returns the new attachment's dict (see list_attachments).
+
+        Raises KeyError if there is no such note.
+        """
+        cursor = self.conn.cursor()
+        if cursor.execute('SELECT 1 FROM Notes WHERE id = ?', (note_id,)).fetchone() is None:
+            raise KeyError(note_id)
+        # Hashing and copying happen before the transaction opens
+        sha256, size = self.attachments.put_file(path)
+        name = name or os.path.basename(path)
+        with self.conn:
+            position = self.attachments.attach(cursor, note_id, sha256, size, name)
+        return next(attachment for attachment in self.attachments.note_attachments(cursor, note_id)
+                    if attachment['position'] == position)
 
+    @METRICS.timed("notes.list_attachments")
+    def list_attachments(self, note_id):
+        """Return a note's attachments in order, as dicts of position, sha256, name, size, mime and added_at."""
+        return self.attachments.note_attachments(self.reader().cursor(), note_id)
+
+    @METRICS.timed("notes.detach_file")
+    def detach_file(self, note_id, position):
+        """Remove one attachment from a note, and its file if no other note holds it. Returns False if there was none."""
+        cursor = self.conn.cursor()
+        with self.conn:
+            dropped = self.attachments.detach(cursor, note_id, position)
+            released = self.attachments.release(cursor, dropped)
+        self.attachments.remove(released)
+        return bool(dropped)
+
+    def collect_attachments(self):
+        """Remove every stored file that no note holds any more, and orphaned thumbnails; returns how many files were removed."""
+        cursor = self.conn.cursor()
+        with self.conn:
+            released = self.attachments.release(cursor)
+        self.attachments.remove(released)
+        self.attachments.sweep_thumbnails()
+        return len(released)
+
+    @METRICS.timed("notes.get_note_by_id")
     def get_note_by_id(self, note_id):
+        note = self.cache.get(note_id)
+        if note is not None:
+            return note
+
+        generation = self.cache.generation
+        note = self._load_note(self.reader(), note_id)
+        if note is not None:
+            self.cache.put(note_id, note, generation)
+        return note
+
+    def reader(self):
+        """Return this thread's read-only connection, opening it on first use."""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            if self.file_path == ':memory:':
+                return self.conn
+            uri = Path(os.path.abspath(self.file_path)).as_uri() + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self.local.conn = conn
+            with self.readers_lock:
+                self.readers.append(conn)
+        return conn
+
+    def close(self):
+        """Checkpoint the WAL into the main file and close every connection."""
+        with self.readers_lock:
+            for conn in self.readers:
+                conn.close()
+            self.readers.clear()
+        self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self.conn.close()
+
+    def prefetch(self, note_ids):
+        """Load notes into the cache on a background thread, e.g. the neighbours of the selection."""
+        if self.prefetch_thread is None:
+            self.prefetch_thread = threading.Thread(target=self._prefetch_worker, name="NotePrefetch", daemon=True)
+            self.prefetch_thread.start()
+        self.prefetch_queue.put(list(note_ids))
+
+    @METRICS.timed("notes.list_revisions")
+    def list_revisions(self, note_id):
+        """Return (rev, created_at, kind, stored_bytes) for each saved revision, newest first."""
+        return self.revisions.list_revisions(self.reader(), note_id)
+
+    @METRICS.timed("notes.get_revision")
+    def get_revision(self, note_id, rev):
+        """Rebuild the content of one revision of a note."""
+        return self.revisions.get_revision(self.reader(), note_id, rev)
+
+    @METRICS.timed("notes.thin_revisions")
+    def thin_revisions(self, note_id, **policy):
+        """Drop old revisions of a note according to Revision_Store.thin's retention policy."""
         cursor = self.conn.cursor()
+        with self.conn:
+            removed = self.revisions.thin(cursor, note_id, **policy)
+        return removed
+
+    def cache_stats(self):
+        """Hit/miss/eviction counters and current size of the note cache."""
+        return self.cache.stats()
+
+    def _prefetch_worker(self):
+        # The prefetcher gets its own read-only connection
+        conn = self.reader()
+        while True:
+            note_ids = self.prefetch_queue.get()
+            for note_id in note_ids:
+                if self.cache.contains(note_id):
+                    continue
+                try:
+                    generation = self.cache.generation
+                    note = self._load_note(conn, note_id)
+                    if note is not None:
+                        self.cache.put(note_id, note, generation)
+                except sqlite3.Error as e:
+                    log.warning("Prefetch failed for note %s: %s", note_id, e)
+
+    def _load_note(self, conn, note_id):
+        cursor = conn.cursor()
 
         # Query the note data by ID
-        cursor.execute('SELECT * FROM Notes WHERE id = ?', (note_id,))
+        cursor.execute('''
+            SELECT Notes.id, Notes.title, NoteBodies.compressed, NoteBodies.body, Notes.created_at, Notes.updated_at
+            FROM Notes LEFT JOIN NoteBodies ON NoteBodies.note_id = Notes.id
+            WHERE Notes.id = ?
+        ''', (note_id,))
         note = cursor.fetchone()
 
         if note:
-            # Adjusted indexes based on a typical 5-column schema
+            content = decode_body(note[2], note[3])
             note_data = {
                 'id': note[0],
                 'title': note[1],
-                'content': note[2],
-                'created_at': note[3] if len(note) > 3 else None,
-                'updated_at': note[4] if len(note) > 4 else None
+                'content': content,
+                'created_at': note[4],
+                'updated_at': note[5]
             }
 
-            # Query the tags related to this note
-            cursor.execute('SELECT * FROM Tags WHERE note_id = ?', (note_id,))
-            tags = cursor.fetchall()
-
-            # Create a list to store all tag data
-            tag_data = []
-            for tag in tags:
-                tag_data.append({
-                    'id': tag[0],
-                    'note_id': tag[1],
-                    'tag_name': tag[2],
-                    'start_index': tag[3],
-                    'end_index': tag[4]
-                })
+            # Formatting is keyed by note_id, so this is a single primary key lookup
+            cursor.execute('SELECT spans FROM Formatting WHERE note_id = ?', (note_id,))
+            row = cursor.fetchone()
+            spans = Span_Codec.decode(row[0]) if row else {}
+
+            tag_data = Span_Codec.to_tags(content or "", spans)
+            for tag in tag_data:
+                tag['note_id'] = note_id
 
             # Return both note and its associated tags
             return note_data, tag_data
         else:
             return None
-        
+
+    @METRICS.timed("notes.fetch_notes")
     def fetch_notes(self):
         """Fetch all notes from the database."""
-        cursor = self.conn.cursor()
+        cursor = self.reader().cursor()
         cursor.execute('SELECT id, title FROM Notes')
         notes = cursor.fetchall()  # This will return a list of tuples (id, title)
         return notes
+
+    @METRICS.timed("notes.fetch_notes_page")
+    def fetch_notes_page(self, after=None, limit=200, order='updated'):
+        """Fetch one page of (id, title, sort_key) in one of the NOTE_ORDERS.
+
+        The default, 'updated', lists the most recently updated first with
+        updated_at as the sort key. `after` is the (sort_key, id) of the last
+        row of the previous page; pages come straight out of a covering index
+        rather than with OFFSET.
+        """
+        column, direction = NOTE_ORDERS[order]
+        compare = '<' if direction == 'DESC' else '>'
+        cursor = self.reader().cursor()
+        if after is None:
+            cursor.execute(f'''
+                SELECT id, title, {column} FROM Notes
+                ORDER BY {column} {direction}, id {direction}
+                LIMIT ?
+            ''', (limit,))
+        else:
+            cursor.execute(f'''
+                SELECT id, title, {column} FROM Notes
+                WHERE ({column}, id) {compare} (?, ?)
+                ORDER BY {column} {direction}, id {direction}
+                LIMIT ?
+            ''', (after[0], after[1], limit))
+        return cursor.fetchall()
+
+    def _log_change(self, cursor, note_id):
+        # Replacing the note's row moves it to the end of the log with a new seq
+        cursor.execute('''
+            INSERT OR REPLACE INTO ChangeLog (note_uid, op, updated_at)
+            SELECT uid, 'upsert', updated_at FROM Notes WHERE id = ?
+        ''', (note_id,))
+
+    def _write_body(self, cursor, note_id, content):
+        cursor.execute('INSERT OR REPLACE INTO NoteBodies (note_id, compressed, body) VALUES (?, ?, ?)',
+                       (note_id,) + encode_body(content))
+
+    def _write_formatting(self, cursor, note_id, content, tags):
+        blob = Span_Codec.encode(Span_Codec.from_tags(content or "", tags))
+        if blob:
+            cursor.execute('INSERT OR REPLACE INTO Formatting (note_id, spans) VALUES (?, ?)', (note_id, blob))
+        else:
+            cursor.execute('DELETE FROM Formatting WHERE note_id = ?', (note_id,))
+
+    @METRICS.timed("notes.search")
+    def search(self, query, limit=20, offset=0):
+        """Full-text search over titles and content.
+
+        Returns a ranked list of (id, title, snippet) tuples, best match first,
+        with matched terms wrapped in [brackets] in the snippet.
+        """
+        match = self._fts_query(query)
+        if not match:
+            return []
+
+        cursor = self.reader().cursor()
+        # Title hits weigh more than body hits in the bm25 rank
+        cursor.execute('''
+            SELECT Notes.id, Notes.title, NoteBodies.compressed, NoteBodies.body
+            FROM NotesFTS
+            JOIN Notes ON Notes.id = NotesFTS.rowid
+            LEFT JOIN NoteBodies ON NoteBodies.note_id = Notes.id
+            WHERE NotesFTS MATCH ?
+            ORDER BY bm25(NotesFTS, 10.0, 1.0)
+            LIMIT ? OFFSET ?
+        ''', (match, limit, offset))
+
+        # The index holds no text, so snippets come from the bodies themselves
+        tokens = FTS_TOKEN.findall(query)
+        prefix_last = len(tokens[-1]) >= 2
+        results = []
+        for note_id, title, compressed, body in cursor.fetchall():
+            content = decode_body(compressed, body)
+            snippet = make_snippet(content, tokens, prefix_last) or make_snippet(title, tokens, prefix_last)
+            if snippet is None:
+                # Matched through the tokenizer's folding (e.g. accents) rather than as typed
+                snippet = " ".join(FTS_TOKEN.findall(content or "")[:SNIPPET_WORDS])
+            results.append((note_id, title, snippet))
+        return results
+
+    def _fts_query(self, text):
+        # Quote each word so user input is never parsed as FTS syntax, and
+        # prefix-match the last one so results update while typing. A single
+        # character prefix would match most of the index, so it stays exact.
+        tokens = FTS_TOKEN.findall(text)
+        if not tokens:
+            return None
+        terms = [f'"{token}"' for token in tokens]
+        if len(tokens[-1]) >= 2:
+            terms[-1] += '*'
+        return ' '.join(terms)
@@ -0,0 +1,251 @@
+import logging
+import queue
+from abc import ABC, abstractmethod
+import threading
+import time
+
+from Metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+# Sentinel that tells the worker to exit once everything before it is sent
+_STOP = object()
+
+
+class Notification_Backend(ABC):
+    """Something that can show a notification. notify() may block or hang; the dispatcher copes."""
+
+    @abstractmethod
+    def notify(self, title, message):
+        """Show one notification."""
+
+
+class Plyer_Backend(Notification_Backend):
+    def notify(self, title, message):
+        # Imported on first use so headless runs never load plyer
+        from plyer import notification
+        notification.notify(
+            title=title,
+            message=message
+        ) # type: ignore
+
+
+class Stub_Backend(Notification_Backend):
+    """Records notifications instead of showing them, for tests and benchmarks."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def notify(self, title, message):
+        if self.delay:
+            time.sleep(self.delay)
+        with self.lock:
+            self.sent.append((title, message, time.monotonic()))
+
+
+class Notification_Dispatcher:
+    """Delivers notifications from a bounded queue on its own worker thread.
+
+    Notifications arriving within `coalesce_window` seconds of each other are
+    merged into one summary, at most `rate_limit` notifications are shown per
+    `rate_period` seconds (extra ones keep coalescing while they wait), and a
+    backend call that takes longer than `timeout` is abandoned so it can't
+    hold up the reminders behind it. Backend calls run on one long-lived
+    thread; while it is stuck in an abandoned call, later notifications are
+    dropped rather than piling up behind it.
+    """
+
+    def __init__(self, backend=None, max_queue=1000, coalesce_window=0.5, max_batch=50,
+                 rate_limit=5, rate_period=60.0, timeout=10.0):
+        self.backend = backend or Plyer_Backend()
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.coalesce_window = coalesce_window
+        self.max_batch = max_batch
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.timeout = timeout
+
+        # Token bucket for the rate limit
+        self.tokens = float(rate_limit)
+        self.refilled = time.monotonic()
+
+        self.lock = threading.Lock()
+        self.thread = None
+        self.closed = False
+        # The thread that calls the backend, and whether it is free for the next call
+        self.caller = None
+        self.calls = queue.Queue()
+        self.call_done = threading.Event()
+        self.call_done.set()
+        self.idle = threading.Event()
+        self.idle.set()
+        # Set by close() so a worker waiting out the rate limit sends at once
+        self.closing = threading.Event()
+
+        self.submitted = 0
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.timeouts = 0
+        self.failures = 0
+        METRICS.register("notifications", self.stats)
+
+    def submit(self, title, message):
+        """Queue a notification without blocking; returns False if the queue is full or the dispatcher closed."""
+        self.start()
+        # Cleared together with the put, so the worker can't mark an empty
+        # queue idle in between and let flush() return early
+        with self.lock:
+            if self.closed:
+                self.dropped += 1
+                log.warning("Notification dispatcher closed, dropped: %s", title)
+                return False
+            self.idle.clear()
+            try:
+                self.queue.put_nowait((title, message))
+            except queue.Full:
+                self.dropped += 1
+                log.warning("Notification queue full, dropped: %s", title)
+                return False
+        self.submitted += 1
+        return True
+
+    def start(self):
+        """Start the worker; does nothing once close() has been called."""
+        with self.lock:
+            if self.thread is None and not self.closed:
+                self.thread = threading.Thread(target=self._run, name="Notifications", daemon=True)
+                self.thread.start()
+
+    def flush(self, timeout=None):
+        """Wait until every queued notification has been handed to the backend."""
+        return self.idle.wait(timeout)
+
+    def close(self, timeout=None):
+        """Deliver what is queued (within `timeout`) and stop the worker. Later submits are dropped."""
+        with self.lock:
+            self.closed = True
+            thread = self.thread
+        if thread is None:
+            return True
+        self.closing.set()
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return False
+        thread.join(timeout)
+        # The caller exits once it is out of the backend, if it is stuck in it
+        self.calls.put(_STOP)
+        return not thread.is_alive()
+
+    def stats(self):
+        return {
+            'submitted': self.submitted,
+            'delivered': self.delivered,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'timeouts': self.timeouts,
+            'failures': self.failures,
+            'queued': self.queue.qsize()
+        }
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                self.idle.set()
+                return
+
+            batch = [item]
+            stopping = self._gather(batch, self.coalesce_window)
+
+            # Out of tokens: keep folding new arrivals into this batch until one frees up
+            wait = self._take_token()
+            while wait > 0 and not stopping:
+                if len(batch) >= self.max_batch:
+                    # Nothing more fits: sleep until the token is due, or until close()
+                    if self.closing.wait(wait):
+                        break
+                else:
+                    stopping = self._gather(batch, wait)
+                wait = self._take_token()
+
+            title, message = self._summarize(batch)
+            self.coalesced += len(batch) - 1
+            self._deliver(title, message)
+
+            if stopping:
+                self.idle.set()
+                return
+            with self.lock:
+                if self.queue.empty():
+                    self.idle.set()
+
+    def _gather(self, batch, window):
+        """Add notifications arriving within `window` seconds to the batch. Returns True on stop."""
+        deadline = time.monotonic() + window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                return False
+            if item is _STOP:
+                return True
+            batch.append(item)
+        return False
+
+    def _take_token(self):
+        """Take a rate-limit token, or return how many seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(float(self.rate_limit),
+                          self.tokens + (now - self.refilled) * self.rate_limit / self.rate_period)
+        self.refilled = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) * self.rate_period / self.rate_limit
+
+    def _summarize(self, batch):
+        if len(batch) == 1:
+            return batch[0]
+        lines = [f"{title}: {message}" if message else title for title, message in batch[:5]]
+        if len(batch) > 5:
+            lines.append(f"...and {len(batch) - 5} more")
+        return f"{len(batch)} reminders", "\n".join(lines)
+
+    def _deliver(self, title, message):
+        # The backend runs on the caller thread so a hung call only costs `timeout`
+        if not self.call_done.is_set():
+            # Still stuck in a call abandoned earlier; one hung thread is the most we keep
+            self.dropped += 1
+            log.warning("Notification backend still busy, dropped: %s", title)
+            return
+        if self.caller is None:
+            self.caller = threading.Thread(target=self._call, name="NotificationCall", daemon=True)
+            self.caller.start()
+
+        self.call_done.clear()
+        self.calls.put((title, message))
+        with METRICS.timer("notification.deliver"):
+            finished = self.call_done.wait(self.timeout)
+        if not finished:
+            self.timeouts += 1
+            log.warning("Notification timed out after %ss: %s", self.timeout, title)
+
+    def _call(self):
+        while True:
+            item = self.calls.get()
+            if item is _STOP:
+                return
+            title, message = item
+            try:
+                self.backend.notify(title, message)
+                self.delivered += 1
+            except Exception as e:
+                self.failures += 1
+                log.error("Notification failed: %s", e)
+            finally:
+                self.call_done.set()
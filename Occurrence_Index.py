@@ -0,0 +1,138 @@
+import logging
+import threading
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from Recurrence import reminder_rule, to_seconds, from_seconds
+
+log = logging.getLogger(__name__)
+
+# How far ahead the timeline looks
+HORIZON_DAYS = 30
+# Reminders with more occurrences than this are removed by one filtering pass
+# over the index instead of one bisect-and-delete per occurrence
+FILTER_REMOVE_AT = 32
+
+
+class Occurrence_Index:
+    """Every reminder occurrence from now to `horizon_days` ahead, in time order.
+
+    The index is a sorted list of (seconds, reminder_id), so row n of the
+    timeline is entries[n] and views can slice out just the rows on screen.
+    It is maintained incrementally: adding or removing a reminder touches
+    only that reminder's occurrences, and advance() drops the past and
+    computes only the newly uncovered stretch at the far end.
+    """
+
+    def __init__(self, horizon_days=HORIZON_DAYS):
+        self.horizon = timedelta(days=horizon_days)
+        self.lock = threading.RLock()
+        self.entries = []
+        # reminder_id -> array('q') of its occurrences in the window
+        self.times = {}
+        # reminder_id -> (Rule or one-time seconds, title)
+        self.sources = {}
+        self.start = None
+        self.end = None
+        # Bumped on every change so a view knows to redraw
+        self.version = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def reset(self, now, reminders=()):
+        """Start over with the window at `now` and index `reminders` in one sort."""
+        with self.lock:
+            self.entries = []
+            self.times.clear()
+            self.sources.clear()
+            self.start = to_seconds(now)
+            self.end = to_seconds(now + self.horizon)
+            found = []
+            for reminder in reminders:
+                found.extend(self._index(reminder))
+            self.entries.extend(found)
+            self.entries.sort()
+            self.version += 1
+
+    def add(self, reminder):
+        """Index one reminder (a dict or Reminder record)."""
+        with self.lock:
+            if self.start is None:
+                # Not loaded yet; reset() will pick it up
+                return
+            if reminder['id'] in self.sources:
+                self.remove(reminder['id'])
+            for entry in self._index(reminder):
+                insort(self.entries, entry)
+            self.version += 1
+
+    def remove(self, reminder_id):
+        with self.lock:
+            self.sources.pop(reminder_id, None)
+            times = self.times.pop(reminder_id, None)
+            if not times:
+                return
+            if len(times) > FILTER_REMOVE_AT:
+                self.entries = [entry for entry in self.entries if entry[1] != reminder_id]
+            else:
+                for seconds in times:
+                    position = bisect_left(self.entries, (seconds, reminder_id))
+                    if position < len(self.entries) and self.entries[position] == (seconds, reminder_id):
+                        del self.entries[position]
+            self.version += 1
+
+    def advance(self, now):
+        """Move the window to start at `now`, computing only the stretch that came into range."""
+        with self.lock:
+            start = to_seconds(now)
+            end = to_seconds(now + self.horizon)
+            if self.start is None or start <= self.start:
+                return
+            del self.entries[:bisect_left(self.entries, (start,))]
+            for times in self.times.values():
+                del times[:bisect_left(times, start)]
+
+            if end > self.end:
+                found = []
+                for reminder_id, (source, title) in self.sources.items():
+                    if isinstance(source, int):
+                        new = [source] if self.end <= source < end else []
+                    else:
+                        new = source.occurrences(from_seconds(self.end), from_seconds(end))
+                    self.times[reminder_id].extend(new)
+                    found.extend((seconds, reminder_id) for seconds in new)
+                # Everything found lies past the old end, so it sorts onto the tail
+                found.sort()
+                self.entries.extend(found)
+            self.start, self.end = start, max(end, self.end)
+            self.version += 1
+
+    def rows(self, first, count):
+        """(datetime, reminder_id, title) for rows first .. first + count - 1."""
+        with self.lock:
+            return [(from_seconds(seconds), reminder_id, self.sources[reminder_id][1])
+                    for seconds, reminder_id in self.entries[first:first + count]]
+
+    def row_at(self, moment):
+        """Index of the first row at or after `moment`, e.g. to jump to a day."""
+        with self.lock:
+            return bisect_left(self.entries, (to_seconds(moment),))
+
+    def _index(self, reminder):
+        # Records the reminder's occurrences in the window and returns them as entries
+        reminder_id = reminder['id']
+        try:
+            if reminder['recurring'] or reminder.get('rule'):
+                source = reminder_rule(reminder, from_seconds(self.start).date())
+                times = source.occurrences(from_seconds(self.start), from_seconds(self.end))
+            else:
+                source = to_seconds(datetime.strptime(f"{reminder['date']} {reminder['time']}", "%Y-%m-%d %H:%M"))
+                times = array('q', [source] if self.start <= source < self.end else [])
+        except (TypeError, ValueError) as e:
+            log.warning("Reminder %s left off the timeline: %s", reminder_id, e)
+            return []
+        self.sources[reminder_id] = (source, reminder['title'])
+        self.times[reminder_id] = times
+        return [(seconds, reminder_id) for seconds in times]
@@ -0,0 +1,192 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from calendar import monthrange
+from datetime import datetime, timedelta
+
+# Rule times are whole seconds since this naive (local time) epoch
+EPOCH = datetime(1970, 1, 1)
+# Returned by Rule.next_seconds for rules with no further occurrences
+NEVER = -1
+
+HOURLY = "HOURLY"
+DAILY = "DAILY"
+WEEKLY = "WEEKLY"
+MONTHLY = "MONTHLY"
+
+WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+
+
+def to_seconds(moment):
+    return (moment - EPOCH) // timedelta(seconds=1)
+
+
+def from_seconds(seconds):
+    return EPOCH + timedelta(seconds=seconds)
+
+
+class Rule:
+    """An RRULE-style recurrence anchored at a start datetime.
+
+    Stored as a compact string such as "FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH;COUNT=10"
+    next to the reminder's date and time, which supply the start. Occurrences
+    form a sorted sequence that is never materialized: nth(n) computes the
+    n-th occurrence and count_through(t) how many fall at or before t, both in
+    O(1) (O(log k) for k weekdays), so the next occurrence and any range are
+    found without walking the ones before them.
+
+    MONTHLY rules repeat on the start's day of month, or on BYMONTHDAY; days
+    past the end of a shorter month fall on its last day.
+    """
+    __slots__ = ('freq', 'interval', 'weekdays', 'month_day', 'until', 'count',
+                 'start', '_step', '_base', '_offsets', '_skip', '_month', '_time')
+
+    def __init__(self, freq, start, interval=1, weekdays=None, month_day=None, until=None, count=None):
+        if freq not in (HOURLY, DAILY, WEEKLY, MONTHLY):
+            raise ValueError(f"Unsupported frequency: {freq}")
+        if interval < 1:
+            raise ValueError("INTERVAL must be at least 1")
+        self.freq = freq
+        self.interval = interval
+        self.start = to_seconds(start)
+        self.until = to_seconds(until) if until is not None else None
+        self.count = count
+
+        self.weekdays = tuple(sorted(set(weekdays))) if weekdays else (start.weekday(),)
+        self.month_day = month_day or start.day
+        self._step = self._base = self._skip = self._month = self._time = 0
+        self._offsets = ()
+
+        if freq in (HOURLY, DAILY):
+            self._step = interval * (HOUR if freq == HOURLY else DAY)
+        elif freq == WEEKLY:
+            # Occurrences are offsets into every `interval`-th week, counted
+            # from the Monday of the start's week; ones before the start are skipped
+            monday = start.date() - timedelta(days=start.weekday())
+            self._base = to_seconds(datetime.combine(monday, datetime.min.time()))
+            time_of_day = self.start - to_seconds(datetime.combine(start.date(), datetime.min.time()))
+            self._offsets = tuple(day * DAY + time_of_day for day in self.weekdays)
+            self._skip = bisect_left(self._offsets, self.start - self._base)
+        else:
+            self._month = start.year * 12 + start.month - 1
+            self._time = self.start - to_seconds(datetime.combine(start.date(), datetime.min.time()))
+            self._skip = 1 if self._month_occurrence(self._month) < self.start else 0
+
+    @classmethod
+    def parse(cls, text, start):
+        """Build a rule from its stored string and the reminder's start datetime."""
+        fields = {}
+        for part in text.split(';'):
+            if part:
+                key, _, value = part.partition('=')
+                fields[key.strip().upper()] = value.strip()
+
+        weekdays = None
+        if fields.get('BYDAY'):
+            days = [day.strip().upper() for day in fields['BYDAY'].split(',')]
+            unknown = [day for day in days if day not in WEEKDAYS]
+            if unknown:
+                raise ValueError(f"Unknown BYDAY weekday: {', '.join(unknown)}")
+            weekdays = [WEEKDAYS.index(day) for day in days]
+        until = None
+        if fields.get('UNTIL'):
+            until = datetime.strptime(fields['UNTIL'], "%Y%m%dT%H%M")
+        return cls(fields.get('FREQ', DAILY).upper(), start,
+                   interval=int(fields.get('INTERVAL', 1)),
+                   weekdays=weekdays,
+                   month_day=int(fields['BYMONTHDAY']) if fields.get('BYMONTHDAY') else None,
+                   until=until,
+                   count=int(fields['COUNT']) if fields.get('COUNT') else None)
+
+    @classmethod
+    def daily(cls, time_str, start_date):
+        """The rule behind a legacy `recurring: true` reminder: every day at HH:MM."""
+        return cls(DAILY, datetime.combine(start_date, datetime.strptime(time_str, "%H:%M").time()))
+
+    def format(self):
+        parts = [f"FREQ={self.freq}"]
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.freq == WEEKLY:
+            parts.append("BYDAY=" + ",".join(WEEKDAYS[day] for day in self.weekdays))
+        if self.freq == MONTHLY:
+            parts.append(f"BYMONTHDAY={self.month_day}")
+        if self.until is not None:
+            parts.append(f"UNTIL={from_seconds(self.until):%Y%m%dT%H%M}")
+        if self.count is not None:
+            parts.append(f"COUNT={self.count}")
+        return ";".join(parts)
+
+    def nth(self, n):
+        """Seconds of the n-th occurrence (0-based), ignoring COUNT and UNTIL."""
+        if self._step:
+            return self.start + n * self._step
+        if self.freq == WEEKLY:
+            n += self._skip
+            weeks, index = divmod(n, len(self._offsets))
+            return self._base + weeks * self.interval * WEEK + self._offsets[index]
+        return self._month_occurrence(self._month + (n + self._skip) * self.interval)
+
+    def count_through(self, seconds):
+        """How many occurrences fall at or before `seconds`, ignoring COUNT and UNTIL."""
+        if seconds < self.start:
+            return 0
+        if self._step:
+            return (seconds - self.start) // self._step + 1
+        if self.freq == WEEKLY:
+            period = self.interval * WEEK
+            weeks, rest = divmod(seconds - self._base, period)
+            return weeks * len(self._offsets) + bisect_right(self._offsets, rest) - self._skip
+
+        moment = from_seconds(seconds)
+        months = (moment.year * 12 + moment.month - 1 - self._month) // self.interval
+        if self._month_occurrence(self._month + months * self.interval) > seconds:
+            months -= 1
+        return months + 1 - self._skip
+
+    def limit(self):
+        """Number of occurrences the rule allows, or None when it runs forever."""
+        limit = self.count
+        if self.until is not None:
+            through = self.count_through(self.until)
+            limit = through if limit is None else min(limit, through)
+        return limit
+
+    def next_after(self, moment):
+        """The first occurrence strictly after `moment`, or None once the rule has ended."""
+        seconds = self.next_seconds(to_seconds(moment))
+        return None if seconds == NEVER else from_seconds(seconds)
+
+    def next_seconds(self, seconds):
+        index = self.count_through(seconds)
+        limit = self.limit()
+        if limit is not None and index >= limit:
+            return NEVER
+        return self.nth(index)
+
+    def occurrences(self, start, end):
+        """Seconds of every occurrence in [start, end) as an array('q')."""
+        first = self.count_through(to_seconds(start) - 1)
+        last = self.count_through(to_seconds(end) - 1)
+        limit = self.limit()
+        if limit is not None:
+            last = min(last, limit)
+        return array('q', map(self.nth, range(first, last)))
+
+    def _month_occurrence(self, month):
+        year, month = divmod(month, 12)
+        day = min(self.month_day, monthrange(year, month + 1)[1])
+        return to_seconds(datetime(year, month + 1, day)) + self._time
+
+
+def reminder_rule(reminder, today):
+    """The Rule for a recurring reminder dict; legacy ones without a stored rule repeat daily."""
+    start_date = datetime.strptime(reminder['date'], "%Y-%m-%d").date() if reminder.get('date') else today
+    if reminder.get('rule'):
+        start = datetime.combine(start_date, datetime.strptime(reminder['time'], "%H:%M").time())
+        return Rule.parse(reminder['rule'], start)
+    return Rule.daily(reminder['time'], start_date)
@@ -1,55 +1,159 @@
-import os
-import json
+import logging
+import time
+from datetime import datetime
+
+from Recurrence import reminder_rule
 from Scheduler import Scheduler
+from Reminder_Store import Reminder_Store
+from Reminder_Registry import Reminder, Reminder_Registry
+from Occurrence_Index import Occurrence_Index
+
+log = logging.getLogger(__name__)
+
+# list_reminders orders
+REMINDER_ORDERS = ('next', 'title', 'id')
+
+
+def validate_reminder(reminder):
+    """Raise ValueError if a reminder's time, date or rule could not be scheduled."""
+    try:
+        datetime.strptime(reminder['time'], "%H:%M")
+        if reminder.get('date'):
+            datetime.strptime(reminder['date'], "%Y-%m-%d")
+        elif not (reminder.get('recurring') or reminder.get('rule')):
+            raise ValueError("A one-time reminder needs a date")
+        if reminder.get('rule'):
+            reminder_rule(reminder, datetime.now().date())
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid reminder: {e}") from e
+
 
 class Reminder_Handler:
-    def __init__(self, File_Path):
-        self.reminders = []
-        self.scheduler = Scheduler()
+    def __init__(self, File_Path, clock=None, legacy_path=None, dispatcher=None):
+        # Reminder records by id, each holding its scheduled Job
+        self.reminders = Reminder_Registry()
+        if clock:
+            self.scheduler = Scheduler(clock, dispatcher)
+        else:
+            self.scheduler = Scheduler(dispatcher=dispatcher)
+        # Keep the next-fire index current as jobs fire and re-arm
+        self.scheduler.on_fired = self.reminders.job_fired
+        # Occurrences over the coming weeks for the timeline view
+        self.occurrences = Occurrence_Index()
         self.file_path = File_Path
+        self.legacy_path = legacy_path
+        self.store = Reminder_Store(File_Path)
 
     def create_reminder(self, reminder):
-        self.reminders.append(reminder)
-        recurring = reminder['recurring']
-        if recurring == True:
-            self.scheduler.schedule_recurring(reminder=reminder)
-        else: 
-# Implement a way to get
-# the job returned here so
-# that I can store it in as 
-# the reminders unique ID
-            self.scheduler.schedule_once(reminder=reminder)
-
-    def delete_reminder(self):
-        return False
-    #TODO
+        """Store and schedule a reminder; returns its Job, or None.
+
+        Raises ValueError, storing nothing, if it could not be scheduled.
+        """
+        validate_reminder(reminder)
+        # Persist first so the reminder survives a crash before shutdown
+        reminder['id'] = self.store.add(reminder)
+        record = self.reminders.add(Reminder.from_dict(reminder))
+        self.occurrences.add(record)
+        return self._schedule(record)
+
+    def delete_reminder(self, reminder_id):
+        deleted = self.store.delete(reminder_id)
+        record = self.reminders.remove(reminder_id)
+        if record is not None and record.job is not None:
+            self.scheduler.cancel(record.job)
+        self.occurrences.remove(reminder_id)
+        return deleted
+
+    def update_reminder(self, reminder_id, **changes):
+        """Change a reminder's fields and reschedule it; returns the new Job, or None.
 
+        Raises KeyError for an unknown reminder id or field, and ValueError,
+        changing nothing, if the result could not be scheduled.
+        """
+        if reminder_id not in self.reminders:
+            raise KeyError(reminder_id)
+        # A rule makes a reminder recurring, as it does in Reminder_Store.add
+        if changes.get('rule'):
+            changes['recurring'] = True
+        validate_reminder(dict(self.reminders.get(reminder_id).to_dict(), **changes))
+        self.store.update(reminder_id, changes)
+        record = self.reminders.update(reminder_id, **changes)
+        if record.job is not None:
+            self.scheduler.cancel(record.job)
+            record.job = None
+        self.occurrences.add(record)
+        return self._schedule(record)
+
+    def get_reminder(self, reminder_id):
+        record = self.reminders.get(reminder_id)
+        return record.to_dict() if record is not None else None
+
+    def list_reminders(self, order='next', limit=None):
+        """Reminders as dicts, by next fire time (scheduled ones only), title or id."""
+        if order == 'next':
+            records = self.reminders.upcoming(limit)
+        elif order == 'title':
+            records = self.reminders.by_title_prefix("", limit)
+        elif order == 'id':
+            records = sorted(self.reminders, key=lambda record: record.id)[:limit]
+        else:
+            raise ValueError(f"Unknown reminder order: {order}")
+        return [record.to_dict() for record in records]
+
+    def timeline(self):
+        """The Occurrence_Index, moved up to the current time."""
+        self.occurrences.advance(self.scheduler.clock())
+        return self.occurrences
 
     def check_reminders(self):
         self.scheduler.run_pending()
 
     def save_reminders(self):
+        # Every create/delete is already committed; just fold the WAL back in
         try:
-            if os.path.exists(self.file_path):
-                with open(self.file_path, 'w') as f:
-                    json.dump(self.reminders, f, indent=4)
+            self.store.checkpoint()
         except Exception as e:
-            print(f"Failed to save reminders: {e}")
-            
+            log.error("Failed to save reminders: %s", e)
+
+    def close(self, timeout=None):
+        """Stop the scheduler, deliver queued notifications and close the store, all within `timeout`.
+
+        Returns False if the scheduler or the notification queue did not finish in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def remaining():
+            return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+        stopped = self.scheduler.stop(remaining())
+        drained = self.scheduler.dispatcher.close(remaining())
+        self.save_reminders()
+        self.store.close()
+        return stopped and drained
 
     def load_reminders(self):
         try:
-            if os.path.exists(self.file_path):
-                with open(self.file_path, 'r') as json_file:
-                    self.reminders = json.load(json_file)
-            else:
-                return
-            
-            for reminder in self.reminders:
-                recurring = reminder['recurring']
-                if recurring == True:
-                    self.scheduler.schedule_recurring(reminder=reminder)
-                else:
-                    self.scheduler.schedule_once(reminder=reminder)
+            # Import the old Reminders.json the first time the store is opened
+            self.store.import_json(self.legacy_path)
+
+            today = self.scheduler.clock().date().isoformat()
+            self.reminders.clear()
+            for reminder in self.store.load_active(today):
+                # One bad row is skipped; it must not keep the rest from being scheduled
+                try:
+                    self._schedule(self.reminders.add(Reminder.from_dict(reminder)))
+                except Exception as e:
+                    log.error("Skipping reminder %s, it can't be scheduled: %s", reminder.get('id'), e)
+                    self.reminders.remove(reminder.get('id'))
+            self.occurrences.reset(self.scheduler.clock(), self.reminders)
         except Exception as e:
-            print(f"Failed to load reminders: {e}")
\ No newline at end of file
+            log.exception("Failed to load reminders: %s", e)
+
+    def _schedule(self, record):
+        # The scheduler hands back the Job (or None if nothing was scheduled)
+        if record.recurring or record.rule:
+            job = self.scheduler.schedule_recurring(reminder=record)
+        else:
+            job = self.scheduler.schedule_once(reminder=record)
+        self.reminders.set_job(record.id, job)
+        return job
@@ -0,0 +1,230 @@
+import threading
+from bisect import bisect_left, insort
+from itertools import islice
+
+# Keys per bucket of a Sorted_Index; a bucket is split in two once it holds twice this many
+BUCKET_SIZE = 256
+
+
+class Reminder:
+    """One reminder. Dict-style reads (reminder['title']) keep working for the scheduler."""
+    __slots__ = ('id', 'title', 'message', 'date', 'time', 'recurring', 'rule', 'job', 'next_key', 'title_key')
+
+    FIELDS = ('id', 'title', 'message', 'date', 'time', 'recurring', 'rule')
+
+    def __init__(self, id, title, message="", date=None, time="", recurring=False, rule=None):
+        self.id = id
+        self.title = title
+        self.message = message
+        self.date = date
+        self.time = time
+        self.recurring = recurring
+        self.rule = rule
+        # Scheduled Job, and the keys this reminder is filed under in the sorted indexes
+        self.job = None
+        self.next_key = None
+        self.title_key = None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['title'], data.get('message') or "", data.get('date'),
+                   data['time'], bool(data.get('recurring')), data.get('rule'))
+
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        data['next_run'] = self.next_key[0].isoformat() if self.next_key else None
+        return data
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+
+class Sorted_Index:
+    """Sorted keys held in buckets of at most 2 * BUCKET_SIZE, with the largest key of each bucket alongside.
+
+    Adding or discarding a key bisects the bucket maxima and then shifts
+    keys within one bucket, so it costs O(log n + BUCKET_SIZE) instead of
+    the O(n) memmove of one flat sorted list. Ordered scans from any key
+    cost O(log n) plus the keys they return.
+    """
+
+    def __init__(self):
+        self.buckets = []
+        self.maxes = []
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, key):
+        if not self.buckets:
+            self.buckets.append([key])
+            self.maxes.append(key)
+            self.size = 1
+            return
+        index = bisect_left(self.maxes, key)
+        if index == len(self.maxes):
+            # Past the end: it becomes the last bucket's new maximum
+            index -= 1
+            self.buckets[index].append(key)
+            self.maxes[index] = key
+        else:
+            insort(self.buckets[index], key)
+        self.size += 1
+
+        bucket = self.buckets[index]
+        if len(bucket) > 2 * BUCKET_SIZE:
+            self.buckets[index:index + 1] = [bucket[:BUCKET_SIZE], bucket[BUCKET_SIZE:]]
+            self.maxes[index:index + 1] = [bucket[BUCKET_SIZE - 1], bucket[-1]]
+
+    def discard(self, key):
+        if key is None:
+            return
+        index = bisect_left(self.maxes, key)
+        if index == len(self.maxes):
+            return
+        bucket = self.buckets[index]
+        position = bisect_left(bucket, key)
+        if position == len(bucket) or bucket[position] != key:
+            return
+        del bucket[position]
+        self.size -= 1
+        if not bucket:
+            del self.buckets[index]
+            del self.maxes[index]
+        elif position == len(bucket):
+            self.maxes[index] = bucket[-1]
+
+    def iter_from(self, start=None):
+        """Keys >= `start` (all keys if None), in order."""
+        index = position = 0
+        if start is not None:
+            index = bisect_left(self.maxes, start)
+            if index == len(self.maxes):
+                return
+            position = bisect_left(self.buckets[index], start)
+        for bucket in self.buckets[index:]:
+            yield from bucket[position:]
+            position = 0
+
+    def clear(self):
+        self.buckets.clear()
+        self.maxes.clear()
+        self.size = 0
+
+
+class Reminder_Registry:
+    """Reminders by id, with sorted secondary indexes by next fire time and by title.
+
+    Lookups by id are O(1) through a dict. The secondary indexes are
+    Sorted_Index collections of (key, id): adding, updating or removing a
+    reminder costs O(log n + BUCKET_SIZE) in each, without scanning the
+    collection, and listings come out pre-sorted.
+    """
+
+    def __init__(self):
+        # Reentrant: job_fired runs on the scheduler thread while the Tk or
+        # daemon thread may be editing
+        self.lock = threading.RLock()
+        self.by_id = {}
+        self.by_next = Sorted_Index()
+        self.by_title = Sorted_Index()
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __contains__(self, reminder_id):
+        return reminder_id in self.by_id
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.by_id.values()))
+
+    def add(self, reminder):
+        with self.lock:
+            if reminder.id in self.by_id:
+                self.remove(reminder.id)
+            self.by_id[reminder.id] = reminder
+            reminder.title_key = (reminder.title.casefold(), reminder.id)
+            self.by_title.add(reminder.title_key)
+            self._index_next(reminder)
+        return reminder
+
+    def get(self, reminder_id):
+        return self.by_id.get(reminder_id)
+
+    def remove(self, reminder_id):
+        """Drop a reminder from every index and return it (or None)."""
+        with self.lock:
+            reminder = self.by_id.pop(reminder_id, None)
+            if reminder is None:
+                return None
+            self.by_title.discard(reminder.title_key)
+            self.by_next.discard(reminder.next_key)
+            reminder.title_key = reminder.next_key = None
+            return reminder
+
+    def update(self, reminder_id, **fields):
+        """Change fields of a reminder in place, re-filing it if its title changed."""
+        with self.lock:
+            reminder = self.by_id[reminder_id]
+            for field, value in fields.items():
+                if field not in Reminder.FIELDS or field == 'id':
+                    raise KeyError(field)
+                setattr(reminder, field, value)
+            if 'title' in fields:
+                self.by_title.discard(reminder.title_key)
+                reminder.title_key = (reminder.title.casefold(), reminder.id)
+                self.by_title.add(reminder.title_key)
+            return reminder
+
+    def set_job(self, reminder_id, job):
+        with self.lock:
+            reminder = self.by_id.get(reminder_id)
+            if reminder is not None:
+                reminder.job = job
+                self._index_next(reminder)
+
+    def job_fired(self, job):
+        """Scheduler callback: move a reminder to its job's new deadline, or out of the index once done."""
+        with self.lock:
+            reminder = self.by_id.get(job.reminder_id)
+            if reminder is not None and reminder.job is job:
+                self._index_next(reminder)
+
+    def upcoming(self, limit=None, after=None):
+        """Scheduled reminders in fire-time order, optionally only those due after `after`."""
+        with self.lock:
+            keys = self.by_next.iter_from((after,) if after is not None else None)
+            return [self.by_id[reminder_id] for _, reminder_id in islice(keys, limit)]
+
+    def by_title_prefix(self, prefix="", limit=None):
+        """Reminders whose title starts with `prefix` (case-insensitive), in title order."""
+        prefix = prefix.casefold()
+        with self.lock:
+            found = []
+            for title, reminder_id in self.by_title.iter_from((prefix,)):
+                if (limit is not None and len(found) >= limit) or not title.startswith(prefix):
+                    break
+                found.append(self.by_id[reminder_id])
+            return found
+
+    def clear(self):
+        with self.lock:
+            self.by_id.clear()
+            self.by_next.clear()
+            self.by_title.clear()
+
+    def _index_next(self, reminder):
+        self.by_next.discard(reminder.next_key)
+        job = reminder.job
+        # One-time jobs keep their old deadline after firing; only live ones are listed
+        live = job is not None and not job.cancelled and job.next_run is not None and not job.fired
+        reminder.next_key = (job.next_run, reminder.id) if live else None
+        if reminder.next_key is not None:
+            self.by_next.add(reminder.next_key)
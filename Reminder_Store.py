@@ -0,0 +1,131 @@
+import os
+import json
+import sqlite3
+import threading
+
+# PRAGMA user_version values recording which migrations have run
+SCHEMA_VERSION = 1
+
+# Columns update() may change; the names are interpolated into its SQL
+UPDATABLE_COLUMNS = ('title', 'message', 'date', 'time', 'recurring', 'rule')
+
+
+class Reminder_Store:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        # Reminders are written from the Tk thread and read from the scheduler
+        # side, so the connection is shared behind a lock.
+        self.conn = sqlite3.connect(self.file_path, check_same_thread=False)
+        self.lock = threading.Lock()
+
+        # WAL + synchronous=FULL makes every committed insert/delete durable
+        # without rewriting the rest of the file.
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=FULL')
+
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS Reminders (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    title TEXT NOT NULL,
+                    message TEXT,
+                    date TEXT,
+                    time TEXT NOT NULL,
+                    recurring INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Recurrence rule string (see Recurrence.Rule); NULL on one-time
+            # reminders and on legacy daily ones
+            columns = [row[1] for row in self.conn.execute('PRAGMA table_info(Reminders)')]
+            if 'rule' not in columns:
+                self.conn.execute('ALTER TABLE Reminders ADD COLUMN rule TEXT')
+
+            # Startup only loads recurring and upcoming reminders
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_reminders_active ON Reminders (recurring, date)')
+
+    def add(self, reminder):
+        """Insert a reminder and return its id."""
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO Reminders (title, message, date, time, recurring, rule) VALUES (?, ?, ?, ?, ?, ?)',
+                (reminder['title'], reminder['message'], reminder.get('date'), reminder['time'],
+                 1 if reminder['recurring'] or reminder.get('rule') else 0, reminder.get('rule')))
+            return cursor.lastrowid
+
+    def update(self, reminder_id, fields):
+        """Change some columns of a reminder, returning True if it exists."""
+        unknown = set(fields) - set(UPDATABLE_COLUMNS)
+        if unknown:
+            raise KeyError(", ".join(sorted(unknown)))
+        if not fields:
+            return True
+        values = [int(value) if column == 'recurring' else value for column, value in fields.items()]
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self.lock, self.conn:
+            cursor = self.conn.execute(f'UPDATE Reminders SET {assignments} WHERE id = ?', values + [reminder_id])
+            return cursor.rowcount > 0
+
+    def delete(self, reminder_id):
+        """Delete a reminder, returning True if a row was removed."""
+        with self.lock, self.conn:
+            cursor = self.conn.execute('DELETE FROM Reminders WHERE id = ?', (reminder_id,))
+            return cursor.rowcount > 0
+
+    def load_active(self, today):
+        """Return recurring reminders and one-time reminders dated `today` (YYYY-MM-DD) or later."""
+        with self.lock:
+            cursor = self.conn.execute('''
+                SELECT id, title, message, date, time, recurring, rule FROM Reminders
+                WHERE recurring = 1 OR date >= ?
+                ORDER BY id
+            ''', (today,))
+            return [self._to_dict(row) for row in cursor]
+
+    def load_all(self):
+        with self.lock:
+            cursor = self.conn.execute('SELECT id, title, message, date, time, recurring, rule FROM Reminders ORDER BY id')
+            return [self._to_dict(row) for row in cursor]
+
+    def import_json(self, json_path):
+        """One-time migration of a legacy Reminders.json file. Returns the number imported."""
+        with self.lock:
+            version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                return 0
+
+            reminders = []
+            if json_path and os.path.exists(json_path):
+                with open(json_path, 'r') as json_file:
+                    reminders = json.load(json_file)
+
+            # The rows and the version bump commit together, so a crash
+            # mid-import simply retries it on the next start.
+            with self.conn:
+                self.conn.executemany(
+                    'INSERT INTO Reminders (title, message, date, time, recurring) VALUES (?, ?, ?, ?, ?)',
+                    [(r['title'], r['message'], r.get('date'), r['time'], 1 if r['recurring'] else 0)
+                     for r in reminders])
+                self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            return len(reminders)
+
+    def checkpoint(self):
+        """Fold the WAL back into the main database file."""
+        with self.lock:
+            self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _to_dict(self, row):
+        return {
+            'id': row[0],
+            'title': row[1],
+            'message': row[2],
+            'date': row[3],
+            'time': row[4],
+            'recurring': bool(row[5]),
+            'rule': row[6]
+        }
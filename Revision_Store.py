@@ -0,0 +1,213 @@
+import struct
+import zlib
+from datetime import datetime, timedelta
+
+# Revision kinds
+FULL = 0
+DELTA = 1
+
+# A delta replaces old[prefix:len(old) - suffix] with the inserted text
+_DELTA_HEADER = struct.Struct('<II')
+
+
+def make_delta(old, new):
+    """Encode `new` relative to `old` as common prefix/suffix lengths plus the changed middle.
+
+    Typical saves change one region of a note, so the delta grows with the
+    edit rather than with the note.
+    """
+    limit = min(len(old), len(new))
+    prefix = 0
+    # Compare in large slices first, then narrow down character by character
+    step = 4096
+    while step:
+        while prefix + step <= limit and old[prefix:prefix + step] == new[prefix:prefix + step]:
+            prefix += step
+        step //= 8
+
+    limit -= prefix
+    suffix = 0
+    step = 4096
+    while step:
+        while suffix + step <= limit and old[len(old) - suffix - step:len(old) - suffix] == new[len(new) - suffix - step:len(new) - suffix]:
+            suffix += step
+        step //= 8
+
+    middle = new[prefix:len(new) - suffix]
+    return _DELTA_HEADER.pack(prefix, suffix) + middle.encode('utf-8')
+
+
+def compress(text):
+    """zlib-compress text with a window no larger than the text.
+
+    Most notes are small, and allocating the default 256 KB deflate state
+    for each one costs more than compressing it; the output still
+    decompresses with plain zlib.decompress.
+    """
+    data = text.encode('utf-8')
+    wbits = max(9, min(15, len(data).bit_length()))
+    compressor = zlib.compressobj(6, zlib.DEFLATED, wbits, 4)
+    return compressor.compress(data) + compressor.flush()
+
+
+def apply_delta(old, delta):
+    prefix, suffix = _DELTA_HEADER.unpack_from(delta, 0)
+    middle = bytes(delta[_DELTA_HEADER.size:]).decode('utf-8')
+    return old[:prefix] + middle + old[len(old) - suffix:]
+
+
+class Revision_Store:
+    """Content history for notes: periodic zlib snapshots with prefix/suffix deltas between them.
+
+    Any revision is rebuilt from the nearest snapshot at or before it with at
+    most `snapshot_interval - 1` delta applications.
+    """
+
+    def __init__(self, snapshot_interval=32):
+        self.snapshot_interval = snapshot_interval
+
+    def create_table(self, cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS NoteRevisions (
+                note_id INTEGER NOT NULL,
+                rev INTEGER NOT NULL,
+                kind INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (note_id, rev)
+            ) WITHOUT ROWID
+        ''')
+
+    def record(self, cursor, note_id, content, previous=None, created_at=None):
+        """Append `content` as the newest revision of a note; returns its revision number.
+
+        `previous` is the note's content before this save. It is only used as a
+        delta base when the note already has history, in which case it must be
+        the content of the latest revision.
+        """
+        content = content or ""
+        latest = cursor.execute('''
+            SELECT rev FROM NoteRevisions WHERE note_id = ? ORDER BY rev DESC LIMIT 1
+        ''', (note_id,)).fetchone()
+        rev = latest[0] + 1 if latest else 1
+
+        kind, data = FULL, None
+        if latest and previous is not None:
+            snapshot = cursor.execute('''
+                SELECT rev FROM NoteRevisions WHERE note_id = ? AND kind = ? ORDER BY rev DESC LIMIT 1
+            ''', (note_id, FULL)).fetchone()
+            if snapshot and rev - snapshot[0] < self.snapshot_interval:
+                delta = make_delta(previous, content)
+                # Past half the note, a snapshot is about as small and ends the chain
+                if len(delta) < len(content) // 2:
+                    kind, data = DELTA, delta
+
+        if kind == FULL:
+            data = compress(content)
+
+        if created_at is None:
+            cursor.execute('INSERT INTO NoteRevisions (note_id, rev, kind, data) VALUES (?, ?, ?, ?)',
+                           (note_id, rev, kind, data))
+        else:
+            cursor.execute('INSERT INTO NoteRevisions (note_id, rev, kind, data, created_at) VALUES (?, ?, ?, ?, ?)',
+                           (note_id, rev, kind, data, created_at))
+        return rev
+
+    def list_revisions(self, conn, note_id):
+        """Return (rev, created_at, kind, stored_bytes) for each revision, newest first."""
+        cursor = conn.execute('''
+            SELECT rev, created_at, kind, length(data) FROM NoteRevisions
+            WHERE note_id = ? ORDER BY rev DESC
+        ''', (note_id,))
+        return cursor.fetchall()
+
+    def get_revision(self, conn, note_id, rev):
+        """Rebuild the content of one revision, or None if it doesn't exist."""
+        snapshot = conn.execute('''
+            SELECT rev FROM NoteRevisions
+            WHERE note_id = ? AND rev <= ? AND kind = ?
+            ORDER BY rev DESC LIMIT 1
+        ''', (note_id, rev, FULL)).fetchone()
+        if snapshot is None:
+            return None
+
+        rows = conn.execute('''
+            SELECT rev, kind, data FROM NoteRevisions
+            WHERE note_id = ? AND rev >= ? AND rev <= ?
+            ORDER BY rev
+        ''', (note_id, snapshot[0], rev)).fetchall()
+        if not rows or rows[-1][0] != rev:
+            return None
+
+        content = None
+        for _, kind, data in rows:
+            if kind == FULL:
+                content = zlib.decompress(data).decode('utf-8')
+            else:
+                content = apply_delta(content, data)
+        return content
+
+    def delete_note(self, cursor, note_id):
+        cursor.execute('DELETE FROM NoteRevisions WHERE note_id = ?', (note_id,))
+
+    def thin(self, cursor, note_id, keep_recent=20, keep_daily_days=30, max_age_days=365, now=None):
+        """Apply the retention policy to one note's history; returns how many revisions were dropped.
+
+        The newest `keep_recent` revisions are kept, then the last revision of
+        each day for `keep_daily_days`, then the last of each ISO week up to
+        `max_age_days`. Older revisions are dropped. Survivors keep their
+        revision numbers and timestamps but are re-encoded, since a dropped
+        revision may have been the base of a delta.
+        """
+        now = now or datetime.now()
+        rows = cursor.execute('''
+            SELECT rev, kind, data, created_at FROM NoteRevisions
+            WHERE note_id = ? ORDER BY rev
+        ''', (note_id,)).fetchall()
+        if len(rows) <= keep_recent:
+            return 0
+
+        recent = {row[0] for row in rows[-keep_recent:]}
+        buckets = {}
+        for rev, _, _, created_at in rows:
+            if rev in recent:
+                continue
+            created = datetime.fromisoformat(created_at)
+            age = now - created
+            if age > timedelta(days=max_age_days):
+                continue
+            if age <= timedelta(days=keep_daily_days):
+                bucket = ('day', created.date())
+            else:
+                bucket = ('week', tuple(created.isocalendar())[:2])
+            # Rows are in revision order, so the last one in a bucket wins
+            buckets[bucket] = rev
+        keep = recent | set(buckets.values())
+
+        # Walk the chain once, rebuilding content as we go, and re-encode survivors
+        survivors = []
+        content = None
+        for rev, kind, data, created_at in rows:
+            if kind == FULL:
+                content = zlib.decompress(data).decode('utf-8')
+            else:
+                content = apply_delta(content, data)
+            if rev in keep:
+                survivors.append((rev, created_at, content))
+
+        cursor.execute('DELETE FROM NoteRevisions WHERE note_id = ?', (note_id,))
+        previous, count = None, 0
+        for rev, created_at, content in survivors:
+            kind, data = FULL, None
+            if previous is not None and count < self.snapshot_interval:
+                delta = make_delta(previous, content)
+                if len(delta) < len(content) // 2:
+                    kind, data = DELTA, delta
+            if kind == FULL:
+                data = compress(content)
+                count = 0
+            count += 1
+            cursor.execute('INSERT INTO NoteRevisions (note_id, rev, kind, data, created_at) VALUES (?, ?, ?, ?, ?)',
+                           (note_id, rev, kind, data, created_at))
+            previous = content
+        return len(rows) - len(survivors)
@@ -1,29 +1,80 @@
-from plyer import notification
-from datetime import datetime
-import schedule
+from datetime import datetime, timedelta
+import heapq
+import itertools
+import logging
+import threading
+
+from Metrics import METRICS
+from Notification_Dispatcher import Notification_Dispatcher
+from Recurrence import reminder_rule
+
+log = logging.getLogger(__name__)
+
+# Upper bound on a single sleep while jobs are pending, so wall clock changes
+# (suspend/resume, DST, manual adjustments) are noticed without busy polling.
+MAX_WAIT = 60.0
+
+
+class Job:
+    """A single scheduled reminder, ordered in the heap by its next_run.
+
+    Recurring jobs carry their Rule and only ever hold the next deadline.
+    """
+    __slots__ = ('title', 'message', 'time', 'recurring', 'next_run', 'cancelled', 'rule', 'fired', 'reminder_id')
+
+    def __init__(self, title, message, time, recurring, next_run, rule=None, reminder_id=None):
+        self.title = title
+        self.message = message
+        self.time = time
+        self.recurring = recurring
+        self.next_run = next_run
+        self.cancelled = False
+        self.rule = rule
+        # Set once the job will never fire again
+        self.fired = False
+        self.reminder_id = reminder_id
+
 
 class Scheduler:
-    def __init__(self):
+    def __init__(self, clock=datetime.now, dispatcher=None):
+        # `clock` returns the current datetime; benchmarks inject a virtual one
+        self.clock = clock
+        # Notifications are shown on the dispatcher's thread, never on the one firing jobs
+        self.dispatcher = dispatcher or Notification_Dispatcher()
+        # Min-heap of (next_run, sequence, job) entries; the sequence keeps
+        # ordering stable for jobs that share a deadline.
         self.jobs = []
+        # Cancelled entries still in the heap; compacted once they dominate it
+        self._cancelled = 0
+        self._counter = itertools.count()
+        # Called with each job after it fires, e.g. to re-index its next deadline
+        self.on_fired = None
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
 
     def schedule_recurring(self, reminder):
         title = reminder['title']
         message = reminder['message']
         time = reminder['time']
+        reminder_id = reminder.get('id')
 
-        now = datetime.now()
-        scheduled_time = datetime.strptime(time, "%H:%M").replace(year=now.year, month=now.month, day=now.day)
+        now = self.clock()
+        rule = reminder_rule(reminder, now.date())
 
-        # If the scheduled time is earlier than the current time today, run it immediately
-        if scheduled_time <= now:
-            print(f"Running missed job immediately: {title}")
-            self.send_notification(title, message)
-            job = schedule.every().day.at(time).do(self.send_notification, title=title, message=message)
+        # If an occurrence earlier today was missed, run it immediately
+        midnight = datetime.combine(now.date(), datetime.min.time())
+        if len(rule.occurrences(midnight, now + timedelta(seconds=1))):
+            log.info("Running missed job immediately: %s", title)
+            next_run = now
         else:
-            print(f"Scheduling recurring task: {title} at {time}")
-            job = schedule.every().day.at(time).do(self.send_notification, title=title, message=message)
+            next_run = rule.next_after(now)
+            if next_run is None:
+                log.info("Recurring reminder has ended: %s", title)
+                return None
+            log.info("Scheduling recurring task: %s (%s) next at %s", title, rule.format(), next_run)
 
-        self.jobs.append(job)
+        return self._add(Job(title, message, time, True, next_run, rule, reminder_id))
 
     def schedule_once(self, reminder):
         title = reminder['title']
@@ -31,47 +82,137 @@ class Scheduler:
         reminder_date = datetime.strptime(reminder['date'], "%Y-%m-%d").date()
         time_str = reminder['time']
 
-        now = datetime.now()
+        now = self.clock()
         current_date = now.date()
 
         scheduled_time = datetime.combine(reminder_date, datetime.strptime(time_str, "%H:%M").time())
 
         if current_date == reminder_date:
-            
+
             if scheduled_time > now:
-                print(f"Scheduling one-time task: {title} at {time_str} on {reminder['date']}")
-                job = schedule.every().day.at(time_str).do(self.send_notification, title=title, message=message)
-                self.jobs.append(job)
+                log.info("Scheduling one-time task: %s at %s on %s", title, time_str, reminder['date'])
+                return self._add(Job(title, message, time_str, False, scheduled_time, reminder_id=reminder.get('id')))
             else:
-                print(f"Missed the scheduled time for today: {title}")
+                log.info("Missed the scheduled time for today: %s", title)
                 # Optionally, you can run it immediately or reschedule it for the next occurrence
 
         elif current_date < reminder_date:
-            print(f"Scheduling one-time task for the future date: {title} at {time_str} on {reminder['date']}")
-            delay = int((scheduled_time - now).total_seconds())
-            job = schedule.every(delay).seconds.do(self.send_notification, title=title, message=message)
-            self.jobs.append(job)
+            log.info("Scheduling one-time task for the future date: %s at %s on %s", title, time_str, reminder['date'])
+            return self._add(Job(title, message, time_str, False, scheduled_time, reminder_id=reminder.get('id')))
 
         else:
-            print(f"The scheduled date {reminder['date']} has already passed.")
+            log.info("The scheduled date %s has already passed.", reminder['date'])
+
+        return None
+
+    def cancel(self, job):
+        """Cancel a job; its heap entry is discarded lazily when it surfaces."""
+        with self._cond:
+            if job.cancelled or job.fired:
+                return
+            job.cancelled = True
+            self._cancelled += 1
+            # Heavy edit/delete churn would otherwise leave the heap mostly dead entries
+            if self._cancelled > 64 and self._cancelled * 2 > len(self.jobs):
+                self.jobs = [entry for entry in self.jobs if not entry[2].cancelled]
+                heapq.heapify(self.jobs)
+                self._cancelled = 0
 
     def send_notification(self, title, message):
-        try:
-            notification.notify(
-                title=title,
-                message=message
-            ) # type: ignore
-            
-        except Exception as e:
-            print(f"Notification failed: {e}")
+        self.dispatcher.submit(title, message)
 
     def run_pending(self):
-        schedule.run_pending()
+        """Fire every job that is due on the calling thread."""
+        with self._cond:
+            due = self._pop_due(self.clock())
+        self._fire(due)
+
+    def start(self):
+        """Start the worker thread that sleeps until the next deadline."""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="Scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the worker thread; returns False if it was still busy firing after `timeout`."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
 
     def list_jobs(self):
-        for job in self.jobs:
-            print(f"Job: {job.job_func.__name__}")
-            print(f"Next Run: {job.next_run}")
-            print(f"Interval: {job.interval} {job.unit}")
-            print(f"Tags: {job.tags}")
-            print("-" * 30)
+        with self._cond:
+            entries = sorted(self.jobs)
+        for next_run, _, job in entries:
+            if job.cancelled:
+                continue
+            recurrence = job.rule.format() if job.rule is not None else job.recurring
+            log.info("Job: %s | Next Run: %s | Recurring: %s at %s", job.title, next_run, recurrence, job.time)
+
+    def _add(self, job):
+        with self._cond:
+            heapq.heappush(self.jobs, (job.next_run, next(self._counter), job))
+            # Only wake the worker when this job became the earliest deadline
+            if self.jobs[0][2] is job:
+                self._cond.notify()
+            METRICS.gauge("scheduler.queue", len(self.jobs))
+        return job
+
+    def _pop_due(self, now):
+        """Pop (deadline, job) pairs due at `now`, re-arming recurring ones. Caller holds the lock."""
+        due = []
+        while self.jobs and self.jobs[0][0] <= now:
+            deadline, _, job = heapq.heappop(self.jobs)
+            if job.cancelled:
+                self._cancelled -= 1
+                continue
+            due.append((deadline, job))
+            if job.recurring:
+                job.next_run = job.rule.next_after(now)
+            if job.recurring and job.next_run is not None:
+                heapq.heappush(self.jobs, (job.next_run, next(self._counter), job))
+            else:
+                job.fired = True
+        METRICS.gauge("scheduler.queue", len(self.jobs))
+        return due
+
+    def _next_timeout(self, now):
+        """Seconds until the earliest live deadline, or None when idle. Caller holds the lock."""
+        while self.jobs and self.jobs[0][2].cancelled:
+            heapq.heappop(self.jobs)
+            self._cancelled -= 1
+        if not self.jobs:
+            return None
+        return min(max((self.jobs[0][0] - now).total_seconds(), 0.0), MAX_WAIT)
+
+    def _fire(self, due):
+        for deadline, job in due:
+            # Firing lag: how late this job ran compared to its deadline
+            if METRICS.enabled:
+                METRICS.observe("reminder.lag", (self.clock() - deadline).total_seconds())
+            self.send_notification(job.title, job.message)
+            if self.on_fired is not None:
+                self.on_fired(job)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due = []
+                while self._running and not due:
+                    timeout = self._next_timeout(self.clock())
+                    if timeout is None:
+                        # Nothing scheduled: sleep until a job is added
+                        self._cond.wait()
+                    elif timeout > 0:
+                        self._cond.wait(timeout)
+                    due = self._pop_due(self.clock())
+                if not self._running:
+                    return
+            self._fire(due)
@@ -0,0 +1,246 @@
+"""Keeps one Noteify GUI per user and hands later launches over to it.
+
+The first launch takes an exclusive lock on Data/noteify.lock and listens
+on a local socket (a Unix socket, or 127.0.0.1 with a random port where
+there are none, e.g. Windows). It writes the address and a random token
+to Data/noteify.instance. A later launch fails to take the lock, sends
+its request to that address and exits. It imports nothing heavier than
+socket and json, so the hand-off takes milliseconds instead of a cold
+start.
+
+Requests are one JSON line each, like the daemon's:
+
+    {"token": ..., "command": "show"}
+    {"token": ..., "command": "new_reminder"}
+    {"token": ..., "command": "open_note", "note_id": 12}
+
+The OS drops the lock when its process dies, so a crash never leaves a
+stale lock behind. A leftover socket or address file is overwritten by
+the next instance to take the lock.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+LOCK_PATH = "Data/noteify.lock"
+INFO_PATH = "Data/noteify.instance"
+SOCKET_PATH = "Data/noteify.sock"
+COMMANDS = ('show', 'new_reminder', 'open_note')
+# Requests are tiny; anything longer is not a Noteify launch
+MAX_REQUEST_BYTES = 4096
+
+log = logging.getLogger(__name__)
+
+
+class Instance_Error(Exception):
+    """Another instance holds the lock but never took the request."""
+
+
+class Instance_Lock:
+    """Held by the running instance: the lock file plus the socket serving later launches."""
+
+    def __init__(self, lock_file, lock_path=LOCK_PATH, info_path=INFO_PATH, socket_path=SOCKET_PATH):
+        self.lock_file = lock_file
+        self.lock_path = lock_path
+        self.info_path = info_path
+        self.socket_path = socket_path
+        self.token = os.urandom(16).hex()
+        self.server = None
+        self.thread = None
+        # Requests wait here until the UI installs a handler
+        self.handler = None
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def listen(self):
+        """Start accepting requests from later launches on a background thread."""
+        if hasattr(socket, 'AF_UNIX'):
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(self.socket_path)
+            os.chmod(self.socket_path, 0o600)
+            address = self.socket_path
+        else:
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.bind(("127.0.0.1", 0))
+            address = "%s:%d" % server.getsockname()
+        server.listen()
+        self.server = server
+
+        # Written last: a launch that can read it can also connect
+        temp_path = self.info_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'pid': os.getpid(), 'address': address, 'token': self.token}, f)
+        os.replace(temp_path, self.info_path)
+
+        self.thread = threading.Thread(target=self._serve, name="SingleInstance", daemon=True)
+        self.thread.start()
+
+    def set_handler(self, handler):
+        """Route requests to `handler(request)`, replaying any that arrived during startup."""
+        with self.lock:
+            self.handler = handler
+            pending, self.pending = self.pending, []
+        for request in pending:
+            handler(request)
+
+    def stop_listening(self, timeout=None):
+        """Refuse further requests, so launches during shutdown start their own instance."""
+        server, self.server = self.server, None
+        if server is None:
+            return True
+        # shutdown() wakes the blocking accept(); close() alone may not
+        try:
+            server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        server.close()
+        for path in (self.info_path, self.socket_path if hasattr(socket, 'AF_UNIX') else None):
+            if path:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+        if self.thread is not None:
+            self.thread.join(timeout)
+            return not self.thread.is_alive()
+        return True
+
+    def release(self, timeout=None):
+        """Stop listening and drop the lock."""
+        stopped = self.stop_listening(timeout)
+        if self.lock_file is not None:
+            _unlock(self.lock_file)
+            self.lock_file.close()
+            self.lock_file = None
+        return stopped
+
+    def _serve(self):
+        server = self.server
+        while True:
+            # Blocking accept: an idle instance never wakes up for this
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            with conn:
+                conn.settimeout(1.0)
+                try:
+                    line = conn.makefile('rb').readline(MAX_REQUEST_BYTES)
+                    response = self._dispatch(json.loads(line))
+                except (OSError, ValueError) as e:
+                    response = {'ok': False, 'error': str(e)}
+                try:
+                    conn.sendall(json.dumps(response).encode('utf-8') + b"\n")
+                except OSError:
+                    pass
+
+    def _dispatch(self, request):
+        if not isinstance(request, dict) or request.get('token') != self.token:
+            return {'ok': False, 'error': "Bad token"}
+        request = {key: value for key, value in request.items() if key != 'token'}
+        log.debug("Request from another launch: %s", request)
+        if request.get('command') not in COMMANDS:
+            return {'ok': False, 'error': f"Unknown command: {request.get('command')}"}
+        with self.lock:
+            handler = self.handler
+            if handler is None:
+                self.pending.append(request)
+        if handler is not None:
+            handler(request)
+        return {'ok': True}
+
+
+def acquire(lock_path=LOCK_PATH, info_path=INFO_PATH, socket_path=SOCKET_PATH):
+    """Take the instance lock and start listening; returns an Instance_Lock, or None if another instance holds it."""
+    directory = os.path.dirname(lock_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    lock_file = open(lock_path, 'a+')
+    if not _try_lock(lock_file):
+        lock_file.close()
+        return None
+    instance = Instance_Lock(lock_file, lock_path, info_path, socket_path)
+    try:
+        instance.listen()
+    except OSError:
+        instance.release()
+        raise
+    return instance
+
+
+def forward(request, info_path=INFO_PATH, timeout=1.0):
+    """Send `request` to the running instance. Returns True once it has been accepted."""
+    try:
+        with open(info_path, 'r') as f:
+            info = json.load(f)
+        address = info['address']
+        if ':' in address and not os.path.exists(address):
+            host, port = address.rsplit(':', 1)
+            conn = socket.create_connection((host, int(port)), timeout)
+        else:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(timeout)
+            conn.connect(address)
+        with conn:
+            conn.sendall(json.dumps(dict(request, token=info['token'])).encode('utf-8') + b"\n")
+            line = conn.makefile('rb').readline(MAX_REQUEST_BYTES)
+        return bool(line) and json.loads(line).get('ok', False)
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def acquire_or_forward(request, wait=8.0, lock_path=LOCK_PATH, info_path=INFO_PATH, socket_path=SOCKET_PATH):
+    """Become the running instance, or hand `request` to the one that is.
+
+    Returns the Instance_Lock if this process should start the app, or None
+    if another instance took the request. A holder that is still starting
+    up or shutting down (which is bounded by Lifecycle's deadline) is
+    retried for up to `wait` seconds, then Instance_Error is raised rather
+    than starting a second copy.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        instance = acquire(lock_path, info_path, socket_path)
+        if instance is not None:
+            return instance
+        if forward(request, info_path):
+            return None
+        if time.monotonic() >= deadline:
+            raise Instance_Error(f"Another Noteify holds {lock_path} but is not answering")
+        time.sleep(0.05)
+
+
+def _try_lock(lock_file):
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(lock_file):
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+    except OSError:
+        pass
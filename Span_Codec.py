@@ -0,0 +1,195 @@
+"""Compact storage format for rich-text formatting.
+
+Formatting is kept as spans of integer character offsets into the note
+content, one sorted, non-overlapping list of (start, end) pairs per tag.
+A note's spans are stored as a single blob:
+
+    version (u8)
+    per tag:  name length (u8) | name (utf-8) | span count (u32) | count * (start u32, end u32)
+
+All integers are little-endian; offsets go through array('I') so each
+tag's spans are read and written as one contiguous buffer.
+"""
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+
+VERSION = 1
+
+# Tags Tk manages itself (selection) or that are derived for display only
+TRANSIENT_TAGS = {"sel", "bold_italic"}
+
+_HEADER = struct.Struct('<B')
+_COUNT = struct.Struct('<I')
+
+# The blob layout relies on 4-byte unsigned offsets
+assert array('I').itemsize == 4
+
+
+def line_starts(content):
+    """Offsets at which each line of `content` starts (line 1 is index 0)."""
+    starts = [0]
+    find = content.find
+    position = find('\n')
+    while position != -1:
+        starts.append(position + 1)
+        position = find('\n', position + 1)
+    return starts
+
+
+def index_to_offset(starts, index, length):
+    """Convert a Tk "line.column" index to a character offset, clamped to the content."""
+    line, _, column = str(index).partition('.')
+    line = int(line)
+    if line < 1:
+        return 0
+    if line > len(starts):
+        return length
+    return min(starts[line - 1] + int(column or 0), length)
+
+
+def offset_to_index(starts, offset):
+    """Convert a character offset back to a Tk "line.column" index."""
+    line = bisect_right(starts, offset)
+    return f"{line}.{offset - starts[line - 1]}"
+
+
+def merge(ranges):
+    """Sort ranges and merge any that overlap or touch; empty ranges are dropped."""
+    merged = []
+    for start, end in sorted(ranges):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def intersect(a, b):
+    """Intersection of two sorted, merged span lists."""
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            result.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def segments(spans, length):
+    """Yield (start, end, tag_names) runs covering [0, length) over which the set of tags is constant."""
+    events = []
+    for name, name_spans in spans.items():
+        for start, end in name_spans:
+            events.append((start, 1, name))
+            events.append((end, 0, name))
+    # At equal offsets, ends sort before starts
+    events.sort()
+
+    active = set()
+    position = 0
+    for offset, starting, name in events:
+        offset = min(offset, length)
+        if offset > position:
+            yield position, offset, tuple(active)
+            position = offset
+        if starting:
+            active.add(name)
+        else:
+            active.discard(name)
+    if position < length:
+        yield position, length, tuple(active)
+
+
+def from_tags(content, tags):
+    """Build {tag_name: [(start, end), ...]} from tag dicts with Tk start/end indexes."""
+    starts = line_starts(content)
+    length = len(content)
+    ranges = {}
+    for tag in tags:
+        name = tag["tag_name"]
+        if name in TRANSIENT_TAGS:
+            continue
+        ranges.setdefault(name, []).append((
+            index_to_offset(starts, tag["start_index"], length),
+            index_to_offset(starts, tag["end_index"], length)
+        ))
+
+    spans = {}
+    for name, name_ranges in ranges.items():
+        merged = merge(name_ranges)
+        if merged:
+            spans[name] = merged
+    return spans
+
+
+def to_tags(content, spans):
+    """Expand spans back into tag dicts carrying both Tk indexes and raw offsets."""
+    starts = line_starts(content)
+    tags = []
+    for name, name_spans in spans.items():
+        for start, end in name_spans:
+            tags.append({
+                "tag_name": name,
+                "start_index": offset_to_index(starts, start),
+                "end_index": offset_to_index(starts, end),
+                "start": start,
+                "end": end
+            })
+    return tags
+
+
+def encode(spans):
+    """Serialize spans to a blob, or None when the note has no formatting."""
+    if not spans:
+        return None
+    parts = [_HEADER.pack(VERSION)]
+    for name, name_spans in spans.items():
+        encoded_name = name.encode('utf-8')
+        offsets = array('I')
+        for start, end in name_spans:
+            offsets.append(start)
+            offsets.append(end)
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+        parts.append(_HEADER.pack(len(encoded_name)))
+        parts.append(encoded_name)
+        parts.append(_COUNT.pack(len(name_spans)))
+        parts.append(offsets.tobytes())
+    return b''.join(parts)
+
+
+def decode(blob):
+    """Parse a blob produced by encode() back into {tag_name: [(start, end), ...]}."""
+    spans = {}
+    if not blob:
+        return spans
+    view = memoryview(blob)
+    (version,) = _HEADER.unpack_from(view, 0)
+    if version != VERSION:
+        raise ValueError(f"Unsupported span format version: {version}")
+    position = _HEADER.size
+    while position < len(view):
+        (name_length,) = _HEADER.unpack_from(view, position)
+        position += _HEADER.size
+        name = bytes(view[position:position + name_length]).decode('utf-8')
+        position += name_length
+        (count,) = _COUNT.unpack_from(view, position)
+        position += _COUNT.size
+        offsets = array('I')
+        size = count * 8
+        offsets.frombytes(view[position:position + size])
+        position += size
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+        spans[name] = list(zip(offsets[0::2], offsets[1::2]))
+    return spans
@@ -0,0 +1,168 @@
+import importlib.abc
+import json
+import sys
+import threading
+import time
+
+
+class _Timed_Loader:
+    """Wraps a module loader to time exec_module, the body of an import."""
+
+    def __init__(self, profiler, name, loader):
+        self._profiler = profiler
+        self._name = name
+        self._loader = loader
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._import_started()
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._import_finished(self._name, time.perf_counter() - started)
+
+
+class _Timing_Finder(importlib.abc.MetaPathFinder):
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def find_spec(self, fullname, path, target=None):
+        # Ask the remaining finders, then wrap whatever loader they return
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _Timed_Loader(self.profiler, fullname, spec.loader)
+                return spec
+        return None
+
+
+class Startup_Profiler:
+    """Per-phase startup timings plus -X importtime style import costs.
+
+    Disabled profilers do nothing, so the hooks can stay in place in normal runs.
+    """
+
+    def __init__(self, enabled=False, start=None, output=None):
+        self.enabled = enabled
+        self.start = start if start is not None else time.perf_counter()
+        self.output = output
+        self.lock = threading.Lock()
+        self.phases = []
+        self.marks = []
+        self.pending = set()
+        self.reported = False
+
+        # Import timing: cumulative and self time per module, with a stack of
+        # child totals so nested imports are subtracted from their parent
+        self.imports = []
+        self.import_stack = threading.local()
+
+    def install_import_timer(self):
+        if self.enabled:
+            sys.meta_path.insert(0, _Timing_Finder(self))
+
+    def uninstall_import_timer(self):
+        sys.meta_path[:] = [finder for finder in sys.meta_path if not isinstance(finder, _Timing_Finder)]
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def mark(self, name):
+        """Record a point in time, e.g. the first paint of the main window."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.marks.append((name, time.perf_counter() - self.start))
+
+    def expect(self, *names):
+        """Declare background phases that must finish before the report is printed."""
+        if self.enabled:
+            with self.lock:
+                self.pending.update(names)
+
+    def complete(self, name):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.pending.discard(name)
+            finished = not self.pending and not self.reported
+            if finished:
+                self.reported = True
+        if finished:
+            self.report()
+
+    def report(self):
+        self.uninstall_import_timer()
+        with self.lock:
+            phases = sorted(self.phases, key=lambda phase: phase['start_ms'])
+            marks = list(self.marks)
+            imports = sorted(self.imports, key=lambda item: item['cumulative_ms'], reverse=True)
+
+        lines = ["", "Startup profile (ms since main.py started)"]
+        for phase in phases:
+            lines.append(f"  {phase['start_ms']:8.1f} +{phase['duration_ms']:8.1f}  {phase['name']}  [{phase['thread']}]")
+        for name, at in marks:
+            lines.append(f"  {at * 1000:8.1f}            {name}")
+        lines.append("")
+        lines.append("Slowest imports (self / cumulative ms)")
+        for item in imports[:25]:
+            lines.append(f"  {item['self_ms']:8.1f} / {item['cumulative_ms']:8.1f}  {item['module']}")
+        print("\n".join(lines), file=sys.stderr)
+
+        if self.output:
+            with open(self.output, 'w') as f:
+                json.dump({
+                    'phases': phases,
+                    'marks': [{'name': name, 'at_ms': at * 1000} for name, at in marks],
+                    'imports': imports
+                }, f, indent=4)
+
+    def _import_started(self):
+        stack = getattr(self.import_stack, 'children', None)
+        if stack is None:
+            stack = self.import_stack.children = []
+        stack.append(0.0)
+
+    def _import_finished(self, name, elapsed):
+        stack = self.import_stack.children
+        children = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        with self.lock:
+            self.imports.append({
+                'module': name,
+                'self_ms': (elapsed - children) * 1000,
+                'cumulative_ms': elapsed * 1000
+            })
+
+
+class _Phase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        profiler = self.profiler
+        if profiler.enabled:
+            ended = time.perf_counter()
+            with profiler.lock:
+                profiler.phases.append({
+                    'name': self.name,
+                    'thread': threading.current_thread().name,
+                    'start_ms': (self.started - profiler.start) * 1000,
+                    'duration_ms': (ended - self.started) * 1000
+                })
+        return False
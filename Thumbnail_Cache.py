@@ -0,0 +1,167 @@
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+from Metrics import METRICS
+
+# Longest side of a thumbnail, in pixels
+THUMBNAIL_SIZE = 128
+# Decoded thumbnails kept in memory; at 128 px each is at most 64 KB
+MEMORY_ENTRIES = 256
+
+log = logging.getLogger(__name__)
+
+
+class Thumbnail_Cache:
+    """Thumbnails of attachments, made with PIL on a background thread.
+
+    Lookups go memory (an LRU of decoded PIL images), then disk (a PNG per
+    blob under <attachments>/thumbnails/<size>/), then the blob itself,
+    which is decoded from its mmap and written back to both. Blobs are
+    named by their content, so a cached thumbnail never goes stale; the
+    store deletes it along with its blob.
+    Results are handed back through `post`, which the UI points at
+    root.after, so the Tk thread only ever turns a small image into a
+    PhotoImage.
+    """
+
+    def __init__(self, store, size=THUMBNAIL_SIZE, max_entries=MEMORY_ENTRIES, post=None):
+        self.store = store
+        self.size = size
+        self.max_entries = max_entries
+        self.post = post or (lambda fn: fn())
+        self.directory = os.path.join(store.thumbnails, str(size))
+
+        # sha256 -> PIL image, or None for a blob that isn't an image; least recently used first
+        self.entries = OrderedDict()
+        # sha256 -> callbacks waiting for a thumbnail that is being made
+        self.waiting = {}
+        self.lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.thread = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.generated = 0
+        self.failures = 0
+        METRICS.register("thumbnails", self.stats)
+
+    def get(self, sha256):
+        """The thumbnail if it is in memory, else None. Never touches the disk."""
+        with self.lock:
+            image = self.entries.get(sha256)
+            if image is not None:
+                self.entries.move_to_end(sha256)
+            return image
+
+    def request(self, sha256, callback):
+        """Call `callback(sha256, image)` on the Tk thread; image is None if the blob isn't an image."""
+        with self.lock:
+            if sha256 in self.entries:
+                self.entries.move_to_end(sha256)
+                self.hits += 1
+                image = self.entries[sha256]
+            else:
+                callbacks = self.waiting.get(sha256)
+                if callbacks is not None:
+                    # Already queued; answer both with one decode
+                    callbacks.append(callback)
+                    return
+                self.waiting[sha256] = [callback]
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="Thumbnails", daemon=True)
+                    self.thread.start()
+                self.requests.put(sha256)
+                return
+        self.post(partial(callback, sha256, image))
+
+    def close(self, timeout=None):
+        """Stop the worker once the thumbnail it is making is done; queued requests are dropped."""
+        if self.thread is None:
+            return True
+        while True:
+            try:
+                self.requests.get_nowait()
+            except queue.Empty:
+                break
+        self.requests.put(None)
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'generated': self.generated,
+                'failures': self.failures,
+                'queued': self.requests.qsize()
+            }
+
+    def path(self, sha256):
+        return os.path.join(self.directory, sha256[:2], sha256 + ".png")
+
+    def _run(self):
+        while True:
+            sha256 = self.requests.get()
+            if sha256 is None:
+                return
+            try:
+                image = self._load(sha256)
+            except Exception as e:
+                log.exception("Thumbnail for %s failed: %s", sha256, e)
+                image = None
+            with self.lock:
+                self.entries[sha256] = image
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                callbacks = self.waiting.pop(sha256, [])
+            for callback in callbacks:
+                self.post(partial(callback, sha256, image))
+
+    def _load(self, sha256):
+        from PIL import Image
+
+        path = self.path(sha256)
+        try:
+            with Image.open(path) as cached:
+                # copy() decodes it; the image itself is unusable once closed
+                thumbnail = cached.copy()
+            self.disk_hits += 1
+            return thumbnail
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning("Discarding unreadable thumbnail %s: %s", path, e)
+
+        start = time.perf_counter()
+        try:
+            with self.store.open(sha256) as data, Image.open(data) as image:
+                # JPEGs decode straight at a fraction of full size
+                image.draft('RGB', (self.size, self.size))
+                image.thumbnail((self.size, self.size))
+                thumbnail = image.convert('RGBA') if image.mode not in ('RGB', 'RGBA') else image.copy()
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            # Not an image, or one PIL can't read: shown as a plain file
+            log.debug("No thumbnail for %s: %s", sha256, e)
+            self.failures += 1
+            return None
+        METRICS.observe("thumbnails.generate", time.perf_counter() - start)
+        self.generated += 1
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, 'wb') as out:
+                thumbnail.save(out, format='PNG')
+            os.replace(temp_path, path)
+        except OSError as e:
+            log.warning("Could not cache thumbnail %s: %s", path, e)
+        return thumbnail
@@ -1,16 +1,470 @@
 import tkinter as tk
+import tkinter.font as tkfont
+import logging
+import os
 import threading
+import time
+from collections import deque
+from datetime import datetime
 from tkinter import ttk
-from tkcalendar import DateEntry
-from PIL import Image, ImageDraw
-from pystray import Icon, MenuItem, Menu
 from html import escape
-from bs4 import BeautifulSoup
+from functools import partial
+
+import Span_Codec
+from DB_Worker import DB_Worker
+from Thumbnail_Cache import Thumbnail_Cache, THUMBNAIL_SIZE
+from Startup_Profiler import Startup_Profiler
+
+log = logging.getLogger(__name__)
+
+# Pause after the last keystroke before the search box queries the index
+SEARCH_DELAY_MS = 250
+SEARCH_LIMIT = 200
+
+# Notes fetched per page, and how far down the list the next page is requested
+NOTES_PAGE_SIZE = 200
+PAGE_PREFETCH_AT = 0.9
+
+# Key-to-render budget for typing, one frame at 60 Hz
+KEY_LATENCY_TARGET_MS = 16
+
+# Display-only tag for text that is both bold and italic; never saved
+BOLD_ITALIC = "bold_italic"
+
+# Opening a note inserts about a screenful at once, then streams the rest in
+# chunks between Tk events
+FIRST_CHUNK_CHARS = 8000
+CHUNK_CHARS = 64000
+
+# Timeline rows are fixed height so any row's position is known without drawing it.
+# While the window is open it checks for changes every second and moves its
+# window forward every minute
+TIMELINE_ROW_HEIGHT = 22
+TIMELINE_POLL_MS = 1000
+TIMELINE_ADVANCE_MS = 60000
+
+# Attachments sit in a strip of fixed-width cells under the editor; only the
+# cells on screen, plus this many on each side, have thumbnails requested
+ATTACHMENT_CELL_WIDTH = THUMBNAIL_SIZE + 24
+ATTACHMENT_PREFETCH_CELLS = 4
+
+# Repeat choices in the reminder window and the recurrence rules they store
+REPEAT_RULES = {
+    "Daily": "FREQ=DAILY",
+    "Weekdays": "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR",
+    "Weekly": "FREQ=WEEKLY",
+    "Every 2 weeks": "FREQ=WEEKLY;INTERVAL=2",
+    "Monthly": "FREQ=MONTHLY",
+    "Hourly": "FREQ=HOURLY"
+}
+
+
+class Text_Formatter:
+    """Rich-text styling for a Text widget.
+
+    Style tags are configured once with cached Font objects. Typed characters
+    are inserted together with the active style tags in a single insert call,
+    and Tk merges them into the neighbouring range instead of adding a new one.
+    """
+
+    def __init__(self, text, family="Helvetica", size=12):
+        self.text = text
+        self.active = set()
+        self.fonts = {
+            "bold": tkfont.Font(text, family=family, size=size, weight="bold"),
+            "italic": tkfont.Font(text, family=family, size=size, slant="italic"),
+            BOLD_ITALIC: tkfont.Font(text, family=family, size=size, weight="bold", slant="italic"),
+        }
+        text.tag_configure("bold", font=self.fonts["bold"])
+        text.tag_configure("italic", font=self.fonts["italic"])
+        # Underline is a tag option rather than a font, so it combines with the others
+        text.tag_configure("underline", underline=True)
+        text.tag_configure(BOLD_ITALIC, font=self.fonts[BOLD_ITALIC])
+        text.tag_raise(BOLD_ITALIC)
+
+        # Recent key-to-render latencies in seconds
+        self.latencies = deque(maxlen=1000)
+
+        # State of a note being streamed into the widget
+        self.stream_content = None
+        self.stream_runs = None
+        self.stream_pending = None
+        self.stream_after_id = None
+
+        # Widget bindings run before the Text class binding that inserts the key
+        text.bind("<KeyPress>", self.on_key)
+
+    def set_active(self, tag_name, on):
+        if on:
+            self.active.add(tag_name)
+        else:
+            self.active.discard(tag_name)
+
+    def active_tags(self):
+        tags = tuple(self.active)
+        if "bold" in self.active and "italic" in self.active:
+            tags += (BOLD_ITALIC,)
+        return tags
+
+    def on_key(self, event):
+        """Insert printable keys ourselves while a style is active so they carry its tags."""
+        char = event.char
+        # Leave shortcuts (Control held) and non-printing keys to the default bindings
+        if not self.active or event.state & 0x4 or not char or not (char.isprintable() or char == "\t"):
+            return None
+        self.type_char(char)
+        return "break"
+
+    def type_char(self, char):
+        started = time.perf_counter()
+        text = self.text
+        if text.tag_ranges("sel"):
+            text.delete("sel.first", "sel.last")
+        text.insert("insert", char, self.active_tags())
+        text.see("insert")
+        # Idle callbacks run after Tk's pending redisplay, so this measures key to render
+        text.after_idle(self._record_latency, started)
+
+    def _record_latency(self, started):
+        self.latencies.append(time.perf_counter() - started)
+
+    def latency_stats(self):
+        """p50/p99/max key-to-render latency in milliseconds over recent keystrokes."""
+        values = sorted(self.latencies)
+        if not values:
+            return None
+        return {
+            "samples": len(values),
+            "p50_ms": values[len(values) // 2] * 1000,
+            "p99_ms": values[min(len(values) - 1, int(len(values) * 0.99))] * 1000,
+            "max_ms": values[-1] * 1000,
+            "target_ms": KEY_LATENCY_TARGET_MS
+        }
+
+    def apply_tags(self, content, tag_data):
+        """Tag freshly inserted content, one tag_add call per style."""
+        starts = Span_Codec.line_starts(content)
+        for tag_name, name_spans in self._spans(tag_data).items():
+            indexes = []
+            for start, end in name_spans:
+                indexes.append(Span_Codec.offset_to_index(starts, start))
+                indexes.append(Span_Codec.offset_to_index(starts, end))
+            if indexes:
+                self.text.tag_add(tag_name, *indexes)
+
+    def stream(self, content, tag_data):
+        """Load a note progressively: the first screenful now, the rest in chunks via after().
+
+        Each chunk is a single interleaved insert(index, chars, tags, chars, tags, ...)
+        call, so formatting arrives with the text. The widget is read-only
+        until the last chunk lands.
+        """
+        self.cancel_stream()
+        self.stream_content = content
+        self.stream_runs = Span_Codec.segments(self._spans(tag_data), len(content))
+        self.stream_pending = None
+        self.text.configure(state="disabled")
+        self._stream_chunk(FIRST_CHUNK_CHARS)
+
+    def cancel_stream(self):
+        """Stop loading the current note, e.g. because another one was selected."""
+        if self.stream_after_id is not None:
+            self.text.after_cancel(self.stream_after_id)
+            self.stream_after_id = None
+        self.stream_content = self.stream_runs = self.stream_pending = None
+        self.text.configure(state="normal")
+
+    def finish_stream(self):
+        """Insert whatever is left of a streaming note right away."""
+        if self.stream_content is None:
+            return
+        if self.stream_after_id is not None:
+            self.text.after_cancel(self.stream_after_id)
+            self.stream_after_id = None
+        self._stream_chunk(len(self.stream_content))
+
+    def _stream_chunk(self, budget):
+        self.stream_after_id = None
+        content = self.stream_content
+        args = []
+        exhausted = False
+        while budget > 0:
+            run = self.stream_pending or next(self.stream_runs, None)
+            if run is None:
+                exhausted = True
+                break
+            start, end, tags = run
+            take = min(end - start, budget)
+            args.append(content[start:start + take])
+            args.append(tags)
+            self.stream_pending = (start + take, end, tags) if take < end - start else None
+            budget -= take
+
+        self.text.configure(state="normal")
+        if args:
+            self.text.insert("end", *args)
+
+        if exhausted:
+            self.stream_content = self.stream_runs = None
+        else:
+            self.text.configure(state="disabled")
+            self.stream_after_id = self.text.after(1, self._stream_chunk, CHUNK_CHARS)
+
+    def _spans(self, tag_data):
+        spans = {}
+        for tag in tag_data:
+            spans.setdefault(tag["tag_name"], []).append((tag["start"], tag["end"]))
+        if "bold" in spans and "italic" in spans:
+            spans[BOLD_ITALIC] = Span_Codec.intersect(sorted(spans["bold"]), sorted(spans["italic"]))
+        return spans
+
+    def refresh_combined(self):
+        """Recompute the bold+italic display tag after bold or italic changed on a selection."""
+        text = self.text
+        text.tag_remove(BOLD_ITALIC, "1.0", "end")
+        bold = self._offset_ranges("bold")
+        italic = self._offset_ranges("italic")
+        for start, end in Span_Codec.intersect(bold, italic):
+            text.tag_add(BOLD_ITALIC, f"1.0 + {start} chars", f"1.0 + {end} chars")
+
+    def _offset_ranges(self, tag_name):
+        ranges = self.text.tag_ranges(tag_name)
+        offsets = [self.text.count("1.0", index, "chars") for index in ranges]
+        offsets = [(count[0] if count else 0) for count in offsets]
+        return list(zip(offsets[0::2], offsets[1::2]))
+
+
+class Timeline_View:
+    """Scrollable list of an Occurrence_Index that only draws the rows on screen.
+
+    The canvas holds one pool of text items per visible row; scrolling moves
+    `first` and rewrites those items from index.rows(), so the cost of a
+    redraw depends on the window height, not on how many occurrences there
+    are. The scrollbar is driven by hand from first / len(index).
+    """
+
+    def __init__(self, parent, index):
+        self.index = index
+        self.frame = ttk.Frame(parent)
+        self.canvas = tk.Canvas(self.frame, background="#ffffff", highlightthickness=0)
+        self.scrollbar = ttk.Scrollbar(self.frame, command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.first = 0
+        # (when item, title item) per visible row
+        self.pool = []
+        self.version = None
+        self.empty_item = self.canvas.create_text(10, 10, anchor="nw", fill="#777777",
+                                                  text="No reminders in the coming weeks")
+
+        self.canvas.bind("<Configure>", self.on_resize)
+        # Windows and macOS report wheel deltas; X11 sends buttons 4 and 5
+        self.canvas.bind("<MouseWheel>", lambda event: self.scroll_by(-3 if event.delta > 0 else 3))
+        self.canvas.bind("<Button-4>", lambda event: self.scroll_by(-3))
+        self.canvas.bind("<Button-5>", lambda event: self.scroll_by(3))
+        for key, rows in (("<Up>", -1), ("<Down>", 1), ("<Prior>", -0.9), ("<Next>", 0.9)):
+            self.canvas.bind(key, lambda event, rows=rows: self.scroll_by(rows))
+        self.canvas.bind("<Home>", lambda event: self.scroll_to(0))
+        self.canvas.bind("<End>", lambda event: self.scroll_to(len(self.index)))
+        self.canvas.bind("<Button-1>", lambda event: self.canvas.focus_set())
+
+    def on_resize(self, event):
+        visible = event.height // TIMELINE_ROW_HEIGHT + 1
+        while len(self.pool) < visible:
+            y = len(self.pool) * TIMELINE_ROW_HEIGHT + 3
+            self.pool.append((self.canvas.create_text(10, y, anchor="nw", fill="#555555"),
+                              self.canvas.create_text(150, y, anchor="nw")))
+        while len(self.pool) > visible:
+            self.canvas.delete(*self.pool.pop())
+        self.redraw()
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * len(self.index)))
+        elif unit == "pages":
+            self.scroll_by(int(amount) * 0.9)
+        else:
+            self.scroll_by(int(amount))
+
+    def scroll_by(self, rows):
+        # Fractions are pages
+        if isinstance(rows, float):
+            rows = int(rows * max(len(self.pool) - 1, 1))
+        self.scroll_to(self.first + rows)
+
+    def scroll_to(self, first):
+        last_page = max(len(self.index) - (len(self.pool) - 1), 0)
+        first = min(max(first, 0), last_page)
+        if first != self.first:
+            self.first = first
+            self.redraw()
+
+    def refresh(self):
+        """Redraw if the index changed since the last draw."""
+        if self.index.version != self.version:
+            self.redraw()
+
+    def redraw(self):
+        self.version = self.index.version
+        total = len(self.index)
+        self.first = min(self.first, max(total - (len(self.pool) - 1), 0))
+        rows = self.index.rows(self.first, len(self.pool))
+
+        previous_day = None
+        for position, (when_item, title_item) in enumerate(self.pool):
+            if position < len(rows):
+                moment, reminder_id, title = rows[position]
+                # The date only starts each day's run of rows
+                day = moment.date()
+                label = moment.strftime("%a %d %b  %H:%M" if day != previous_day else "%H:%M")
+                previous_day = day
+                self.canvas.itemconfigure(when_item, text=label)
+                self.canvas.itemconfigure(title_item, text=title)
+            else:
+                self.canvas.itemconfigure(when_item, text="")
+                self.canvas.itemconfigure(title_item, text="")
+        self.canvas.itemconfigure(self.empty_item, state="normal" if not total else "hidden")
+
+        if total:
+            self.scrollbar.set(self.first / total, min((self.first + len(self.pool) - 1) / total, 1.0))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+
+class Attachment_Strip:
+    """A note's attachments as a horizontal row of thumbnails.
+
+    Cells sit at fixed offsets, so the cells on screen follow from the
+    scroll position and thumbnails are only requested for those. They are
+    made by the Thumbnail_Cache worker; the Tk thread just wraps each
+    finished one in a PhotoImage. Files that aren't images show their
+    extension instead.
+    """
+
+    def __init__(self, parent, thumbnails, before, on_save_as, on_remove):
+        self.thumbnails = thumbnails
+        self.before = before
+        self.on_save_as = on_save_as
+        self.on_remove = on_remove
+
+        self.frame = ttk.Frame(parent)
+        self.canvas = tk.Canvas(self.frame, height=THUMBNAIL_SIZE + 28, background="#ffffff",
+                                highlightthickness=0)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.HORIZONTAL, command=self.canvas.xview)
+        self.canvas.config(xscrollcommand=self.on_scroll)
+        self.canvas.pack(side=tk.TOP, fill=tk.X)
+        self.scrollbar.pack(side=tk.TOP, fill=tk.X)
+
+        self.note_id = None
+        self.attachments = []
+        # Positions in self.attachments whose thumbnail was asked for
+        self.requested = set()
+        # sha256 -> PhotoImage; Tk drops an image once Python holds no reference
+        self.photos = {}
+
+        self.canvas.bind("<Configure>", lambda event: self.request_visible())
+        self.canvas.bind("<Double-Button-1>", self.on_double_click)
+        self.canvas.bind("<Button-3>", self.on_menu)
+        self.canvas.bind("<Shift-MouseWheel>", lambda event: self.canvas.xview_scroll(-1 if event.delta > 0 else 1, "units"))
+        self.canvas.bind("<Button-4>", lambda event: self.canvas.xview_scroll(-1, "units"))
+        self.canvas.bind("<Button-5>", lambda event: self.canvas.xview_scroll(1, "units"))
+
+    def show(self, note_id, attachments):
+        """Replace the strip with `attachments` (see Notes_Handler.list_attachments); hidden when empty."""
+        self.note_id = note_id
+        self.attachments = attachments
+        self.requested.clear()
+        self.photos.clear()
+        self.canvas.delete("all")
+
+        if not attachments:
+            self.frame.pack_forget()
+            return
+        if not self.frame.winfo_ismapped():
+            self.frame.pack(fill=tk.X, padx=10, before=self.before)
+
+        for position, attachment in enumerate(attachments):
+            x = position * ATTACHMENT_CELL_WIDTH + 12
+            tag = f"cell{position}"
+            self.canvas.create_rectangle(x - 2, 4, x + THUMBNAIL_SIZE + 2, THUMBNAIL_SIZE + 8,
+                                         outline="#dddddd", fill="#f7f7f7", tags=(tag,))
+            extension = os.path.splitext(attachment['name'])[1].lstrip(".").upper() or "FILE"
+            self.canvas.create_text(x + THUMBNAIL_SIZE // 2, THUMBNAIL_SIZE // 2 + 6, text=extension,
+                                    fill="#999999", tags=(tag, f"placeholder{position}"))
+            self.canvas.create_text(x + THUMBNAIL_SIZE // 2, THUMBNAIL_SIZE + 18, text=attachment['name'],
+                                    width=THUMBNAIL_SIZE, tags=(tag,))
+        self.canvas.config(scrollregion=(0, 0, len(attachments) * ATTACHMENT_CELL_WIDTH, THUMBNAIL_SIZE + 28))
+        self.canvas.xview_moveto(0)
+        self.request_visible()
+
+    def clear(self):
+        self.show(None, [])
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.request_visible()
+
+    def request_visible(self):
+        if not self.attachments:
+            return
+        total = len(self.attachments)
+        first, last = self.canvas.xview()
+        start = max(int(first * total) - ATTACHMENT_PREFETCH_CELLS, 0)
+        end = min(int(last * total) + 1 + ATTACHMENT_PREFETCH_CELLS, total)
+        for position in range(start, end):
+            if position in self.requested:
+                continue
+            self.requested.add(position)
+            attachment = self.attachments[position]
+            if not (attachment['mime'] or "").startswith("image/"):
+                continue
+            self.thumbnails.request(attachment['sha256'], partial(self.on_thumbnail, self.note_id))
+
+    def on_thumbnail(self, note_id, sha256, image):
+        """Draw a finished thumbnail in every cell showing that blob, if the note is still shown."""
+        # A blob attached twice is answered once per request but drawn in one go
+        if image is None or note_id != self.note_id or sha256 in self.photos:
+            return
+        from PIL import ImageTk
+
+        photo = self.photos[sha256] = ImageTk.PhotoImage(image)
+        for position, attachment in enumerate(self.attachments):
+            if attachment['sha256'] != sha256:
+                continue
+            x = position * ATTACHMENT_CELL_WIDTH + 12
+            self.canvas.delete(f"placeholder{position}")
+            self.canvas.create_image(x + THUMBNAIL_SIZE // 2, THUMBNAIL_SIZE // 2 + 6, image=photo,
+                                     tags=(f"cell{position}",))
+
+    def attachment_at(self, event):
+        x = self.canvas.canvasx(event.x)
+        position = int(x // ATTACHMENT_CELL_WIDTH)
+        if 0 <= position < len(self.attachments):
+            return self.attachments[position]
+        return None
+
+    def on_double_click(self, event):
+        attachment = self.attachment_at(event)
+        if attachment is not None:
+            self.on_save_as(self.note_id, attachment)
+
+    def on_menu(self, event):
+        attachment = self.attachment_at(event)
+        if attachment is None:
+            return
+        menu = tk.Menu(self.canvas, tearoff=0)
+        menu.add_command(label="Save As...", command=partial(self.on_save_as, self.note_id, attachment))
+        menu.add_command(label="Remove", command=partial(self.on_remove, self.note_id, attachment))
+        menu.tk_popup(event.x_root, event.y_root)
+
 
 class NoteifyUI:
-    def __init__(self, root, reminder_handler, notes_handler):
+    def __init__(self, root, reminder_handler, notes_handler, profiler=None):
         self.reminder_handler = reminder_handler
         self.notes_handler = notes_handler
+        # A disabled profiler records nothing
+        self.profiler = profiler or Startup_Profiler()
         self.root = root
         self.root.title("Noteify")
         self.root.geometry("800x400")
@@ -36,15 +490,26 @@ class NoteifyUI:
         self.italic_on = False
         self.underline_on = False
 
+        # All SQLite work runs on DB_Worker threads; results come back via root.after
+        self.db = DB_Worker(notes_handler, post=self.post_to_ui)
+        self.thumbnails = Thumbnail_Cache(notes_handler.attachments, post=self.post_to_ui)
+        self.list_generation = 0
+        self.saved_selection = None
+        # The new note being written: holds its id once the first save has inserted it
+        self.new_draft = {'note_id': None}
+        # The note being fetched into the editor; saves wait until show_note has filled it
+        self.loading_note_id = None
+
         # Create the main layout
         self.create_main_layout()
 
         # Bind the window close event to minimize to tray
         self.root.protocol("WM_DELETE_WINDOW", self.hide_window)
 
-        # Create a system tray icon
+        # The system tray icon is created once the window has been drawn
         self.tray_icon = None
-        self.create_tray_icon()
+        self.first_paint_callbacks = []
+        self.root.bind("<Map>", self.on_first_map, add="+")
 
     def create_main_layout(self):
         """Create the main layout including the note list and text area."""
@@ -55,10 +520,26 @@ class NoteifyUI:
         tree_frame = ttk.Frame(main_frame, width=200)
         tree_frame.pack(side=tk.LEFT, fill=tk.Y)
 
+        # Create the search box; typing filters the tree view after a short pause
+        self.search_var = tk.StringVar()
+        self.search_after_id = None
+        search_entry = ttk.Entry(tree_frame, textvariable=self.search_var)
+        search_entry.pack(fill=tk.X, padx=5, pady=(5, 0))
+        self.search_var.trace_add("write", self.on_search_changed)
+
         # Create the tree view
         self.tree = ttk.Treeview(tree_frame, columns=("title",), show="tree", selectmode="browse")
         self.tree.heading("#0", text="Notes")
-        self.tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        # Scrolling near the bottom of the list pulls in the next page of notes
+        self.tree_scroll = ttk.Scrollbar(tree_frame, command=self.tree.yview)
+        self.tree_scroll.pack(side=tk.RIGHT, fill=tk.Y, pady=5)
+        self.tree.config(yscrollcommand=self.on_tree_scroll)
+        self.tree.pack(fill=tk.BOTH, expand=True, padx=(5, 0), pady=5)
+        self.notes_cursor = None
+        self.notes_exhausted = True
+        self.page_pending = False
+        self.search_active = False
 
         # Load notes into the tree view
         self.load_notes()
@@ -86,72 +567,241 @@ class NoteifyUI:
         save_button = ttk.Button(editor_frame, text="Save", command=self.save_note)
         save_button.pack(pady=10)
 
-        # Bind the text widget to detect changes and apply active formatting
-        self.text_area.bind("<KeyRelease>", self.apply_active_formatting)
+        # Thumbnails of the note's attachments, shown above the Save button when there are any
+        self.attachment_strip = Attachment_Strip(editor_frame, self.thumbnails, before=save_button,
+                                                 on_save_as=self.save_attachment_as,
+                                                 on_remove=self.remove_attachment)
+
+        # Styles are configured once; typed text picks up the active ones on insert
+        self.formatter = Text_Formatter(self.text_area)
 
         # Bind keyboard shortcuts
         self.root.bind('<Control-b>', lambda event: self.toggle_bold())
         self.root.bind('<Control-i>', lambda event: self.toggle_italic())
         self.root.bind('<Control-u>', lambda event: self.toggle_underline())
         self.root.bind('<Control-s>', lambda event: self.save_note())
+        self.root.bind('<Control-q>', lambda event: self.quit_app())
+        self.root.bind('<Control-t>', lambda event: self.open_timeline_window())
+
+    def after_first_paint(self, callback):
+        """Run `callback` once the main window has been mapped and drawn."""
+        if self.first_paint_callbacks is None:
+            self.root.after_idle(callback)
+        else:
+            self.first_paint_callbacks.append(callback)
+
+    def on_first_map(self, event):
+        if self.first_paint_callbacks is None:
+            return
+        callbacks, self.first_paint_callbacks = self.first_paint_callbacks, None
+        # Idle callbacks run after Tk's pending redraws, i.e. once the frame is on screen
+        for callback in callbacks:
+            self.root.after_idle(callback)
+
+    def start_tray_icon(self):
+        """Import PIL and pystray on a background thread, then create the tray icon on the Tk thread."""
+        def load():
+            try:
+                with self.profiler.phase("import tray modules"):
+                    import PIL.ImageDraw
+                    import pystray
+            except Exception as e:
+                # The app works without a tray icon; the startup report still has to come out
+                log.warning("No tray icon, could not load its modules: %s", e)
+                self.profiler.mark("tray icon failed")
+                self.profiler.complete("tray icon")
+                return
+            self.post_to_ui(self.create_tray_icon)
+
+        threading.Thread(target=load, name="TrayImport", daemon=True).start()
+
+    def post_to_ui(self, fn):
+        """Run `fn` on the Tk thread; called from DB_Worker threads."""
+        try:
+            self.root.after(0, fn)
+        except (RuntimeError, tk.TclError):
+            # The main loop has already exited
+            pass
 
     def load_notes(self):
-        """Load notes from the database and insert them into the tree view."""
+        """Reset the tree view and load the first page of notes; later pages load on scroll."""
         self.tree.delete(*self.tree.get_children())  # Clear existing items
+        self.search_active = False
+        self.list_generation += 1
+
+        # Add a button to create a new note
+        self.tree.insert("", "end", iid="new", text="[New Note]", values=("[New Note]",))
 
-        notes = self.notes_handler.fetch_notes()
+        self.notes_cursor = None
+        self.notes_exhausted = False
+        self.load_next_page()
+
+    def load_next_page(self):
+        """Request the next page of notes, continuing from the last loaded (updated_at, id)."""
+        if self.notes_exhausted or self.search_active:
+            return
+        self.page_pending = True
+        self.db.read(self.notes_handler.fetch_notes_page, self.notes_cursor, NOTES_PAGE_SIZE,
+                     callback=partial(self.on_page_loaded, self.list_generation))
+
+    def on_page_loaded(self, generation, notes):
+        """Append a fetched page unless the list was reset or filtered meanwhile."""
+        if generation != self.list_generation:
+            return
+        self.page_pending = False
+
+        for note_id, title, updated_at in notes:
+            # Notes saved during this session are already at the top
+            if not self.tree.exists(note_id):
+                self.tree.insert("", "end", iid=note_id, text=title, values=(title,))
+
+        if len(notes) < NOTES_PAGE_SIZE:
+            self.notes_exhausted = True
+        else:
+            self.notes_cursor = (notes[-1][2], notes[-1][0])
 
-        for note in notes:
-            print(note)
-            self.tree.insert("", "end", iid=note[0], text=note[1], values=(note[1],))
+        self.profiler.complete("note list")
 
-        # Add a button to create a new note
+    def on_tree_scroll(self, first, last):
+        """Track the tree scrollbar and fetch another page when the end comes into view."""
+        self.tree_scroll.set(first, last)
+        if float(last) >= PAGE_PREFETCH_AT and not self.notes_exhausted and not self.page_pending:
+            self.load_next_page()
+
+    def place_note(self, note_id, title):
+        """Move a just-saved note to the top of the list (below [New Note]), inserting it if new."""
+        if self.tree.exists(note_id):
+            self.tree.item(note_id, text=title, values=(title,))
+            self.tree.move(note_id, "", 1)
+        else:
+            self.tree.insert("", 1, iid=note_id, text=title, values=(title,))
+
+    def on_search_changed(self, *args):
+        """Debounce the search box so the index is queried once typing pauses."""
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(SEARCH_DELAY_MS, self.run_search)
+
+    def run_search(self):
+        """Filter the tree view to the notes matching the search box."""
+        self.search_after_id = None
+        query = self.search_var.get().strip()
+        if not query:
+            self.load_notes()
+            return
+
+        # Stop any in-flight page from landing in the filtered list
+        self.search_active = True
+        self.list_generation += 1
+        self.db.read(self.notes_handler.search, query, SEARCH_LIMIT,
+                     callback=partial(self.show_search_results, query))
+
+    def show_search_results(self, query, results):
+        """Show search results if the search box still holds the query they are for."""
+        if query != self.search_var.get().strip():
+            return
+
+        self.tree.delete(*self.tree.get_children())
         self.tree.insert("", "end", iid="new", text="[New Note]", values=("[New Note]",))
+        for note_id, title, snippet in results:
+            self.tree.insert("", "end", iid=note_id, text=title, values=(snippet,))
 
     def on_note_select(self, event):
-        """Load the selected note's content and its tags into the text area."""
+        """Request the selected note; show_note fills the text area when it arrives."""
         selected_items = self.tree.selection()
 
         if selected_items:
             selected_item = selected_items[0]
 
             if selected_item == "new":
+                self.formatter.cancel_stream()
+                self.loading_note_id = None
+                self.text_area.config(state=tk.NORMAL)
                 self.text_area.delete("1.0", tk.END)
+                self.attachment_strip.clear()
+                self.new_draft = {'note_id': None}
             else:
                 note_id = int(selected_item)
-                print("Getting note id: ", note_id)
-                
-                # Fetch the note and its tags
-                note_data, tag_data = self.notes_handler.get_note_by_id(note_id)
-                print("Note: ", note_data)
-                print("Tags: ", tag_data)
-                
-                if note_data:
-                    self.text_area.delete("1.0", tk.END)
-                    
-                    # Insert the note content into the text area
-                    self.text_area.insert(tk.END, note_data["content"])
-                    
-                    # Reapply tags to the text
-                    for tag in tag_data:
-                        tag_name = tag["tag_name"]
-                        start_index = tag["start_index"]
-                        end_index = tag["end_index"]
-                        
-                        # Configure tags if needed
-                        if tag_name == "bold":
-                            self.text_area.tag_configure(tag_name, font=("Helvetica", 12, "bold"))
-                        elif tag_name == "italic":
-                            self.text_area.tag_configure(tag_name, font=("Helvetica", 12, "italic"))
-                        elif tag_name == "underline":
-                            self.text_area.tag_configure(tag_name, font=("Helvetica", 12, "underline"))
-                        
-                        # Add the tag back to the text area
-                        self.text_area.tag_add(tag_name, start_index, end_index)
+
+                # Selecting a note we just created: the editor already holds it
+                if note_id == self.saved_selection:
+                    self.saved_selection = None
+                    return
+
+                # Stop streaming the previous note while this one is fetched, and
+                # empty the editor so the previous text can't be saved under this id
+                self.formatter.cancel_stream()
+                self.loading_note_id = note_id
+                self.text_area.delete("1.0", tk.END)
+                self.text_area.config(state=tk.DISABLED)
+                self.db.read(self.notes_handler.get_note_by_id, note_id,
+                             callback=partial(self.show_note, note_id))
+                self.load_attachments(note_id)
+
+                # Warm the cache with the notes above and below the selection
+                neighbours = [item for item in (self.tree.prev(selected_item), self.tree.next(selected_item))
+                              if item and item != "new"]
+                if neighbours:
+                    self.notes_handler.prefetch(int(item) for item in neighbours)
         else:
-            print("No item selected.")
+            log.debug("No item selected.")
+
+    def show_note(self, note_id, note):
+        """Load a fetched note's content and its tags into the text area."""
+        selected_items = self.tree.selection()
+        if not note or not selected_items or selected_items[0] != str(note_id):
+            # The user moved on before the note arrived
+            return
+
+        note_data, tag_data = note
+
+        if note_data:
+            self.formatter.cancel_stream()
+            self.loading_note_id = None
+            self.text_area.config(state=tk.NORMAL)
+            self.text_area.delete("1.0", tk.END)
+
+            # Show the first screenful now and stream the rest, formatting included
+            self.formatter.stream(note_data["content"] or "", tag_data)
+
+    def load_attachments(self, note_id):
+        self.db.read(self.notes_handler.list_attachments, note_id,
+                     callback=partial(self.show_attachments, note_id))
 
+    def show_attachments(self, note_id, attachments):
+        """Fill the attachment strip if the note is still selected."""
+        selected_items = self.tree.selection()
+        if not selected_items or selected_items[0] != str(note_id):
+            return
+        self.attachment_strip.show(note_id, attachments)
+
+    def attach_files(self):
+        """Ask for files and attach them to the selected note."""
+        from tkinter import filedialog, messagebox
+
+        selected_items = self.tree.selection()
+        if not selected_items or selected_items[0] == "new":
+            messagebox.showinfo("Attach", "Save the note before attaching files to it.", parent=self.root)
+            return
+        note_id = int(selected_items[0])
+
+        paths = filedialog.askopenfilenames(parent=self.root, title="Attach Files")
+        for path in paths:
+            # Hashing and copying a large file happens on the writer thread
+            self.db.write(self.notes_handler.attach_file, note_id, path,
+                          callback=lambda result, note_id=note_id: self.load_attachments(note_id))
 
+    def save_attachment_as(self, note_id, attachment):
+        from tkinter import filedialog
+
+        destination = filedialog.asksaveasfilename(parent=self.root, initialfile=attachment['name'])
+        if destination:
+            self.db.read(self.notes_handler.attachments.copy_to, attachment['sha256'], destination,
+                         callback=lambda result: log.info("Saved %s to %s", attachment['name'], destination))
+
+    def remove_attachment(self, note_id, attachment):
+        self.db.write(self.notes_handler.detach_file, note_id, attachment['position'],
+                      callback=lambda result: self.load_attachments(note_id))
 
     def create_formatting_toolbar(self, parent_frame):
         """Create a toolbar for text formatting options."""
@@ -170,22 +820,29 @@ class NoteifyUI:
         underline_btn = ttk.Button(toolbar, text="U", width=2, command=self.toggle_underline)
         underline_btn.pack(side=tk.LEFT, padx=5)
 
+        # Attach button
+        attach_btn = ttk.Button(toolbar, text="Attach...", command=self.attach_files)
+        attach_btn.pack(side=tk.LEFT, padx=5)
+
     def toggle_bold(self):
         """Toggle bold formatting on/off."""
         self.bold_on = not self.bold_on
-        self.toggle_tag("bold", ("Helvetica", 12, "bold"))
+        self.formatter.set_active("bold", self.bold_on)
+        self.toggle_tag("bold")
 
     def toggle_italic(self):
         """Toggle italic formatting on/off."""
         self.italic_on = not self.italic_on
-        self.toggle_tag("italic", ("Helvetica", 12, "italic"))
+        self.formatter.set_active("italic", self.italic_on)
+        self.toggle_tag("italic")
 
     def toggle_underline(self):
         """Toggle underline formatting on/off."""
         self.underline_on = not self.underline_on
-        self.toggle_tag("underline", ("Helvetica", 12, "underline"))
+        self.formatter.set_active("underline", self.underline_on)
+        self.toggle_tag("underline")
 
-    def toggle_tag(self, tag_name, font):
+    def toggle_tag(self, tag_name):
         """Toggle a text tag on the selected text."""
         try:
             start_index = self.text_area.index(tk.SEL_FIRST)
@@ -196,23 +853,11 @@ class NoteifyUI:
                 self.text_area.tag_remove(tag_name, start_index, end_index)
             else:
                 self.text_area.tag_add(tag_name, start_index, end_index)
-                self.text_area.tag_configure(tag_name, font=font)
+            if tag_name in ("bold", "italic"):
+                self.formatter.refresh_combined()
         except tk.TclError:
             pass
 
-    def apply_active_formatting(self, event=None):
-        """Apply active formatting to newly inserted text."""
-        current_index = self.text_area.index(tk.INSERT)
-        if self.bold_on:
-            self.text_area.tag_add("bold", current_index + "-1c", current_index)
-            self.text_area.tag_configure("bold", font=("Helvetica", 12, "bold"))
-        if self.italic_on:
-            self.text_area.tag_add("italic", current_index + "-1c", current_index)
-            self.text_area.tag_configure("italic", font=("Helvetica", 12, "italic"))
-        if self.underline_on:
-            self.text_area.tag_add("underline", current_index + "-1c", current_index)
-            self.text_area.tag_configure("underline", font=("Helvetica", 12, "underline"))
-
     def save_note(self):
         """Save the current note to the database."""
         selected_items = self.tree.selection()
@@ -221,37 +866,46 @@ class NoteifyUI:
             selected_item = selected_items[0]
             if selected_item == "new":
                 title = "Untitled Note"
+            elif self.loading_note_id == int(selected_item):
+                # The editor doesn't hold this note yet
+                log.debug("Note %s is still loading; not saving.", selected_item)
+                return
             else:
                 title = self.tree.item(selected_item, "text")
             
-            # Get the content from the Text widget
-            content = self.text_area.get("1.0", tk.END).strip()
+            # A note still streaming in must be complete before it's read back
+            self.formatter.finish_stream()
+
+            # Get the content from the Text widget. Leading whitespace is kept so
+            # formatting offsets still line up with the text.
+            content = self.text_area.get("1.0", "end-1c")
             
             tags = []
             for tag in self.text_area.tag_names():
                 tag_ranges = self.text_area.tag_ranges(tag)
                 for i in range(0, len(tag_ranges), 2):
-                    start_index = self.text_area.index(tag_ranges[i])
-                    end_index = self.text_area.index(tag_ranges[i+1])
+                    start_index = str(tag_ranges[i])
+                    end_index = str(tag_ranges[i+1])
                     tags.append({
                         "tag_name": tag,
                         "start_index": start_index,
                         "end_index": end_index
                     })
 
-            # Use the Notes_Handler to save the note
+            # Queue the save on the DB worker; repeated saves of the same note
+            # before it runs collapse into the latest one
             if selected_item == "new":
-                # Save the new note
-                self.notes_handler.save_note(title, content, tags)
+                # Save the new note; a save made while its INSERT is running updates it instead
+                draft = self.new_draft
+                self.db.write(self.write_new_note, draft, title, content, tags,
+                              key=("new", id(draft)), callback=partial(self.on_note_saved, None, title),
+                              errback=partial(self.on_save_failed, title))
             else:
                 # Update the existing note
                 note_id = int(selected_item)
-                self.notes_handler.update_note(note_id, title, content, tags)
-
-            print(f"Note saved: {title}")
-
-            # Refresh the notes list
-            self.load_notes()
+                self.db.write(self.notes_handler.update_note, note_id, title, content, tags,
+                              key=("note", note_id), callback=partial(self.on_note_saved, note_id, title),
+                              errback=partial(self.on_save_failed, title))
         else:
             # Handle the case for a new, unsaved note
             # title = "Untitled Note"
@@ -265,8 +919,48 @@ class NoteifyUI:
             # Refresh the notes list
             self.load_notes()
 
+    def write_new_note(self, draft, title, content, tags):
+        """Insert a new note, or update it if an earlier save of the same draft already did; returns its id.
+
+        Runs on the DB writer thread, which runs writes one at a time, so a
+        second save always sees the id the first one stored.
+        """
+        if draft['note_id'] is None:
+            draft['note_id'] = self.notes_handler.save_note(title, content, tags)
+        else:
+            self.notes_handler.update_note(draft['note_id'], title, content, tags)
+        return draft['note_id']
+
+    def on_save_failed(self, title, error):
+        from tkinter import messagebox
+
+        messagebox.showerror("Save failed", f"\"{title}\" could not be saved:\n{error}", parent=self.root)
+
+    def on_note_saved(self, note_id, title, result):
+        """Update the note list once a save has been committed."""
+        new_note = note_id is None
+        if new_note:
+            note_id = result
+        log.info("Note saved: %s", title)
+
+        # Update only the saved note's row, keeping any active search filter
+        if self.search_active:
+            self.run_search()
+        else:
+            self.place_note(note_id, title)
+
+        selected_items = self.tree.selection()
+        if new_note and self.tree.exists(note_id) and selected_items and selected_items[0] == "new" \
+                and self.new_draft['note_id'] == note_id:
+            # Later saves of this note should update it, not create another
+            self.saved_selection = note_id
+            self.tree.selection_set(note_id)
+
     def open_reminder_screen(self):
         """Open the reminder setting screen."""
+        # tkcalendar (and babel) are only needed once this window opens
+        from tkcalendar import DateEntry
+
         reminder_window = tk.Toplevel(self.root)
         reminder_window.title("Set Reminder")
         reminder_window.geometry("400x300")
@@ -312,11 +1006,16 @@ class NoteifyUI:
         self.ampm_combobox = ttk.Combobox(input_frame, textvariable=self.ampm_var, values=["AM", "PM"], width=5)
         self.ampm_combobox.grid(row=3, column=1, pady=5, padx=(130, 10), sticky="w")
 
-        # Recurring checkbox
+        # Recurring checkbox; the date becomes the first occurrence
         self.recurring_var = tk.BooleanVar()
         self.recurring_checkbox = ttk.Checkbutton(input_frame, text="Recurring", variable=self.recurring_var, command=self.toggle_date_entry)
         self.recurring_checkbox.grid(row=4, column=0, pady=5, padx=10, sticky="w")
 
+        self.repeat_var = tk.StringVar(value="Daily")
+        self.repeat_combobox = ttk.Combobox(input_frame, textvariable=self.repeat_var,
+                                            values=list(REPEAT_RULES), width=12, state=tk.DISABLED)
+        self.repeat_combobox.grid(row=4, column=1, pady=5, padx=10, sticky="w")
+
         # Set Reminder button
         set_button = ttk.Button(reminder_window, text="Set", command=self.set_reminder)
         set_button.pack(pady=10, padx=10)
@@ -325,11 +1024,11 @@ class NoteifyUI:
         input_frame.grid_columnconfigure(1, weight=1)
 
     def toggle_date_entry(self):
-        """Disable the date entry and simulate a cross-out effect if recurring is checked."""
+        """Enable the repeat choice if recurring is checked."""
         if self.recurring_var.get():
-            self.reminder_date_entry.config(state=tk.DISABLED, foreground='gray')  # Simulate cross-out by graying out
+            self.repeat_combobox.config(state="readonly")
         else:
-            self.reminder_date_entry.config(state=tk.NORMAL, foreground='black')
+            self.repeat_combobox.config(state=tk.DISABLED)
 
     def set_reminder(self):
         """Set the reminder using the reminder handler."""
@@ -349,41 +1048,116 @@ class NoteifyUI:
 
         recurring = self.recurring_var.get()
 
-        # If recurring is selected, ignore the date
-        if recurring:
-            date = None
+        # Recurring reminders start on the chosen date and repeat by their rule
+        rule = REPEAT_RULES.get(self.repeat_var.get()) if recurring else None
 
-        print(date)
         reminder = {
             "title": title,
             "message": message,
             "date": date,
             "time": time,
-            "recurring": recurring
+            "recurring": recurring,
+            "rule": rule
         }
 
-        # Here you would use the reminder handler to save the reminder
-        self.reminder_handler.create_reminder(reminder)
-        print(f"Reminder set: {reminder}")
+        from tkinter import messagebox
+        from Daemon import Daemon_Error
+
+        # Rejected by validation, by the daemon, or the daemon is gone (OSError)
+        try:
+            self.reminder_handler.create_reminder(reminder)
+        except (ValueError, Daemon_Error, OSError) as e:
+            log.warning("Reminder not set: %s", e)
+            messagebox.showerror("Reminder not set", f"\"{title}\" could not be set:\n{e}", parent=self.root)
+            return
+        log.info("Reminder set: %s", reminder)
 
     # The rest of your methods for the tray icon and background tasks...
 
+    def handle_launch_request(self, request):
+        """Act on a request from a later launch (see Single_Instance); runs on the Tk thread."""
+        self.show_window(None, None)
+        command = request['command']
+        if command == 'new_reminder':
+            self.open_reminder_screen()
+        elif command == 'open_note':
+            self.open_note(int(request['note_id']))
+
+    def open_note(self, note_id):
+        """Select a note by id, adding it to the list first if its page hasn't been loaded."""
+        def select(note):
+            if not note:
+                log.warning("No note %s to open", note_id)
+                return
+            if not self.tree.exists(note_id):
+                # Just below [New Note], like a freshly saved note
+                self.tree.insert("", 1, iid=note_id, text=note[0]['title'], values=(note[0]['title'],))
+            self.tree.selection_set(note_id)
+            self.tree.see(note_id)
+
+        self.db.read(self.notes_handler.get_note_by_id, note_id, callback=select)
+
+    def open_timeline_window(self):
+        """Show reminder occurrences over the coming weeks, soonest first."""
+        timeline = self.reminder_handler.timeline()
+        window = tk.Toplevel(self.root)
+        window.title(f"Upcoming Reminders ({timeline.horizon.days} days)")
+        window.geometry("420x500")
+        view = Timeline_View(window, timeline)
+        view.frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        view.canvas.focus_set()
+
+        # Only runs while the window is open
+        def poll(elapsed=0):
+            if not window.winfo_exists():
+                return
+            if elapsed >= TIMELINE_ADVANCE_MS:
+                timeline.advance(datetime.now())
+                elapsed = 0
+            view.refresh()
+            window.after(TIMELINE_POLL_MS, poll, elapsed + TIMELINE_POLL_MS)
+
+        window.after(TIMELINE_POLL_MS, poll)
+
     def hide_window(self):
         """Hide the main window and show the tray icon."""
+        if self.tray_icon is None:
+            # Without a tray icon a hidden window could never be shown or closed again
+            self.quit_app()
+            return
         self.root.withdraw()
         # self.tray_icon.visible = True
 
     def show_window(self, icon, item):
         """Show the main window and hide the tray icon."""
         self.root.deiconify()
+        self.root.lift()
+        self.root.focus_force()
         # self.tray_icon.visible = False
 
     def on_left_click(self, item):
-        self.root.deiconify()
+        # Called on the tray thread, like every tray callback
+        self.post_to_ui(self.root.deiconify)
         # self.tray_icon.visible = False
 
+    def tray_action(self, fn, *args):
+        """A pystray menu action that runs `fn(*args)` on the Tk thread; Tk must never be called from the tray thread."""
+        return lambda icon, item: self.post_to_ui(partial(fn, *args))
+
     def create_tray_icon(self):
         """Create a system tray icon with a menu."""
+        try:
+            self.build_tray_icon()
+        except Exception as e:
+            log.warning("No tray icon: %s", e)
+            self.profiler.mark("tray icon failed")
+        finally:
+            self.profiler.complete("tray icon")
+
+    def build_tray_icon(self):
+        from PIL import Image, ImageDraw
+        from pystray import Icon, MenuItem, Menu
+
         # Create a simple icon for the tray (a blank white image in this case)
         image = Image.new('RGB', (64, 64), color=(255, 255, 255))
         draw = ImageDraw.Draw(image)
@@ -391,22 +1165,44 @@ class NoteifyUI:
 
         # Create the menu for the tray icon
         menu = Menu(
-            MenuItem(text="Open", action=self.show_window, default=True),
-            MenuItem(text="Set Reminder", action=self.open_reminder_screen),
-            MenuItem(text="Exit", action=self.exit_app)
+            MenuItem(text="Open", action=self.tray_action(self.show_window, None, None), default=True),
+            MenuItem(text="Set Reminder", action=self.tray_action(self.open_reminder_screen)),
+            MenuItem(text="Upcoming Reminders", action=self.tray_action(self.open_timeline_window)),
+            MenuItem(text="Exit", action=self.tray_action(self.quit_app))
         )
 
-        # Create the tray icon
-        self.tray_icon = Icon(name="Noteify", 
-                              icon=image, 
-                              title="Noteify", 
-                              menu=menu)
+        # Create the tray icon; kept only once it is running, so hide_window
+        # never withdraws the window behind an icon that isn't there
+        icon = Icon(name="Noteify", 
+                    icon=image, 
+                    title="Noteify", 
+                    menu=menu)
 
-        self.tray_icon.run_detached(self.on_left_click)
-        self.tray_icon.visible = True
+        icon.run_detached(self.on_left_click)
+        icon.visible = True
+        self.tray_icon = icon
 
 
-    def exit_app(self, icon, item):
-        """Exit the application."""
-        self.tray_icon.stop()
+    def quit_app(self):
+        """Leave mainloop; main() then shuts everything down in order."""
         self.root.quit()
+
+    def close(self, timeout=None):
+        """Stop the tray icon and thumbnail worker, finish queued note writes and close the notes database.
+
+        Returns False if the writes did not drain within `timeout`.
+        """
+        if self.tray_icon is not None:
+            self.tray_icon.stop()
+            self.tray_icon = None
+        # At most one thumbnail in progress; the rest of the time goes to the writes
+        started = time.monotonic()
+        self.thumbnails.close(timeout)
+        if timeout is not None:
+            timeout = max(timeout - (time.monotonic() - started), 0.0)
+        drained = self.db.close(timeout)
+        try:
+            self.root.destroy()
+        except tk.TclError:
+            pass
+        return drained
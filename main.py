@@ -1,39 +1,153 @@
-import tkinter as tk
-import threading
+import sys
 import time
 
-from datetime import datetime
+# Taken before anything heavy is imported so the startup profile covers it
+START = time.perf_counter()
 
-import time
+import argparse
+import logging
+import threading
+from functools import partial
+
+import Single_Instance
+from Lifecycle import Lifecycle
+from Metrics import METRICS
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="Noteify")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print per-phase startup timings and import costs to stderr")
+    parser.add_argument("--profile-output", help="also write the startup profile as JSON to this file")
+    parser.add_argument("--daemon", action="store_true",
+                        help="run only the reminder scheduler, headless, with a control socket (see Daemon.py)")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="collect performance metrics and write a JSON snapshot to PATH periodically")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, help="seconds between metrics snapshots")
+    # Handed to the running instance if there is one
+    launch = parser.add_mutually_exclusive_group()
+    launch.add_argument("--new-reminder", action="store_true", help="open the new reminder window")
+    launch.add_argument("--open-note", type=int, metavar="ID", help="open the note with this id")
+    return parser.parse_args(argv)
+
+
+def launch_request(args):
+    if args.new_reminder:
+        return {'command': 'new_reminder'}
+    if args.open_note is not None:
+        return {'command': 'open_note', 'note_id': args.open_note}
+    return {'command': 'show'}
+
+
+def configure(args, lifecycle):
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.metrics:
+        METRICS.enable()
+        METRICS.start_exporter(args.metrics, args.metrics_interval)
+
+        def stop_metrics(timeout):
+            # Last step, so the final snapshot includes the shutdown timings
+            METRICS.stop_exporter(args.metrics)
+
+        lifecycle.on_shutdown("metrics", stop_metrics)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    lifecycle = Lifecycle()
+    configure(args, lifecycle)
+
+    if args.daemon:
+        # Checked before anything GUI-related is imported
+        from Daemon import run_daemon
+        return run_daemon(lifecycle=lifecycle)
+
+    # Before tkinter is even imported: a running instance takes the request
+    # and this process exits straight away
+    request = launch_request(args)
+    try:
+        instance = Single_Instance.acquire_or_forward(request)
+    except Single_Instance.Instance_Error as e:
+        logging.error("%s", e)
+        return 1
+    if instance is None:
+        return 0
+    lifecycle.on_shutdown("instance lock", instance.release)
+
+    # importlib.abc costs ~25 ms, which launches handed off above never pay
+    from Startup_Profiler import Startup_Profiler
+    profiler = Startup_Profiler(enabled=args.profile_startup, start=START, output=args.profile_output)
+    profiler.install_import_timer()
+    profiler.expect("first paint", "tray icon", "note list", "load reminders")
+
+    with profiler.phase("import tkinter"):
+        import tkinter as tk
+
+    with profiler.phase("import app modules"):
+        import Daemon
+        from Reminder_Handler import Reminder_Handler
+        from Notes_Handler import Notes_Handler
+        from UI import NoteifyUI
+
+    with profiler.phase("open databases"):
+        # A running daemon owns the reminders; the GUI just forwards to it
+        daemon = Daemon.connect()
+        if daemon is not None:
+            reminder_handler = Daemon.Remote_Reminder_Handler(daemon)
+        else:
+            reminder_handler = Reminder_Handler("Data/reminders.db", legacy_path="Data/Reminders.json")
+        notes_handler = Notes_Handler("Data/notes.db")
+    lifecycle.on_shutdown("reminders", reminder_handler.close)
+
+    # Reminders load while the window is being built
+    def load_reminders():
+        with profiler.phase("load reminders"):
+            reminder_handler.load_reminders()
+        # The scheduler thread sleeps until the next reminder is due; don't
+        # start it if the app was closed while reminders were loading
+        if reminder_handler.scheduler is not None and not lifecycle.stopping.is_set():
+            reminder_handler.scheduler.start()
+        profiler.complete("load reminders")
 
-from Reminder_Handler import Reminder_Handler
-from Notes_Handler import Notes_Handler
-from UI import NoteifyUI
+    threading.Thread(target=load_reminders, name="LoadReminders", daemon=True).start()
 
-def background_task():
-    while True:
-        print("Running...")
-        reminder_handler.check_reminders()
-        time.sleep(10)
+    with profiler.phase("create window"):
+        root = tk.Tk()
+        app = NoteifyUI(root, reminder_handler, notes_handler, profiler=profiler)
+    # Stops the tray icon, drains note writes and closes the notes database
+    lifecycle.on_shutdown("ui", app.close)
+    lifecycle.install_signal_handlers(app.quit_app)
+    # Runs before "ui", so launches during shutdown wait for the lock instead of being dropped
+    lifecycle.on_shutdown("instance server", instance.stop_listening)
+    # Later launches' requests, and this launch's own, are run on the Tk thread
+    def handle_request(request):
+        app.post_to_ui(partial(app.handle_launch_request, request))
 
-def start_app():
-    # Create a daemon thread
-    return True
-    
+    instance.set_handler(handle_request)
+    if request['command'] != 'show':
+        handle_request(request)
 
-reminder_handler = Reminder_Handler("Data/Reminders.json")
-notes_handler = Notes_Handler("Data/notes.db")
+    if METRICS.enabled:
+        from Metrics import Stall_Watchdog
+        METRICS.instrument_tk(tk)
+        watchdog = Stall_Watchdog(root, METRICS)
+        watchdog.start()
+        lifecycle.on_shutdown("stall watchdog", lambda timeout: watchdog.stop())
 
-reminder_handler.load_reminders() 
+    def on_first_paint():
+        profiler.mark("first paint")
+        profiler.complete("first paint")
+        # The tray icon only needs to exist once the window is already visible
+        app.start_tray_icon()
 
-background_thread = threading.Thread(target=background_task, daemon=True)
-background_thread.start()
-root = tk.Tk()
-app = NoteifyUI(root, reminder_handler, notes_handler)
-root.mainloop()
+    app.after_first_paint(on_first_paint)
+    try:
+        root.mainloop()
+    finally:
+        lifecycle.shutdown()
+    return 0
 
-reminder_handler.save_reminders()
 
-while True:
-    print("TEST!")
-    time.sleep(1)
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())